@@ -0,0 +1,78 @@
+class RoomStateBackend:
+    """
+    Interfaz del almacén de estado compartido de las salas.
+
+    Guarda qué salas existen, sus miembros (en orden de llegada), el líder y el estado
+    de la partida, y reparte eventos entre procesos para que cualquier worker pueda
+    servir cualquier código de sala. Cada worker solo mantiene en memoria los
+    websockets de sus propias conexiones.
+    """
+
+    # True si el backend comparte estado entre procesos
+    distributed = False
+
+    async def start(self, on_event):
+        """
+        Arranca el backend. on_event(codigo_sala, evento) se llama con cada evento
+        publicado por otros workers en las salas suscritas.
+        """
+        self.on_event = on_event
+
+    async def close(self):
+        pass
+
+    async def refresh(self, codes):
+        """
+        Renueva el alquiler de las salas que este worker tiene en memoria. Lo llama el
+        reaper periódicamente: las salas que ningún worker renueva (p. ej. porque todos
+        los que las tenían se cayeron) caducan solas y su código vuelve a quedar libre.
+        """
+        pass
+
+    async def claim_room(self, code: str) -> bool:
+        """
+        Reserva un código de sala de forma atómica. Devuelve False si ya existía.
+        """
+        raise NotImplementedError
+
+    async def room_exists(self, code: str) -> bool:
+        raise NotImplementedError
+
+    async def delete_room(self, code: str):
+        raise NotImplementedError
+
+    async def add_member(self, code: str, username: str):
+        raise NotImplementedError
+
+    async def remove_member(self, code: str, username: str):
+        raise NotImplementedError
+
+    async def members(self, code: str) -> list:
+        raise NotImplementedError
+
+    async def set_leader(self, code: str, username: str):
+        raise NotImplementedError
+
+    async def get_leader(self, code: str):
+        raise NotImplementedError
+
+    async def save_game(self, code: str, state: dict):
+        raise NotImplementedError
+
+    async def load_game(self, code: str):
+        raise NotImplementedError
+
+    async def delete_game(self, code: str):
+        raise NotImplementedError
+
+    async def publish(self, code: str, event: dict):
+        """
+        Envía un evento al resto de workers suscritos a la sala.
+        """
+        raise NotImplementedError
+
+    async def subscribe(self, code: str):
+        raise NotImplementedError
+
+    async def unsubscribe(self, code: str):
+        raise NotImplementedError
@@ -0,0 +1,16 @@
+import os
+
+# Backend del estado de las salas: "memory" (un solo proceso) o "redis" (varios workers/nodos)
+ROOM_BACKEND = os.getenv("ROOM_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+def create_backend(kind: str = ROOM_BACKEND):
+    if kind == "memory":
+        from backends.memory import InMemoryBackend
+        return InMemoryBackend()
+    if kind == "redis":
+        # Importación perezosa: redis solo es necesario si se usa este backend
+        from backends.redis_backend import RedisBackend
+        return RedisBackend(REDIS_URL)
+    raise ValueError(f"Backend de salas desconocido: {kind}")
@@ -0,0 +1,68 @@
+from backends.base import RoomStateBackend
+
+
+class InMemoryBackend(RoomStateBackend):
+    """
+    Backend de un solo proceso. No hay otros workers, así que publicar eventos no hace nada.
+    """
+
+    def __init__(self):
+        self.rooms = {}  # {codigo_sala: {"leader": str, "members": [str], "game": dict}}
+
+    async def claim_room(self, code: str) -> bool:
+        if code in self.rooms:
+            return False
+        self.rooms[code] = {"leader": None, "members": [], "game": None}
+        return True
+
+    async def room_exists(self, code: str) -> bool:
+        return code in self.rooms
+
+    async def delete_room(self, code: str):
+        self.rooms.pop(code, None)
+
+    async def add_member(self, code: str, username: str):
+        room = self.rooms.get(code)
+        if room is not None:
+            room["members"].append(username)
+
+    async def remove_member(self, code: str, username: str):
+        room = self.rooms.get(code)
+        if room is not None and username in room["members"]:
+            room["members"].remove(username)
+
+    async def members(self, code: str) -> list:
+        room = self.rooms.get(code)
+        return list(room["members"]) if room is not None else []
+
+    async def set_leader(self, code: str, username: str):
+        room = self.rooms.get(code)
+        if room is not None:
+            room["leader"] = username
+
+    async def get_leader(self, code: str):
+        room = self.rooms.get(code)
+        return room["leader"] if room is not None else None
+
+    async def save_game(self, code: str, state: dict):
+        room = self.rooms.get(code)
+        if room is not None:
+            room["game"] = state
+
+    async def load_game(self, code: str):
+        room = self.rooms.get(code)
+        return room["game"] if room is not None else None
+
+    async def delete_game(self, code: str):
+        room = self.rooms.get(code)
+        if room is not None:
+            room["game"] = None
+
+    async def publish(self, code: str, event: dict):
+        pass
+
+    async def subscribe(self, code: str):
+        pass
+
+    async def unsubscribe(self, code: str):
+        pass
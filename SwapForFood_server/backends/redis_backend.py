@@ -0,0 +1,149 @@
+import os
+import asyncio
+import json
+import uuid
+import logging
+import redis.asyncio as aioredis
+from backends.base import RoomStateBackend
+
+logger = logging.getLogger(__name__)
+
+# Caducidad de las claves de cada sala (segundos). Los workers que tienen la sala la
+# renuevan desde el reaper (cada HEARTBEAT_INTERVAL), así que debe ser bastante mayor
+ROOM_LEASE_TTL = int(os.getenv("REDIS_ROOM_LEASE_TTL", "120"))
+
+
+class RedisBackend(RoomStateBackend):
+    """
+    Backend compartido sobre el protocolo Redis. Los miembros de cada sala se guardan
+    en una lista, el líder en un hash y la partida en una clave JSON. Los eventos entre
+    workers viajan por un canal pub/sub por sala. Todas las claves de una sala caducan
+    a los lease_ttl segundos si ningún worker la renueva (ver refresh).
+    """
+
+    distributed = True
+
+    def __init__(self, url: str = "redis://localhost:6379/0", prefix: str = "sff", client=None,
+                 lease_ttl: int = ROOM_LEASE_TTL):
+        self.redis = client or aioredis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.lease_ttl = lease_ttl
+        self.worker_id = uuid.uuid4().hex  # Para ignorar los eventos publicados por este mismo worker
+        self.pubsub = None
+        self.reader_task = None
+        self.on_event = None
+
+    def _room_key(self, code):
+        return f"{self.prefix}:room:{code}"
+
+    def _members_key(self, code):
+        return f"{self.prefix}:room:{code}:members"
+
+    def _game_key(self, code):
+        return f"{self.prefix}:room:{code}:game"
+
+    def _channel(self, code):
+        return f"{self.prefix}:room:{code}:events"
+
+    async def start(self, on_event):
+        self.on_event = on_event
+        self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        self.reader_task = asyncio.create_task(self._reader())
+
+    async def close(self):
+        if self.reader_task is not None:
+            self.reader_task.cancel()
+            self.reader_task = None
+        if self.pubsub is not None:
+            await self.pubsub.aclose()
+            self.pubsub = None
+        await self.redis.aclose()
+
+    async def _reader(self):
+        while True:
+            if not self.pubsub.subscribed:
+                await asyncio.sleep(0.05)
+                continue
+            message = await self.pubsub.get_message(timeout=1.0)
+            if message is None or message.get("type") != "message":
+                continue
+            try:
+                payload = json.loads(message["data"])
+            except (TypeError, ValueError):
+                logger.warning("Evento mal formado en %s: %r", message.get("channel"), message.get("data"))
+                continue
+            if payload.get("origin") == self.worker_id:
+                continue
+            try:
+                await self.on_event(payload["room"], payload["event"])
+            except Exception:
+                # Un evento erróneo no debe detener la lectura del canal
+                logger.exception("Error procesando el evento %r de la sala %s",
+                                 payload.get("event"), payload.get("room"))
+
+    async def refresh(self, codes):
+        if not codes:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for code in codes:
+                for key in (self._room_key(code), self._members_key(code), self._game_key(code)):
+                    pipe.expire(key, self.lease_ttl)
+            await pipe.execute()
+
+    async def claim_room(self, code: str) -> bool:
+        # La reserva y su caducidad van juntas: un worker que cae justo después no deja el código ocupado
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hsetnx(self._room_key(code), "owner", self.worker_id)
+            pipe.expire(self._room_key(code), self.lease_ttl)
+            claimed, _ = await pipe.execute()
+        return bool(claimed)
+
+    async def room_exists(self, code: str) -> bool:
+        return bool(await self.redis.exists(self._room_key(code)))
+
+    async def delete_room(self, code: str):
+        await self.redis.delete(self._room_key(code), self._members_key(code), self._game_key(code))
+
+    async def add_member(self, code: str, username: str):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(self._members_key(code), username)
+            pipe.expire(self._members_key(code), self.lease_ttl)
+            await pipe.execute()
+
+    async def remove_member(self, code: str, username: str):
+        await self.redis.lrem(self._members_key(code), 1, username)
+
+    async def members(self, code: str) -> list:
+        return await self.redis.lrange(self._members_key(code), 0, -1)
+
+    async def set_leader(self, code: str, username: str):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self._room_key(code), "leader", username)
+            pipe.expire(self._room_key(code), self.lease_ttl)
+            await pipe.execute()
+
+    async def get_leader(self, code: str):
+        return await self.redis.hget(self._room_key(code), "leader")
+
+    async def save_game(self, code: str, state: dict):
+        await self.redis.set(self._game_key(code), json.dumps(state), ex=self.lease_ttl)
+
+    async def load_game(self, code: str):
+        data = await self.redis.get(self._game_key(code))
+        return json.loads(data) if data else None
+
+    async def delete_game(self, code: str):
+        await self.redis.delete(self._game_key(code))
+
+    async def publish(self, code: str, event: dict):
+        await self.redis.publish(self._channel(code), json.dumps({
+            "origin": self.worker_id,
+            "room": code,
+            "event": event
+        }))
+
+    async def subscribe(self, code: str):
+        await self.pubsub.subscribe(self._channel(code))
+
+    async def unsubscribe(self, code: str):
+        await self.pubsub.unsubscribe(self._channel(code))
@@ -0,0 +1,118 @@
+"""
+Mide el coste de la analítica de partidas: votos por segundo con el sink desactivado
+y activado (el voto solo añade un evento al buffer en memoria), velocidad de escritura
+por lotes en SQLite, comportamiento con el buffer lleno (descartar o volcar a fichero)
+y tiempo de las consultas de like rate y latencia de decisión.
+
+Ejecutar desde SwapForFood_server/:
+    python -m benchmarks.bench_analytics_sink --games 2000
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+
+import models.game
+from benchmarks.bench_snapshot_restore import FakeWebSocket, drain
+from managers.room_manager import RoomManager
+from models.game import Game
+from utils.analytics import AnalyticsSink, like_rates, decision_latency
+from utils.metrics import ANALYTICS_EVENTS
+from utils.room_codes import RoomCodeAllocator
+from utils.timer_wheel import TimerWheel
+
+
+async def play(games, users, sink):
+    """
+    Juega partidas offline completas y devuelve (votos, segundos dedicados a votar).
+    """
+    models.game.analytics_sink = sink
+    manager = RoomManager(timers=TimerWheel(), room_codes=RoomCodeAllocator(cooldown=0))
+    votes = 0
+    elapsed = 0.0
+    for g in range(games):
+        response = await manager.join_room_with_prefix_0(FakeWebSocket(), "0user0")
+        code = response[4:9]
+        for n in range(1, users):
+            await manager.join_room_with_prefix_1(FakeWebSocket(), f"1{code}user{n}")
+        sala = manager.rooms[code]
+        game = sala.game = Game("40.4168,-3.7038", sala, offline=True, timers=manager.timers)
+        await game.start()
+        ballots = [(f"user{n}", "0" if (i + n + g) % 3 else "1", r.id)
+                   for i, r in enumerate(game.restaurants) for n in range(users)]
+        start = time.perf_counter()
+        for username, vote, restaurant_id in ballots:
+            await game.register_vote(username, vote, restaurant_id)
+        elapsed += time.perf_counter() - start
+        votes += len(ballots)
+        await drain(manager)
+        for user in sala.users:
+            user.stop()
+        await manager.remove_room(code)
+    return votes, elapsed
+
+
+def _count(db_path, table):
+    with sqlite3.connect(db_path) as db:
+        return db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+async def overflow(tmp, policy, events):
+    # Buffer pequeño y escritor parado: lo que no cabe se descarta o se vuelca
+    path = os.path.join(tmp, f"overflow_{policy}.db")
+    sink = AnalyticsSink(path, capacity=1000, batch_size=500, flush_interval=3600, overflow=policy)
+    await sink.start()
+    before = {r: ANALYTICS_EVENTS.values.get((("result", r),), 0) for r in ("dropped", "spilled")}
+    for i in range(events):
+        sink.emit("vote", "overflow", f"user{i % 4}", f"r{i % 50}", i % 2, i * 0.01)
+    # El volcado al fichero lo hace el escritor: se cuenta tras la última escritura
+    await sink.close()
+    after = {r: ANALYTICS_EVENTS.values.get((("result", r),), 0) - before[r] for r in before}
+    print(f"Desbordamiento ({policy}): {events} eventos, buffer de 1000 -> descartados {after['dropped']}, "
+          f"volcados {after['spilled']}, guardados {_count(path, 'votes')}")
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        disabled = AnalyticsSink("")
+        votes, elapsed = await play(args.games, args.users, disabled)
+        print(f"Sin analítica: {votes} votos, {elapsed / votes * 1e6:.2f} µs/voto")
+
+        path = os.path.join(tmp, "analytics.db")
+        # Buffer suficiente para todo y escritor sin arrancar: se mide solo el coste de emit()
+        sink = AnalyticsSink(path, capacity=args.games * 200, flush_interval=3600)
+        votes, elapsed = await play(args.games, args.users, sink)
+        print(f"Con analítica: {votes} votos, {elapsed / votes * 1e6:.2f} µs/voto "
+              f"({len(sink.ring)} eventos en el buffer)")
+
+        await sink.start()
+        pending = len(sink.ring)
+        start = time.perf_counter()
+        await sink.flush()
+        flush_time = time.perf_counter() - start
+        print(f"Escritura: {pending} eventos en {flush_time:.2f}s ({pending / flush_time:,.0f} eventos/s)")
+        await sink.close()
+
+        start = time.perf_counter()
+        rates = like_rates(path, limit=5)
+        print(f"like_rates: {(time.perf_counter() - start) * 1000:.1f} ms ->",
+              [(r["name"], round(r["like_rate"], 2)) for r in rates[:3]])
+        start = time.perf_counter()
+        latencies = decision_latency(path, limit=1000)
+        print(f"decision_latency: {(time.perf_counter() - start) * 1000:.1f} ms para {len(latencies)} partidas")
+
+        await overflow(tmp, "drop", 5000)
+        await overflow(tmp, "spill", 5000)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=4)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
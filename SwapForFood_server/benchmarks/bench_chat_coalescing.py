@@ -0,0 +1,81 @@
+"""
+Benchmark de chat: envíos por websocket (≈ syscalls) y CPU por mensaje en una sala
+con mucho tráfico, sin agrupación y con distintas ventanas de agrupación.
+
+Ejecutar desde SwapForFood_server/:
+    python -m benchmarks.bench_chat_coalescing
+"""
+import asyncio
+import time
+
+from managers.room_manager import RoomManager
+
+ROOM_SIZES = (10, 50)
+MESSAGES = 1000
+BURST = 4  # Mensajes que llegan seguidos antes de ceder el event loop
+BURST_INTERVAL = 0.002  # segundos entre ráfagas
+WINDOWS = (0.0, 0.002, 0.005)
+
+
+class _CountingWebSocket:
+    __slots__ = ("sends", "bytes_sent")
+
+    def __init__(self):
+        self.sends = 0
+        self.bytes_sent = 0
+
+    async def send_text(self, message: str):
+        self.sends += 1
+        self.bytes_sent += len(message.encode("utf-8"))
+
+    async def close(self):
+        pass
+
+
+async def _run(room_size: int, window: float):
+    manager = RoomManager(chat_window=window)
+    websockets = [_CountingWebSocket() for _ in range(room_size)]
+    await manager.join_room_with_prefix_0(websockets[0], "0user0")
+    code = manager.websocket_to_room[websockets[0]]
+    for i, ws in enumerate(websockets[1:], 1):
+        await manager.join_room_with_prefix_1(ws, f"1{code}user{i}")
+    await asyncio.sleep(0.01)
+    for ws in websockets:
+        ws.sends = 0
+        ws.bytes_sent = 0
+
+    sala = manager.rooms[code]
+    users = list(sala.users)
+
+    cpu_start = time.process_time()
+    for i in range(MESSAGES):
+        await manager.broadcast_chat_message(f"user{i % room_size}", f"mensaje {i}", websockets[i % room_size])
+        if (i + 1) % BURST == 0:
+            await asyncio.sleep(BURST_INTERVAL)
+    await sala.flush_chat()
+    # Esperar a que se vacíen las colas de envío
+    while any(not u.evicted and u.send_queue is not None and not u.send_queue.empty() for u in users):
+        await asyncio.sleep(0.001)
+    cpu = time.process_time() - cpu_start
+
+    for user in users:
+        user.stop()
+
+    sends = sum(ws.sends for ws in websockets)
+    sent_bytes = sum(ws.bytes_sent for ws in websockets)
+    # Clientes expulsados por no dar abasto (cola de envío llena)
+    evicted = sum(u.evicted for u in users)
+    return sends, sent_bytes, cpu, evicted
+
+
+async def main():
+    print(f"{'usuarios':>9}{'ventana ms':>12}{'envíos':>10}{'envíos/msg':>12}{'KB':>10}{'CPU us/msg':>12}{'expulsados':>12}")
+    for room_size in ROOM_SIZES:
+        for window in WINDOWS:
+            sends, sent_bytes, cpu, evicted = await _run(room_size, window)
+            print(f"{room_size:>9}{window * 1000:>12.0f}{sends:>10}{sends / MESSAGES:>12.2f}"
+                  f"{sent_bytes / 1024:>10.0f}{cpu / MESSAGES * 1e6:>12.1f}{evicted:>12}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+"""
+Mide la compresión de frames: bytes en el cable y CPU por broadcast para los
+mensajes típicos (chat, altas en la sala, lotes de restaurantes y resultados),
+en JSON y MessagePack y con varios niveles de zlib. Compara comprimir una vez
+por sala (Frame.wire) con comprimir para cada destinatario, que es lo que hace
+permessage-deflate en el transporte. Sirve para ajustar WS_COMPRESSION_MIN_BYTES
+y WS_COMPRESSION_LEVEL.
+
+Ejecutar desde SwapForFood_server/:
+    python -m benchmarks.bench_compression --recipients 8
+"""
+import argparse
+import random
+import string
+import time
+
+from models.restaurant import Restaurant
+from utils.frames import Frame, encode_frame, dumps_text, deflate_payload, inflate_payload
+
+LEVELS = (1, 6, 9)
+
+
+def _reference(rng):
+    # Las referencias de fotos de Places son cadenas aleatorias largas: apenas se comprimen
+    return "".join(rng.choice(string.ascii_letters + string.digits + "-_") for _ in range(rng.randint(180, 260)))
+
+
+def _restaurants(rng, count):
+    words = ("Casa", "Bar", "La", "El", "Taberna", "Pizzeria", "Sushi", "Burger", "Asador", "Cafe", "Marisqueria")
+    return [
+        Restaurant(
+            id="ChIJ" + "".join(rng.choice(string.ascii_letters + string.digits) for _ in range(23)),
+            name=" ".join(rng.choice(words) for _ in range(rng.randint(2, 4))),
+            rating=f"{rng.uniform(3, 5):.1f}",
+            distance=f"{rng.uniform(0.05, 5):.2f}",
+            photo_url=f"https://swapforfood.example.com/photos/{_reference(rng)}?w=400"
+        )
+        for _ in range(count)
+    ]
+
+
+def sample_frames(rng):
+    frames = {
+        "USER_JOINED": encode_frame("USER_JOINED.maria_garcia"),
+        "chat": encode_frame("NEW_MESSAGE.maria_garcia:¿Vamos al italiano o al japonés?"),
+    }
+    for count in (1, 2, 5, 20):
+        data = dumps_text([r.to_dict() for r in _restaurants(rng, count)])
+        frames[f"NEW_RESTAURANT x{count}"] = encode_frame(f"NEW_RESTAURANT.{data}", id=count)
+    results = {r.name: [f"user{n}" for n in range(8) if rng.random() < 0.5] for r in _restaurants(rng, 20)}
+    frames["GAME_RESULTS x20"] = encode_frame(f"GAME_RESULTS.{results}")
+    return frames
+
+
+def _cpu(func, payload, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(payload)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipients", type=int, default=8, help="Destinatarios por broadcast")
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    print(f"{'frame':<20} {'formato':<8} {'bytes':>7} " +
+          " ".join(f"{'nivel ' + str(level):>17}" for level in LEVELS) + f" {'inflate':>9}")
+    for name, frame in sample_frames(rng).items():
+        for fmt, payload in (("json", frame.data), ("msgpack", frame.packed)):
+            cells = []
+            for level in LEVELS:
+                deflated = deflate_payload(payload, min_bytes=0, level=level)
+                size = len(deflated) if deflated is not None else len(payload)
+                cpu = _cpu(lambda data: deflate_payload(data, min_bytes=0, level=level), payload, args.repeat)
+                cells.append(f"{size:>6} {size / len(payload):>4.0%} {cpu * 1e6:>5.1f}µs")
+            deflated = deflate_payload(payload, min_bytes=0, level=6)
+            inflate = _cpu(inflate_payload, deflated, args.repeat) if deflated is not None else 0.0
+            print(f"{name:<20} {fmt:<8} {len(payload):>7} " + " ".join(cells) + f" {inflate * 1e6:>7.1f}µs")
+
+    # Un broadcast a toda la sala: Frame.wire comprime una vez y comparte el resultado
+    print()
+    print(f"Broadcast de NEW_RESTAURANT x20 a {args.recipients} destinatarios (JSON, nivel 6):")
+    frame = sample_frames(random.Random(args.seed))["NEW_RESTAURANT x20"]
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        shared = Frame(frame.data, frame.obj)
+        wire = [shared.wire(False, True) for _ in range(args.recipients)]
+    once = (time.perf_counter() - start) / args.repeat
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        wire = [deflate_payload(frame.data, min_bytes=0) for _ in range(args.recipients)]
+    per_recipient = (time.perf_counter() - start) / args.repeat
+    raw = len(frame.data) * args.recipients
+    compressed = sum(len(w) for w in wire)
+    print(f"  bytes en el cable: {raw} sin comprimir, {compressed} comprimidos ({compressed / raw:.0%})")
+    print(f"  CPU por broadcast: {once * 1e6:.1f}µs comprimiendo una vez por sala, "
+          f"{per_recipient * 1e6:.1f}µs comprimiendo por destinatario")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Micro-benchmark: serialización de broadcasts (camino anterior vs. Frame serializado una vez).
+
+Ejecutar desde SwapForFood_server/:
+    python -m benchmarks.bench_frames
+"""
+import json
+import time
+import timeit
+
+from utils.frames import encode_frame, dumps_text
+from utils.restaurant_fetcher import _offline_restaurants
+
+ROOM_SIZES = (2, 10, 100)
+ITERATIONS = 2000
+
+
+class _FakeWebSocket:
+    """
+    Simula el coste que añade el servidor ASGI a cada envío de texto (codificar a UTF-8).
+    """
+    def __init__(self):
+        self.bytes_sent = 0
+
+    def send_text(self, message: str):
+        self.bytes_sent += len(message.encode("utf-8"))
+
+
+def _legacy_broadcast(websockets, restaurants):
+    # Camino anterior: json.dumps por llamada y repr de Python de la lista de restaurantes
+    restaurants_data = [r.to_dict() for r in restaurants]
+    msg = json.dumps({
+        "id": len(restaurants),
+        "message": f"NEW_RESTAURANT.{restaurants_data}",
+        "timestamp": int(time.time() * 1000)
+    })
+    for ws in websockets:
+        ws.send_text(msg)
+
+
+def _frame_broadcast(websockets, restaurants):
+    # Camino nuevo: se serializa una vez y se reutiliza el mismo buffer para todos
+    restaurants_data = dumps_text([r.to_dict() for r in restaurants])
+    frame = encode_frame(f"NEW_RESTAURANT.{restaurants_data}", id=len(restaurants))
+    for ws in websockets:
+        ws.send_text(frame.text)
+
+
+def _legacy_notify(websockets):
+    msg = json.dumps({
+        "id": 0,
+        "message": "USER_JOINED.usuario",
+        "timestamp": int(time.time() * 1000)
+    })
+    for ws in websockets:
+        ws.send_text(msg)
+
+
+def _frame_notify(websockets):
+    frame = encode_frame("USER_JOINED.usuario")
+    for ws in websockets:
+        ws.send_text(frame.text)
+
+
+def main():
+    restaurants = _offline_restaurants() * 5
+
+    print(f"{'caso':<18}{'usuarios':>10}{'anterior (us)':>16}{'nuevo (us)':>14}{'mejora':>10}")
+    for size in ROOM_SIZES:
+        websockets = [_FakeWebSocket() for _ in range(size)]
+        cases = (
+            ("NEW_RESTAURANT", lambda: _legacy_broadcast(websockets, restaurants),
+             lambda: _frame_broadcast(websockets, restaurants)),
+            ("USER_JOINED", lambda: _legacy_notify(websockets), lambda: _frame_notify(websockets)),
+        )
+        for name, legacy, new in cases:
+            legacy_us = min(timeit.repeat(legacy, number=ITERATIONS, repeat=3)) / ITERATIONS * 1e6
+            new_us = min(timeit.repeat(new, number=ITERATIONS, repeat=3)) / ITERATIONS * 1e6
+            print(f"{name:<18}{size:>10}{legacy_us:>16.2f}{new_us:>14.2f}{legacy_us / new_us:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark de memoria: bytes por sala (Room + User + Game con sus votos) con 2, 10
+y 50 usuarios. Se mide con deep_sizeof y con tracemalloc creando muchas salas,
+con una partida offline en curso en la que todos han votado la mitad de los restaurantes.
+
+Ejecutar desde SwapForFood_server/:
+    python -m benchmarks.bench_memory
+"""
+import asyncio
+import gc
+import tracemalloc
+
+from models.game import Game
+from models.room import Room
+from models.user import User
+from utils.memory import deep_sizeof
+from utils.timer_wheel import TimerWheel
+
+USERS_PER_ROOM = (2, 10, 50)
+ROOMS = 500
+
+
+class _FakeWebSocket:
+    __slots__ = ()
+
+
+async def _build_room(code: str, num_users: int, timers: TimerWheel) -> Room:
+    sala = Room(code)
+    for j in range(num_users):
+        user = User(_FakeWebSocket())
+        user.username = f"user{j}"
+        user.is_leader = j == 0
+        sala.add_user(user)
+
+    game = Game("28.1,-15.4", sala, offline=True, timers=timers)
+    sala.game = game
+    await game.start()
+    # Cada usuario vota la mitad de los restaurantes para que haya votos guardados
+    for restaurant in game.restaurants[:len(game.restaurants) // 2]:
+        for j in range(num_users):
+            await game.register_vote(f"user{j}", "0" if j % 2 else "1", restaurant.id)
+    # Los broadcasts de la partida no forman parte del estado en reposo
+    for user in sala.users:
+        user.stop()
+        user.send_queue = None
+    await asyncio.sleep(0)  # Dejar que terminen las tareas escritoras canceladas
+    return sala
+
+
+async def main():
+    timers = TimerWheel()
+    print(f"{'usuarios':>9}{'deep_sizeof B/sala':>20}{'tracemalloc B/sala':>20}")
+    for num_users in USERS_PER_ROOM:
+        sample = await _build_room("00000", num_users, timers)
+
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        rooms = [await _build_room(f"{i:05}", num_users, timers) for i in range(ROOMS)]
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        print(f"{num_users:>9}{deep_sizeof(sample):>20}{(after - before) / ROOMS:>20.0f}")
+        del rooms
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+"""
+Mide el índice de POIs offline: tiempo de apertura del fichero mapeado en memoria
+y latencia p50/p99 de nearest() con consultas repartidas por las ciudades del
+dataset sintético (y algunas fuera de ellas). Comprueba además una muestra de
+consultas contra una búsqueda por fuerza bruta.
+
+Ejecutar desde SwapForFood_server/:
+    python -m benchmarks.bench_poi_index --points 1000000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.gen_poi_dataset import CITIES, generate
+from utils.poi_index import PoiIndex, write_poi_file
+from utils.restaurant_fetcher import MAX_RESULTS, haversine_distance
+
+QUERIES = 10_000
+CHECKED = 20
+
+
+def _percentile(samples, p):
+    return samples[min(int(len(samples) * p), len(samples) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "pois.bin")
+        start = time.perf_counter()
+        write_poi_file(path, generate(args.points, args.seed))
+        print(f"Generación: {args.points} POIs en {time.perf_counter() - start:.2f}s "
+              f"({os.path.getsize(path) / 2**20:.1f} MiB)")
+
+        start = time.perf_counter()
+        index = PoiIndex(path)
+        print(f"Apertura: {(time.perf_counter() - start) * 1e3:.2f} ms")
+
+        rng = random.Random(args.seed + 1)
+        queries = []
+        for _ in range(QUERIES):
+            _, lat, lng, sigma, _ = rng.choice(CITIES)
+            spread = sigma * (10 if rng.random() < 0.05 else 1)
+            queries.append((rng.gauss(lat, spread), rng.gauss(lng, spread)))
+
+        timings = []
+        for lat, lng in queries:
+            start = time.perf_counter()
+            index.nearest(lat, lng, MAX_RESULTS)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        print(f"nearest(k={MAX_RESULTS}): p50 {_percentile(timings, 0.5) * 1e6:.0f} us, "
+              f"p90 {_percentile(timings, 0.9) * 1e6:.0f} us, "
+              f"p99 {_percentile(timings, 0.99) * 1e6:.0f} us")
+
+        # Comparar una muestra con la fuerza bruta
+        for lat, lng in queries[:CHECKED]:
+            found = [d for _, d in index.nearest(lat, lng, MAX_RESULTS)]
+            expected = sorted(
+                haversine_distance(lat, lng, index.lat[i], index.lng[i]) for i in range(len(index))
+            )
+            expected = [d for d in expected[:MAX_RESULTS] if d <= 50.0]
+            assert len(found) == len(expected), (lat, lng, found, expected)
+            # Los vectores del árbol son float32: se admite 1 m de diferencia en empates
+            assert all(abs(a - b) < 1e-3 for a, b in zip(found, expected)), (lat, lng, found, expected)
+        print(f"{CHECKED} consultas coinciden con la fuerza bruta")
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
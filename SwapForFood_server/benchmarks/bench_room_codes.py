@@ -0,0 +1,60 @@
+"""
+Prueba de estrés del reparto de códigos de sala: llena casi todo el espacio de
+100k códigos a través de RoomManager y comprueba que el coste por sala creada se
+mantiene plano, que los códigos cerrados vuelven al pool y que al agotarse se
+devuelve un error claro en lugar de quedarse en un bucle.
+
+Ejecutar desde SwapForFood_server/:
+    python -m benchmarks.bench_room_codes
+"""
+import asyncio
+import time
+
+from managers.room_manager import RoomManager
+from utils.room_codes import RoomCodeAllocator, ROOM_CODE_SPACE
+
+FILL_RATIO = 0.99
+REPORT_EVERY = 10_000
+
+
+class _FakeWebSocket:
+    __slots__ = ()
+
+
+async def main():
+    manager = RoomManager(room_codes=RoomCodeAllocator(cooldown=0))
+    target = int(ROOM_CODE_SPACE * FILL_RATIO)
+    websockets = []
+
+    print(f"{'salas':>8}{'us/sala (último bloque)':>26}")
+    start = block_start = time.perf_counter()
+    for i in range(1, target + 1):
+        ws = _FakeWebSocket()
+        response = await manager.join_room_with_prefix_0(ws, f"0user{i}")
+        assert response.startswith("0000"), response
+        websockets.append(ws)
+        if i % REPORT_EVERY == 0:
+            now = time.perf_counter()
+            print(f"{i:>8}{(now - block_start) / REPORT_EVERY * 1e6:>26.2f}")
+            block_start = now
+    print(f"Total: {target} salas en {time.perf_counter() - start:.2f}s")
+
+    # Agotar el resto del espacio y comprobar el error
+    while True:
+        ws = _FakeWebSocket()
+        response = await manager.join_room_with_prefix_0(ws, "0extra")
+        if not response.startswith("0000"):
+            print(f"Espacio agotado con {len(manager.rooms)} salas: {response}")
+            break
+        websockets.append(ws)
+
+    # Cerrar salas y comprobar que sus códigos vuelven a estar disponibles
+    for ws in websockets[:1000]:
+        await manager.handle_disconnect(ws)
+    print(f"Códigos libres tras cerrar 1000 salas: {manager.room_codes.available()}")
+    response = await manager.join_room_with_prefix_0(_FakeWebSocket(), "0again")
+    print(f"Nueva sala tras liberar códigos: {response}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
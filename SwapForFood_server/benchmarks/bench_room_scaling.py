@@ -0,0 +1,75 @@
+"""
+Benchmark de escalado: coste por operación de búsqueda de usuarios y cierre de salas
+con 10k salas y 100k websockets. El coste debe mantenerse plano al crecer el número
+de salas y conexiones.
+
+Ejecutar desde SwapForFood_server/:
+    python -m benchmarks.bench_room_scaling
+"""
+import asyncio
+import time
+
+from managers.room_manager import RoomManager
+from models.room import Room
+from models.user import User
+
+SCALES = ((100, 1_000), (1_000, 10_000), (10_000, 100_000))
+LOOKUPS = 200_000
+
+
+class _FakeWebSocket:
+    __slots__ = ()
+
+
+def _populate(manager: RoomManager, num_rooms: int, num_sockets: int):
+    per_room = num_sockets // num_rooms
+    for i in range(num_rooms):
+        code = f"{i:05}"
+        sala = Room()
+        manager.rooms[code] = sala
+        for j in range(per_room):
+            ws = _FakeWebSocket()
+            user = User(ws)
+            user.username = f"user{j}"
+            sala.add_user(user)
+            manager.websocket_to_room[ws] = code
+
+
+async def _run_scale(num_rooms: int, num_sockets: int):
+    manager = RoomManager()
+    _populate(manager, num_rooms, num_sockets)
+    websockets = list(manager.websocket_to_room)
+
+    # Búsqueda de usuario por websocket (se hace en cada voto y cada comando)
+    start = time.perf_counter()
+    for i in range(LOOKUPS):
+        ws = websockets[i % len(websockets)]
+        manager.get_room_by_websocket(ws).get_user_by_websocket(ws)
+    lookup_ns = (time.perf_counter() - start) / LOOKUPS * 1e9
+
+    # Búsqueda por nombre de usuario
+    sala = manager.rooms["00000"]
+    start = time.perf_counter()
+    for i in range(LOOKUPS):
+        sala.get_user_by_username("user9")
+    username_ns = (time.perf_counter() - start) / LOOKUPS * 1e9
+
+    # Cierre de salas: se eliminan 1000 salas del total
+    codes = list(manager.rooms)[:1000]
+    start = time.perf_counter()
+    for code in codes:
+        await manager.remove_room(code)
+    remove_us = (time.perf_counter() - start) / len(codes) * 1e6
+
+    return lookup_ns, username_ns, remove_us
+
+
+async def main():
+    print(f"{'salas':>8}{'sockets':>10}{'ws lookup (ns)':>17}{'username (ns)':>16}{'remove_room (us)':>19}")
+    for num_rooms, num_sockets in SCALES:
+        lookup_ns, username_ns, remove_us = await _run_scale(num_rooms, num_sockets)
+        print(f"{num_rooms:>8}{num_sockets:>10}{lookup_ns:>17.1f}{username_ns:>16.1f}{remove_us:>19.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
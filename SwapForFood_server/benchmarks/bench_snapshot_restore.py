@@ -0,0 +1,125 @@
+"""
+Mide los snapshots del estado de las salas: llena todos los códigos de sala con
+usuarios (y una parte con partidas en curso), guarda un snapshot, registra votos
+en el log de cambios y cronometra la restauración en un RoomManager nuevo, como
+tras un reinicio.
+
+Ejecutar desde SwapForFood_server/:
+    python -m benchmarks.bench_snapshot_restore --rooms 100000
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from managers.room_manager import RoomManager
+from models.game import Game
+from utils.room_codes import RoomCodeAllocator, ROOM_CODE_SPACE
+from utils.snapshots import StateJournal
+from utils.timer_wheel import TimerWheel
+
+
+class FakeWebSocket:
+    __slots__ = ()
+
+    async def send_text(self, text):
+        pass
+
+    async def send_bytes(self, data):
+        pass
+
+    async def close(self):
+        pass
+
+
+async def drain(manager):
+    # Esperar a que las tareas escritoras envíen lo pendiente: cancelarlas en mitad de un
+    # envío instantáneo puede perder la cancelación (asyncio.wait_for en Python 3.11)
+    while any(u.send_queue is not None and not u.send_queue.empty()
+              for sala in manager.rooms.values() for u in sala.users):
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.01)
+
+
+def _manager(path):
+    return RoomManager(timers=TimerWheel(), room_codes=RoomCodeAllocator(cooldown=0), journal=StateJournal(path))
+
+
+async def populate(manager, rooms, users_per_room, game_ratio, rng):
+    games = []
+    for _ in range(rooms):
+        leader = FakeWebSocket()
+        response = await manager.join_room_with_prefix_0(leader, "0user0")
+        code = response[4:9]
+        for n in range(1, users_per_room):
+            await manager.join_room_with_prefix_1(FakeWebSocket(), f"1{code}user{n}")
+        if rng.random() < game_ratio:
+            sala = manager.rooms[code]
+            sala.game = Game("40.4168,-3.7038", sala, offline=True, timers=manager.timers)
+            await sala.game.start()
+            games.append(sala.game)
+    # Dejar que las tareas escritoras vacíen las colas antes de medir
+    await drain(manager)
+    return games
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "state.bin")
+        manager = _manager(path)
+        await manager.start()
+
+        start = time.perf_counter()
+        games = await populate(manager, args.rooms, args.users, args.games, rng)
+        print(f"Salas: {len(manager.rooms)} ({args.users} usuarios cada una, {len(games)} partidas) "
+              f"en {time.perf_counter() - start:.2f}s")
+
+        start = time.perf_counter()
+        await manager.snapshot(in_thread=False)
+        print(f"Snapshot: {time.perf_counter() - start:.2f}s ({os.path.getsize(path) / 2**20:.1f} MiB)")
+
+        # Cambios posteriores al snapshot: solo quedan en el log
+        start = time.perf_counter()
+        votes = 0
+        for game in games:
+            for restaurant in game.restaurants[:args.votes]:
+                for n in range(args.users):
+                    await game.register_vote(f"user{n}", rng.choice("01"), restaurant.id)
+                    votes += 1
+        await manager.journal.flush()
+        log_size = sum(os.path.getsize(os.path.join(tmp, name)) for name in os.listdir(tmp) if name.endswith(".log"))
+        print(f"Log: {votes} votos en {time.perf_counter() - start:.2f}s ({log_size / 2**20:.1f} MiB)")
+
+        # Simular una caída: el log queda como está, sin snapshot final
+        expected = {code: (len(sala.users), sala.game.votes_cast if sala.game else None)
+                    for code, sala in manager.rooms.items()}
+        await manager.journal.close()
+        await drain(manager)
+
+        restored = _manager(path)
+        start = time.perf_counter()
+        await restored.start()
+        elapsed = time.perf_counter() - start
+        print(f"Restauración: {len(restored.rooms)} salas en {elapsed:.2f}s (incluye el snapshot de compactación)")
+
+        actual = {code: (len(sala.users), sala.game.votes_cast if sala.game else None)
+                  for code, sala in restored.rooms.items()}
+        print("Estado restaurado idéntico:", actual == expected)
+        await restored.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rooms", type=int, default=ROOM_CODE_SPACE)
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--games", type=float, default=0.1, help="Fracción de salas con partida en curso")
+    parser.add_argument("--votes", type=int, default=5, help="Restaurantes votados por partida tras el snapshot")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
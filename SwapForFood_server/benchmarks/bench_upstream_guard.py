@@ -0,0 +1,103 @@
+"""
+Ejercita la protección frente a Places (presupuesto de latencia, circuit breaker y
+resultados caducados/vecinos) contra benchmarks/places_stub.py en el mismo proceso.
+Recorre fases sana -> lenta -> con errores -> recuperada y, por fase, muestra las
+búsquedas resueltas, las servidas sin Places al día, las peticiones que llegaron al
+stub, la latencia y el estado final del breaker.
+
+Ejecutar desde SwapForFood_server/:
+    python -m benchmarks.bench_upstream_guard
+"""
+import os
+
+# Valores cortos para que cada fase dure unos segundos (se respetan si ya están definidos)
+PORT = int(os.getenv("STUB_PORT", "8091"))
+os.environ.setdefault("PLACES_BASE_URL", f"http://127.0.0.1:{PORT}")
+os.environ.setdefault("PLACES_CALL_BUDGET", "0.3")
+os.environ.setdefault("PLACES_BREAKER_FAILURES", "5")
+os.environ.setdefault("PLACES_BREAKER_RESET", "2")
+os.environ.setdefault("PLACES_NEXT_PAGE_DELAY", "0")
+os.environ.setdefault("RESTAURANT_CACHE_TTL", "1")
+
+import asyncio
+import random
+import time
+
+import uvicorn
+
+from benchmarks.places_stub import StubConfig, create_app
+from utils.metrics import PLACES_FALLBACKS
+from utils.restaurant_cache import fetch_restaurants_cached
+from utils.restaurant_fetcher import places_breaker, close_async_client
+
+CENTERS = ((40.4168, -3.7038), (41.3874, 2.1686), (28.1235, -15.4363))
+SPREAD_DEG = 0.01
+ROUNDS = 15
+CONCURRENCY = 10
+
+# (nombre, latencia del stub, tasa de errores, estado de error)
+PHASES = (
+    ("sana", 0.02, 0.0, None),
+    ("lenta", 1.0, 0.0, None),
+    ("errores", 0.02, 1.0, "OVER_QUERY_LIMIT"),
+    ("http 500", 0.02, 1.0, "500"),
+    ("recuperada", 0.02, 0.0, None),
+)
+
+
+def _location(rng):
+    lat, lng = rng.choice(CENTERS)
+    return f"{rng.gauss(lat, SPREAD_DEG)},{rng.gauss(lng, SPREAD_DEG)}"
+
+
+def _fallbacks():
+    return {dict(key).get("source"): value for key, value in PLACES_FALLBACKS.values.items()}
+
+
+async def _lookup(location, timings, outcome):
+    start = time.perf_counter()
+    try:
+        restaurants = await fetch_restaurants_cached(location)
+        outcome["ok" if restaurants else "empty"] += 1
+    except Exception:
+        outcome["error"] += 1
+    timings.append(time.perf_counter() - start)
+
+
+async def main():
+    config = StubConfig()
+    server = uvicorn.Server(uvicorn.Config(create_app(config), host="127.0.0.1", port=PORT, log_level="error"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    rng = random.Random(0)
+    print(f"{'fase':<12}{'ok':>5}{'error':>7}{'caducadas':>11}{'vecinas':>9}{'al stub':>9}"
+          f"{'p50 ms':>9}{'p99 ms':>9}  breaker")
+    for name, latency, error_rate, error_status in PHASES:
+        config.latency = latency
+        config.error_rate = error_rate
+        config.error_status = error_status or "OVER_QUERY_LIMIT"
+        before_fallbacks = _fallbacks()
+        before_requests = config.requests
+        timings = []
+        outcome = {"ok": 0, "empty": 0, "error": 0}
+        for _ in range(ROUNDS):
+            await asyncio.gather(*(_lookup(_location(rng), timings, outcome) for _ in range(CONCURRENCY)))
+            await asyncio.sleep(0.2)
+        fallbacks = _fallbacks()
+        timings.sort()
+        print(f"{name:<12}{outcome['ok']:>5}{outcome['error']:>7}"
+              f"{fallbacks.get('stale', 0) - before_fallbacks.get('stale', 0):>11}"
+              f"{fallbacks.get('neighbor', 0) - before_fallbacks.get('neighbor', 0):>9}"
+              f"{config.requests - before_requests:>9}"
+              f"{timings[len(timings) // 2] * 1e3:>9.1f}{timings[int(len(timings) * 0.99)] * 1e3:>9.1f}"
+              f"  {places_breaker.state}")
+
+    await close_async_client()
+    server.should_exit = True
+    await server_task
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
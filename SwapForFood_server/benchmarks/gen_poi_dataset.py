@@ -0,0 +1,51 @@
+"""
+Genera un fichero de POIs sintético para el modo offline (ver utils/poi_index.py):
+restaurantes repartidos en grupos gaussianos alrededor de varias ciudades.
+
+Ejecutar desde SwapForFood_server/:
+    python -m benchmarks.gen_poi_dataset --points 1000000 --output offline_pois.bin
+
+y arrancar el servidor con OFFLINE_POI_FILE=offline_pois.bin.
+"""
+import argparse
+import random
+import time
+
+from utils.poi_index import write_poi_file
+
+# (nombre, lat, lng, desviación en grados, peso)
+CITIES = (
+    ("Madrid", 40.4168, -3.7038, 0.08, 5),
+    ("Barcelona", 41.3874, 2.1686, 0.06, 4),
+    ("Valencia", 39.4699, -0.3763, 0.05, 2),
+    ("Sevilla", 37.3891, -5.9845, 0.05, 2),
+    ("Las Palmas", 28.1235, -15.4363, 0.04, 1),
+    ("Bilbao", 43.2630, -2.9350, 0.03, 1),
+)
+KINDS = ("Bar", "Taberna", "Pizzería", "Asador", "Marisquería", "Sushi", "Tapas", "Bistró")
+
+
+def generate(points, seed=0):
+    rng = random.Random(seed)
+    weights = [city[4] for city in CITIES]
+    for i in range(points):
+        name, lat, lng, sigma, _ = rng.choices(CITIES, weights)[0]
+        rating = None if rng.random() < 0.1 else round(rng.uniform(1.0, 5.0), 1)
+        yield (f"poi-{i}", f"{rng.choice(KINDS)} {name} {i}",
+               rng.gauss(lat, sigma), rng.gauss(lng, sigma), rating)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=100_000)
+    parser.add_argument("--output", default="offline_pois.bin")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    write_poi_file(args.output, generate(args.points, args.seed))
+    print(f"{args.points} POIs escritos en {args.output} en {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+Generador de carga y benchmark de latencia extremo a extremo para el endpoint /ws.
+
+Simula salas completas con el protocolo real: crear sala ("0"), unirse ("1"),
+chat ("3"), empezar partida ("4") y votar ("5"). El servidor debe arrancarse en
+modo offline para no consumir cuota de Places:
+
+    SWAPFORFOOD_OFFLINE=1 uvicorn main:app --port 8080
+
+Ejecutar desde SwapForFood_server/:
+    python -m benchmarks.loadgen --rooms 500 --users-per-room 4 --server-pid <pid>
+
+Los resultados se guardan en JSON (--output) para comparar ejecuciones.
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import platform
+import time
+
+import websockets
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Mensajes enviados por el servidor a toda la sala (no son respuestas a un comando)
+BROADCAST_PREFIXES = (
+    "USER_JOINED.", "USER_LEFT.", "USER_REMOVED.", "NEW_LEADER.", "ROOM_CLOSED", "REMOVED",
+    "NEW_MESSAGE.", "NEW_MESSAGES.", "GAME_START.", "NEW_RESTAURANT.", "GAME_RESULTS.", "PING",
+)
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "p50_ms": percentile(values, 50),
+        "p95_ms": percentile(values, 95),
+        "p99_ms": percentile(values, 99),
+        "max_ms": max(values) if values else None,
+    }
+
+
+class Stats:
+    def __init__(self):
+        self.rtt = collections.defaultdict(list)  # {opcode: [ms]}
+        self.fanout = []  # Latencia de entrega de los mensajes de chat [ms]
+        self.errors = collections.Counter()
+        self.games_completed = 0
+
+
+class SimulatedClient:
+    """
+    Cliente del protocolo legado. Las respuestas a comandos llegan en orden, así que
+    se emparejan con una cola FIFO de envíos pendientes.
+    """
+
+    def __init__(self, url, name, stats: Stats):
+        self.url = url
+        self.name = name
+        self.stats = stats
+        self.ws = None
+        self.pending = collections.deque()  # [(opcode, t_envio, future)]
+        self.restaurants = asyncio.get_running_loop().create_future()
+        self.results = asyncio.get_running_loop().create_future()
+        self.reader_task = None
+
+    async def connect(self):
+        self.ws = await websockets.connect(self.url, max_size=None)
+        self.reader_task = asyncio.create_task(self._reader())
+
+    async def close(self):
+        if self.reader_task is not None:
+            self.reader_task.cancel()
+        if self.ws is not None:
+            await self.ws.close()
+
+    async def command(self, content: str):
+        opcode = content[:1]
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((opcode, time.perf_counter(), future))
+        await self.ws.send(json.dumps({"sender": self.name, "content": content}))
+        return await future
+
+    async def _reader(self):
+        try:
+            async for raw in self.ws:
+                self._handle(json.loads(raw))
+        except (websockets.ConnectionClosed, asyncio.CancelledError):
+            pass
+        finally:
+            for _, _, future in self.pending:
+                if not future.done():
+                    future.set_exception(ConnectionError("conexión cerrada"))
+
+    def _handle(self, data):
+        message = data.get("message", "")
+        if message.startswith(BROADCAST_PREFIXES):
+            self._handle_broadcast(message)
+            return
+        if not self.pending:
+            self.stats.errors["unexpected_reply"] += 1
+            return
+        opcode, sent_at, future = self.pending.popleft()
+        self.stats.rtt[opcode].append((time.perf_counter() - sent_at) * 1000)
+        if not future.done():
+            future.set_result(message)
+
+    def _handle_broadcast(self, message):
+        if message.startswith("NEW_MESSAGE."):
+            # El contenido del chat es la marca de tiempo de envío en ms
+            sent_ms = message.rsplit(":", 1)[-1]
+            if sent_ms.isdigit():
+                self.stats.fanout.append(time.time() * 1000 - int(sent_ms))
+        elif message.startswith("NEW_MESSAGES."):
+            # Chat agrupado (CHAT_COALESCE_WINDOW): una latencia por mensaje del lote
+            now_ms = time.time() * 1000
+            for chat in json.loads(message[len("NEW_MESSAGES."):]):
+                if str(chat.get("content", "")).isdigit():
+                    self.stats.fanout.append(now_ms - int(chat["content"]))
+        elif message.startswith("NEW_RESTAURANT.") and not self.restaurants.done():
+            self.restaurants.set_result(json.loads(message[len("NEW_RESTAURANT."):]))
+        elif message.startswith("GAME_RESULTS.") and not self.results.done():
+            self.results.set_result(message)
+
+
+async def run_room(index, args, stats: Stats, connect_limit: asyncio.Semaphore):
+    clients = [SimulatedClient(args.url, f"u{index}_{i}", stats) for i in range(args.users_per_room)]
+    try:
+        async with connect_limit:
+            for client in clients:
+                await client.connect()
+
+        leader, members = clients[0], clients[1:]
+        reply = await leader.command(f"0{leader.name}")
+        if not reply.startswith("0000"):
+            stats.errors["create_room"] += 1
+            return
+        code = reply[4:9]
+
+        replies = await asyncio.gather(*[m.command(f"1{code}{m.name}") for m in members])
+        stats.errors["join_room"] += sum(1 for r in replies if not r.startswith("0001"))
+
+        for _ in range(args.chat_messages):
+            await asyncio.gather(*[c.command(f"3{int(time.time() * 1000)}") for c in clients])
+
+        reply = await leader.command(f"4{args.location}")
+        if not reply.startswith("0000"):
+            stats.errors["start_game"] += 1
+            return
+
+        async def vote_all(client: SimulatedClient):
+            restaurants = await asyncio.wait_for(client.restaurants, args.timeout)
+            for r in restaurants:
+                await client.command(f"5{'0' if hash((client.name, r['id'])) % 2 else '1'}{r['id']}")
+            await asyncio.wait_for(client.results, args.timeout)
+
+        await asyncio.gather(*[vote_all(c) for c in clients])
+        stats.games_completed += 1
+    except Exception as e:
+        stats.errors[type(e).__name__] += 1
+    finally:
+        await asyncio.gather(*[c.close() for c in clients], return_exceptions=True)
+
+
+class ResourceSampler:
+    """
+    Muestrea CPU y memoria del proceso del servidor mientras dura la prueba.
+    """
+
+    def __init__(self, pid, interval=0.5):
+        self.process = psutil.Process(pid) if psutil and pid else None
+        self.interval = interval
+        self.cpu = []
+        self.rss = []
+        self.task = None
+
+    def start(self):
+        if self.process is not None:
+            self.process.cpu_percent(None)
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.cpu.append(self.process.cpu_percent(None))
+            self.rss.append(self.process.memory_info().rss)
+
+    def summary(self):
+        if not self.cpu:
+            return None
+        return {
+            "cpu_percent_avg": sum(self.cpu) / len(self.cpu),
+            "cpu_percent_max": max(self.cpu),
+            "rss_bytes_max": max(self.rss),
+            "rss_bytes_last": self.rss[-1],
+        }
+
+
+async def main(args):
+    stats = Stats()
+    sampler = ResourceSampler(args.server_pid)
+    connect_limit = asyncio.Semaphore(args.connect_concurrency)
+
+    sampler.start()
+    started = time.perf_counter()
+    await asyncio.gather(*[run_room(i, args, stats, connect_limit) for i in range(args.rooms)])
+    elapsed = time.perf_counter() - started
+    await sampler.stop()
+
+    votes = len(stats.rtt.get("5", []))
+    report = {
+        "timestamp": int(time.time()),
+        "host": platform.node(),
+        "config": {
+            "url": args.url,
+            "rooms": args.rooms,
+            "users_per_room": args.users_per_room,
+            "chat_messages": args.chat_messages,
+        },
+        "elapsed_s": elapsed,
+        "games_completed": stats.games_completed,
+        "votes_per_second": votes / elapsed if elapsed else None,
+        "commands_per_second": sum(len(v) for v in stats.rtt.values()) / elapsed if elapsed else None,
+        "rtt_ms": {opcode: summarize(values) for opcode, values in sorted(stats.rtt.items())},
+        "broadcast_fanout_ms": summarize(stats.fanout),
+        "server": sampler.summary(),
+        "errors": dict(stats.errors),
+    }
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(report) + "\n")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generador de carga para /ws")
+    parser.add_argument("--url", default=os.getenv("LOADGEN_URL", "ws://127.0.0.1:8080/ws"))
+    parser.add_argument("--rooms", type=int, default=100)
+    parser.add_argument("--users-per-room", type=int, default=4)
+    parser.add_argument("--chat-messages", type=int, default=3, help="mensajes de chat por usuario")
+    parser.add_argument("--location", default="40.4168,-3.7038")
+    parser.add_argument("--connect-concurrency", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--server-pid", type=int, default=None, help="PID del servidor para medir CPU/memoria")
+    parser.add_argument("--output", default="loadgen_results.jsonl", help="fichero JSON Lines de resultados")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
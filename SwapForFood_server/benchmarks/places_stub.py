@@ -0,0 +1,108 @@
+"""
+Servidor de pruebas que imita Nearby Search de Places con latencia y errores
+configurables, para probar el circuit breaker y la caché con resultados caducados
+sin consumir cuota.
+
+Ejecutar desde SwapForFood_server/:
+    python -m benchmarks.places_stub --port 8090 --latency 0.5 --error-rate 0.2
+
+y arrancar el servidor con PLACES_BASE_URL=http://127.0.0.1:8090.
+"""
+import argparse
+import asyncio
+import random
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+PAGE_SIZE = 20
+GRID_DEG = 0.002  # Los restaurantes del stub están en una rejilla fija: ubicaciones cercanas los comparten
+
+
+class StubConfig:
+    __slots__ = ("latency", "error_rate", "error_status", "pages", "requests", "errors", "in_flight",
+                 "max_in_flight")
+
+    def __init__(self, latency=0.0, error_rate=0.0, error_status="OVER_QUERY_LIMIT", pages=1):
+        self.latency = latency  # segundos
+        self.error_rate = error_rate  # 0..1
+        self.error_status = error_status  # Estado de Places o "500" para un error HTTP
+        self.pages = pages
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0  # Peticiones atendiéndose ahora mismo
+        self.max_in_flight = 0
+
+
+def _results(lat, lng, page):
+    base_lat = round(lat / GRID_DEG) * GRID_DEG
+    base_lng = round(lng / GRID_DEG) * GRID_DEG
+    results = []
+    for i in range(page * PAGE_SIZE, (page + 1) * PAGE_SIZE):
+        r_lat = base_lat + (i % 5 - 2) * GRID_DEG
+        r_lng = base_lng + (i // 5 % 5 - 2) * GRID_DEG
+        results.append({
+            "place_id": f"stub-{r_lat:.3f}-{r_lng:.3f}-{i // 25}",
+            "name": f"Stub {r_lat:.3f},{r_lng:.3f}",
+            "rating": round(1 + (i * 37 % 40) / 10, 1),
+            "geometry": {"location": {"lat": r_lat, "lng": r_lng}},
+        })
+    return results
+
+
+def create_app(config: StubConfig) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/nearbysearch/json")
+    async def nearby_search(request: Request):
+        config.requests += 1
+        config.in_flight += 1
+        config.max_in_flight = max(config.max_in_flight, config.in_flight)
+        try:
+            return await _respond(request)
+        finally:
+            config.in_flight -= 1
+
+    async def _respond(request):
+        if config.latency:
+            await asyncio.sleep(config.latency)
+        if random.random() < config.error_rate:
+            config.errors += 1
+            if config.error_status == "500":
+                return JSONResponse({}, status_code=500)
+            return {"status": config.error_status, "results": []}
+
+        params = request.query_params
+        # El token de página lleva la ubicación y la página siguiente
+        token = params.get("pagetoken")
+        if token:
+            lat, lng, page = token.split(":")
+            lat, lng, page = float(lat), float(lng), int(page)
+        else:
+            lat, lng = (float(v) for v in params["location"].split(","))
+            page = 0
+        data = {"status": "OK", "results": _results(lat, lng, page)}
+        if page + 1 < config.pages:
+            data["next_page_token"] = f"{lat}:{lng}:{page + 1}"
+        return data
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", default="OVER_QUERY_LIMIT")
+    parser.add_argument("--pages", type=int, default=1)
+    args = parser.parse_args()
+
+    config = StubConfig(args.latency, args.error_rate, args.error_status, args.pages)
+    uvicorn.run(create_app(config), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
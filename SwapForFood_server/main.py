@@ -1,9 +1,28 @@
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from routers import websocket_routes
+from routers import websocket_routes, photo_routes
+from utils.restaurant_fetcher import close_async_client
+from utils.analytics import analytics_sink
+from utils.metrics import registry
 import uvicorn
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await analytics_sink.start()
+    await websocket_routes.room_manager.start()
+    yield
+    await websocket_routes.room_manager.close()
+    # Escribir los eventos de analítica que queden en memoria
+    await analytics_sink.close()
+    # Cerrar el pool de conexiones HTTP hacia la API de Places
+    await close_async_client()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Configuración de CORS si es necesario
 app.add_middleware(
@@ -16,15 +35,35 @@ app.add_middleware(
 
 # Incluir rutas
 app.include_router(websocket_routes.router)
+app.include_router(photo_routes.router)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # Métricas en formato de texto de Prometheus
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     # Configuración para el servidor
     reload_mode = False  # Cambiar a False si no quieres el modo reload
+    # Con varios workers hay que usar un backend compartido (ROOM_BACKEND=redis)
+    workers = int(os.getenv("UVICORN_WORKERS", "1"))
+    # permessage-deflate comprime cada mensaje para cada destinatario. Los clientes de los
+    # protocolos "+deflate" ya reciben los frames comprimidos una vez por sala
+    per_message_deflate = os.getenv("WS_PER_MESSAGE_DEFLATE", "1") == "1"
+    # Ping del protocolo websocket: detecta las conexiones muertas de los clientes legados,
+    # que no responden al PING de aplicación (segundos; 0 lo desactiva)
+    ws_ping_interval = float(os.getenv("WS_PING_INTERVAL", "20")) or None
+    ws_ping_timeout = float(os.getenv("WS_PING_TIMEOUT", "20")) or None
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=8080,
-        reload=reload_mode
+        reload=reload_mode,
+        workers=workers,
+        ws_per_message_deflate=per_message_deflate,
+        ws_ping_interval=ws_ping_interval,
+        ws_ping_timeout=ws_ping_timeout
     )
 
 #uvicorn main:app --host 0.0.0.0 --port 8000 --reload
\ No newline at end of file
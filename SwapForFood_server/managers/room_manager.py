@@ -1,17 +1,124 @@
-import json
-import random
+import asyncio
+import logging
+import os
+import secrets
 import time
-from models.user import User
+from models.user import User, DetachedSocket, SEND_TIMEOUT
 from models.room import Room
+from models.game import Game, _mask_in
+from models.restaurant import Restaurant
+from backends.memory import InMemoryBackend
+from utils.timer_wheel import timer_wheel
+from utils.frames import Frame, encode_frame
+from utils.memory import deep_sizeof
+from utils.room_codes import RoomCodeAllocator, RoomCodesExhausted
+from utils.prefetch import RestaurantPrefetch
+from utils.snapshots import StateJournal, SNAPSHOT_PATH, SNAPSHOT_INTERVAL, paused_gc
+from utils.metrics import (
+    ROOMS_CREATED, ROOMS_CLOSED, USERS_JOINED, USERS_LEFT, SLOW_CONSUMERS,
+    REAPED_ROOMS, REAPED_CONNECTIONS, REAPED_BYTES, HEARTBEAT_PINGS, SNAPSHOT_DURATION, SESSIONS_RESUMED
+)
+
+# Heartbeat y limpieza de salas (segundos). HEARTBEAT_TIMEOUT=0 desactiva el cierre de conexiones mudas.
+# Solo se aplica a las sesiones v2 (que responden al PING de aplicación) y a las restauradas sin
+# reanudar; las conexiones legadas muertas las detecta el ping del protocolo websocket (main.py)
+HEARTBEAT_INTERVAL = float(os.getenv("HEARTBEAT_INTERVAL", "30"))
+HEARTBEAT_TIMEOUT = float(os.getenv("HEARTBEAT_TIMEOUT", "300"))
+ROOM_IDLE_TIMEOUT = float(os.getenv("ROOM_IDLE_TIMEOUT", "3600"))
+
+# Agrupación de mensajes de chat: los recibidos por una sala dentro de la ventana se envían
+# en un único frame NEW_MESSAGES. CHAT_COALESCE_WINDOW=0 desactiva la agrupación
+CHAT_COALESCE_WINDOW = float(os.getenv("CHAT_COALESCE_WINDOW", "0"))  # segundos
+CHAT_COALESCE_MAX_BATCH = int(os.getenv("CHAT_COALESCE_MAX_BATCH", "32"))
+
+# Intentos de reservar un código en el backend compartido (otro worker puede tenerlo)
+ROOM_CODE_CLAIM_ATTEMPTS = 32
+
+# Bytes aleatorios del token para reanudar la sesión (22 caracteres en base64 url-safe)
+RESUME_TOKEN_BYTES = 16
+
+logger = logging.getLogger(__name__)
 
 
 class RoomManager:
 
-    def __init__(self):
-        self.rooms = {}  # Mapa de salas {codigo_sala: Room}
+    def __init__(self, backend=None, timers=None, room_codes=None,
+                 chat_window=CHAT_COALESCE_WINDOW, chat_max_batch=CHAT_COALESCE_MAX_BATCH, journal=None):
+        self.rooms = {}  # Mapa de salas con usuarios en este worker {codigo_sala: Room}
         self.websocket_to_room = {}  # Mapa de Websockets {websocket: codigo_sala}
-
-    async def join_room_with_prefix_0(self, websocket, content: str):
+        self.backend = backend or InMemoryBackend()  # Estado compartido de salas y partidas
+        self.timers = timers if timers is not None else timer_wheel  # Temporizadores de partidas, salas y heartbeats
+        self.reaper = None
+        self.room_codes = room_codes or RoomCodeAllocator(clock=self.timers.clock)  # Códigos libres
+        self.chat_window = chat_window
+        self.chat_max_batch = chat_max_batch
+        # Snapshots y log de cambios para sobrevivir a reinicios (ver utils/snapshots.py)
+        self.journal = journal or (StateJournal(SNAPSHOT_PATH) if SNAPSHOT_PATH else None)
+        self.snapshotter = None
+        self.snapshot_task = None
+        self.background_tasks = set()  # Referencias a las tareas lanzadas sin esperar (asyncio solo guarda referencias débiles)
+
+    async def start(self):
+        await self.backend.start(self.handle_backend_event)
+        if self.journal is not None:
+            await self.restore()
+            await self.journal.start()
+        self.timers.start()
+        self.reaper = self.timers.schedule_periodic(HEARTBEAT_INTERVAL, self.reap)
+        if self.journal is not None:
+            self.snapshotter = self.timers.schedule_periodic(SNAPSHOT_INTERVAL, self._start_snapshot)
+
+    async def close(self):
+        if self.reaper is not None:
+            self.reaper.cancel()
+        if self.snapshotter is not None:
+            self.snapshotter.cancel()
+        await self.timers.stop()
+        while self.background_tasks:
+            await asyncio.gather(*self.background_tasks, return_exceptions=True)
+        if self.journal is not None:
+            # Snapshot final para que el siguiente arranque no tenga que repasar el log
+            if self.snapshot_task is not None:
+                await self.snapshot_task
+            await self.snapshot(in_thread=False)
+            await self.journal.close()
+        await self.backend.close()
+
+    def _spawn(self, coro):
+        # Tarea en segundo plano con referencia propia hasta que termina; sus errores se registran
+        task = asyncio.create_task(coro)
+        self.background_tasks.add(task)
+        task.add_done_callback(self._background_done)
+        return task
+
+    def _background_done(self, task):
+        self.background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Error en una tarea en segundo plano", exc_info=task.exception())
+
+    def _record(self, kind, codigo_sala, *args):
+        if self.journal is not None:
+            self.journal.record(kind, codigo_sala, *args)
+
+    def _new_user(self, websocket, username, binary_frames=False, compress_frames=False, app_pings=False):
+        user = User(websocket, on_slow_consumer=self._evict_slow_consumer, binary_frames=binary_frames,
+                    compress_frames=compress_frames, on_connection_lost=self._connection_lost,
+                    app_pings=app_pings)
+        user.username = username
+        user.resume_token = secrets.token_urlsafe(RESUME_TOKEN_BYTES)
+        return user
+
+    async def _open_local_room(self, codigo_sala):
+        sala = Room(codigo_sala, self.backend)
+        sala.journal = self.journal
+        self.rooms[codigo_sala] = sala
+        self.room_codes.reserve(codigo_sala)
+        self._record("open", codigo_sala)
+        await self.backend.subscribe(codigo_sala)
+        return sala
+
+    async def join_room_with_prefix_0(self, websocket, content: str, binary_frames: bool = False,
+                                      compress_frames: bool = False, app_pings: bool = False):
         # Comprobar si el WebSocket ya tiene una sala asignada
         if websocket in self.websocket_to_room:
             codigo_sala = self.websocket_to_room[websocket]
@@ -20,51 +127,73 @@ class RoomManager:
         # Extraer nombre de usuario
         username = content[1:]
 
-        # Generar un código aleatorio de 5 dígitos único para la sala
-        while True:
-            codigo_sala = f"{random.randint(0, 99999):05}"
-            if codigo_sala not in self.rooms:
-                break
+        # Tomar un código de 5 dígitos libre y reservarlo en el backend (único en todos los workers)
+        codigo_sala = None
+        try:
+            for _ in range(ROOM_CODE_CLAIM_ATTEMPTS):
+                candidate = self.room_codes.allocate()
+                if await self.backend.claim_room(candidate):
+                    codigo_sala = candidate
+                    break
+                # Ocupado por otro worker: se devuelve al pool y se reintentará más tarde
+                self.room_codes.release(candidate)
+        except RoomCodesExhausted:
+            pass
+        if codigo_sala is None:
+            return "1000Error: No quedan códigos de sala disponibles."
 
         # Crear una nueva sala
-        nueva_sala = Room()
-        self.rooms[codigo_sala] = nueva_sala
+        nueva_sala = await self._open_local_room(codigo_sala)
         self.websocket_to_room[websocket] = codigo_sala
 
         # Crear un nuevo usuario y hacerlo líder
-        user = User(websocket)
-        user.username = username
+        user = self._new_user(websocket, username, binary_frames, compress_frames, app_pings)
         user.is_leader = True
         nueva_sala.add_user(user)
+        self._record("join", codigo_sala, username, user.resume_token, True)
+        await self.backend.add_member(codigo_sala, username)
+        await self.backend.set_leader(codigo_sala, username)
+        self.touch(websocket)
+        self._watch(user)
+        ROOMS_CREATED.inc()
+        USERS_JOINED.inc()
 
         # Devolver respuesta con el código de sala y nombre del usuario
         return f"0000{codigo_sala}{username}"
 
-    async def join_room_with_prefix_1(self, websocket, content: str):
+    async def join_room_with_prefix_1(self, websocket, content: str, binary_frames: bool = False,
+                                      compress_frames: bool = False, app_pings: bool = False):
         # content: "1roomCodeusername"
 
         roomCode = content[1:6]  # Del segundo carácter hasta el sexto
         username = content[6:]  # Del séptimo carácter en adelante
 
-        # Verificar si la sala existe
+        # Verificar si la sala existe (puede estar alojada en otro worker)
         sala = self.rooms.get(roomCode)
         if not sala:
-            return f"1000Error: La sala con código {roomCode} no existe."
+            if not await self.backend.room_exists(roomCode):
+                return f"1000Error: La sala con código {roomCode} no existe."
+            sala = await self._open_local_room(roomCode)
+            sala.remote_game = await self.backend.load_game(roomCode) is not None
 
         # Comprobar si el usuario ya está en la sala
         user = sala.get_user_by_websocket(websocket)
         if not user:
             # Si no está en la sala, lo agregamos
-            new_user = User(websocket)
-            new_user.username = username
+            new_user = self._new_user(websocket, username, binary_frames, compress_frames, app_pings)
             new_user.is_leader = False  # Solo el usuario que crea la sala es líder
             sala.add_user(new_user)
+            self._record("join", roomCode, username, new_user.resume_token, False)
             self.websocket_to_room[websocket] = roomCode
+            await self.backend.add_member(roomCode, username)
+            self.touch(websocket)
+            self._watch(new_user)
+            USERS_JOINED.inc()
             await sala.notify_new_user(username, websocket)
 
         # Lista de usuarios
-        user_list = [u.username for u in sala.users]
-        return f"0001{len(sala.users)}{'.'.join(user_list)}"
+        user_list = await sala.member_names()
+        return f"0001{len(user_list)}{'.'.join(user_list)}"
 
     async def remove_user_by_username(self, username: str, websocket):
         # Obtener la sala del usuario que realiza la solicitud
@@ -85,47 +214,30 @@ class RoomManager:
         # Buscar al usuario a eliminar
         user_to_remove = sala.get_user_by_username(username)
         if not user_to_remove:
+            if username in await sala.member_names():
+                # El usuario está conectado a otro worker: que lo elimine ese worker
+                await sala.publish_event({"type": "kick", "username": username})
+                return f"0000"
             return f"1000Error: El usuario {username} no está en la sala {roomCode}."
 
+        await self._kick_local_user(roomCode, sala, user_to_remove)
+        return f"0000"
+
+    async def _kick_local_user(self, roomCode, sala, user_to_remove):
         was_leader = user_to_remove.is_leader
 
         # Notificar a todos que el usuario será eliminado
-        await sala.broadcast_json({
-            "id": 0,
-            "message": f"USER_REMOVED.{username}",
-            "timestamp": int(time.time() * 1000)
-        })
+        await sala.broadcast(encode_frame(f"USER_REMOVED.{user_to_remove.username}"))
 
-        # Cerrar conexión del usuario eliminado
-        try:
-            await user_to_remove.websocket.close()
-        except:
-            pass  # Ignorar errores si el websocket ya estaba cerrado
+        # Cerrar conexión del usuario eliminado (tras enviarle lo que tenga pendiente)
+        user_to_remove.close()
 
         # Eliminar al usuario de la sala
         sala.remove_user(user_to_remove)
         del self.websocket_to_room[user_to_remove.websocket]
+        self._record("leave", roomCode, user_to_remove.username)
 
-        # Si la sala está vacía, eliminarla
-        if sala.is_empty():
-            await sala.notify_room_closed()  # Notificar cierre de sala
-            await self.remove_room(roomCode)
-        else:
-            # Si el usuario eliminado era líder, reasignar liderazgo
-            if was_leader:
-                new_leader = sala.users[0]  # Asignar al primer usuario restante
-                new_leader.is_leader = True
-                await sala.broadcast_json({
-                    "id": 0,
-                    "message": f"NEW_LEADER.{new_leader.username}",
-                    "timestamp": int(time.time() * 1000)
-                })
-
-        # Si hay un juego en curso, verificar si ahora todos los votos están listos
-        if sala.game is not None:
-            await sala.game.check_results()
-
-        return f"0000"
+        await self._after_member_removed(roomCode, sala, user_to_remove.username, was_leader)
 
     async def handle_disconnect(self, websocket):
         # Buscar la sala a la que pertenece el usuario
@@ -148,31 +260,121 @@ class RoomManager:
         # Eliminar al usuario de la sala
         was_leader = user.is_leader
         sala.remove_user(user)
+        user.stop()
         del self.websocket_to_room[websocket]
+        self._record("leave", codigo_sala, user.username)
+
+        await self._after_member_removed(codigo_sala, sala, user.username, was_leader)
 
-        # Si la sala está vacía, eliminarla
-        if sala.is_empty():
+    async def _after_member_removed(self, codigo_sala, sala, username, was_leader):
+        await self.backend.remove_member(codigo_sala, username)
+        members = await self.backend.members(codigo_sala)
+        USERS_LEFT.inc()
+
+        # Si la sala está vacía (en todos los workers), eliminarla
+        if not members:
+            ROOMS_CLOSED.inc()
             await sala.notify_room_closed()
             await self.remove_room(codigo_sala)
+            await self.backend.delete_room(codigo_sala)
         else:
-            # Si el usuario era líder, reasignar liderazgo
+            # Si el usuario era líder, reasignar liderazgo al primer miembro restante
             if was_leader:
-                new_leader = sala.users[0]
-                new_leader.is_leader = True
-                await sala.broadcast_json({
-                    "id": 0,
-                    "message": f"NEW_LEADER.{new_leader.username}",
-                    "timestamp": int(time.time() * 1000)
-                })
+                new_leader = members[0]
+                await self.backend.set_leader(codigo_sala, new_leader)
+                self._apply_leader(sala, new_leader)
+                await sala.publish_event({"type": "leader", "username": new_leader})
+                await sala.broadcast(encode_frame(f"NEW_LEADER.{new_leader}"))
+            # Los usuarios que quedan están en otros workers: liberar la copia local
+            # (salvo que este worker esté gestionando la partida en curso)
+            if sala.is_empty() and sala.game is None:
+                await self.remove_room(codigo_sala)
 
         # Si hay un juego en curso, verificar si ahora que se fue un usuario ya se cumplen las condiciones
         if sala.game is not None:
             await sala.game.check_results()
+        elif sala.remote_game:
+            await sala.publish_event({"type": "left", "username": username})
+
+    def _apply_leader(self, sala, username):
+        # El líder puede estar en otro worker; en ese caso ningún usuario local lo es
+        leader = sala.get_user_by_username(username)
+        for u in sala.users:
+            u.is_leader = u is leader
+        self._record("leader", sala.code, username)
+
+    async def handle_backend_event(self, codigo_sala, event):
+        # Eventos publicados por otros workers para una sala con usuarios en este worker
+        sala = self.rooms.get(codigo_sala)
+        if sala is None:
+            return
+
+        event_type = event.get("type")
+        if event_type == "frame":
+            if "to" in event:
+                # Mensaje dirigido a un único usuario (cartas del modo streaming)
+                user = sala.get_user_by_username(event["to"])
+                if user is not None:
+                    user.enqueue(Frame.from_text(event["text"]))
+            else:
+                sala.deliver_local(Frame.from_text(event["text"]))
+        elif event_type == "leader":
+            self._apply_leader(sala, event["username"])
+        elif event_type == "kick":
+            user = sala.get_user_by_username(event["username"])
+            if user is not None:
+                await self._kick_local_user(codigo_sala, sala, user)
+        elif event_type == "vote":
+            if sala.game is not None:
+                await sala.game.register_vote(event["username"], event["vote"], event["restaurant_id"])
+        elif event_type == "left":
+            if sala.game is not None:
+                await sala.game.check_results()
+        elif event_type == "game":
+            sala.remote_game = event["active"]
+
+    def _evict_slow_consumer(self, user: User):
+        # Cliente con la cola llena o bloqueado: cerrar su conexión y tratarlo como desconexión
+        SLOW_CONSUMERS.inc()
+        self._spawn(self._disconnect_slow_consumer(user))
+
+    def _connection_lost(self, user: User):
+        # Un envío ha fallado: la conexión está rota aunque el bucle de recepción aún no lo sepa
+        self._spawn(self._disconnect_slow_consumer(user))
+
+    async def _disconnect_slow_consumer(self, user: User):
+        await self.handle_disconnect(user.websocket)
+        await user.close_websocket()
+
+    async def send_reply(self, websocket, message):
+        # Las respuestas directas pasan por la cola del usuario para respetar el orden con los broadcasts
+        sala = self.get_room_by_websocket(websocket)
+        user = sala.get_user_by_websocket(websocket) if sala else None
+        if user is not None and not user.evicted:
+            user.enqueue(message)
+        elif isinstance(message, bytes):
+            await websocket.send_bytes(message)
+        else:
+            await websocket.send_text(message.text if isinstance(message, Frame) else message)
 
     async def remove_room(self, codigo_sala):
-        if codigo_sala in self.rooms:
-            del self.rooms[codigo_sala]
-            self.websocket_to_room = {ws: room for ws, room in self.websocket_to_room.items() if room != codigo_sala}
+        # Libera la sala en este worker; el estado compartido lo gestiona el backend
+        sala = self.rooms.pop(codigo_sala, None)
+        if sala is not None:
+            self._record("close", codigo_sala)
+            if sala.prefetch is not None:
+                sala.prefetch.cancel()
+                sala.prefetch = None
+            if sala.chat_flush is not None:
+                sala.chat_flush.cancel()
+                sala.chat_flush = None
+            # Si la sala sigue viva en otro worker, el backend rechazará el código al reutilizarlo
+            self.room_codes.release(codigo_sala)
+            # Solo se eliminan los websockets de esta sala, no se recorre el mapa global
+            for ws in sala.users_by_websocket:
+                if self.websocket_to_room.get(ws) == codigo_sala:
+                    del self.websocket_to_room[ws]
+            await self.backend.unsubscribe(codigo_sala)
 
     async def broadcast_chat_message(self, sender: str, content: str, websocket):
         # Obtener la sala del usuario que realiza la solicitud
@@ -184,11 +386,347 @@ class RoomManager:
         if not sala:
             return f"1000Error: La sala con código {roomCode} no existe."
 
-        await sala.broadcast_message(sender, content)
+        if self.chat_window > 0:
+            await sala.queue_chat_message(sender, content, self.chat_window, self.chat_max_batch)
+        else:
+            await sala.broadcast_message(sender, content)
         return "0000"
 
+    async def prefetch_restaurants(self, websocket, location: str, offline: bool = False):
+        # Precargar restaurantes mientras la sala se llena: "7lat,lng"
+        room = self.get_room_by_websocket(websocket)
+        if not room:
+            return "1000ERROR: Room not found."
+
+        acting_user = room.get_user_by_websocket(websocket)
+        if not acting_user or not acting_user.is_leader:
+            return "1000ERROR: Only the leader can prefetch restaurants."
+        if room.game or room.remote_game:
+            return "1000ERROR: Game already started."
+
+        if not offline:
+            try:
+                prefetch = RestaurantPrefetch(location)
+            except ValueError:
+                return "1000ERROR: Invalid location."
+            # Una nueva ubicación sustituye a la precarga anterior
+            if room.prefetch is not None:
+                room.prefetch.cancel()
+            room.prefetch = prefetch
+        return "0000PREFETCHING"
+
+    async def register_vote(self, websocket, vote, restaurant_id):
+        # Votar: la partida puede estar gestionada por este worker o por otro
+        room = self.get_room_by_websocket(websocket)
+        if not room or not (room.game or room.remote_game):
+            return "ERROR: Room or Game not found."
+
+        acting_user = room.get_user_by_websocket(websocket)
+        if not acting_user:
+            return "ERROR: User not found."
+
+        if room.game:
+            await room.game.register_vote(acting_user.username, vote, restaurant_id)
+        else:
+            await room.publish_event({
+                "type": "vote",
+                "username": acting_user.username,
+                "vote": vote,
+                "restaurant_id": restaurant_id
+            })
+        return "VOTE_REGISTERED"
+
+    async def resume_session(self, websocket, room_code: str, username: str, token: str,
+                             binary_frames: bool = False, compress_frames: bool = False,
+                             app_pings: bool = False):
+        """
+        Asocia una nueva conexión al usuario de la sala que tenga ese nombre y token,
+        conservando su liderazgo y sus votos (p. ej. tras restaurar un snapshot).
+        """
+        if websocket in self.websocket_to_room:
+            codigo_sala = self.websocket_to_room[websocket]
+            return f"1000Error: El WebSocket ya tiene asignada la sala {codigo_sala}."
+
+        sala = self.rooms.get(room_code)
+        user = sala.get_user_by_username(username) if sala is not None else None
+        if user is None or not user.resume_token or not secrets.compare_digest(user.resume_token, token or ""):
+            return "1000Error: No se puede reanudar la sesión."
+
+        old_websocket = user.websocket
+        if not user.detached:
+            # La conexión anterior sigue abierta (el cliente no vio que se cortó): se sustituye
+            user.stop()
+            self._spawn(_close_websocket(old_websocket))
+        sala.reattach_user(user, websocket)
+        self.websocket_to_room.pop(old_websocket, None)
+        self.websocket_to_room[websocket] = room_code
+        user.send_queue = None
+        user.writer_task = None
+        user.evicted = False
+        user.binary_frames = binary_frames
+        user.compress_frames = compress_frames
+        user.app_pings = app_pings
+        self.touch(websocket)
+        self._watch(user)
+        SESSIONS_RESUMED.inc()
+
+        # Ponerse al día con la partida en curso
+        if sala.game is not None:
+            for frame in sala.game.resync(username):
+                user.enqueue(frame)
+
+        user_list = await sala.member_names()
+        return f"0002{len(user_list)}{'.'.join(user_list)}"
+
+    def _start_snapshot(self):
+        # Desde la rueda de temporizadores: el snapshot no debe retrasar a los demás temporizadores
+        if self.snapshot_task is None:
+            self.snapshot_task = asyncio.create_task(self.snapshot())
+
+    async def snapshot(self, in_thread=True):
+        """
+        Guarda el estado de todas las salas de este worker. El estado se copia en el
+        event loop (consistente con el log) y se serializa y escribe en un hilo.
+        """
+        started = time.perf_counter()
+        try:
+            with paused_gc():
+                rooms = [
+                    [codigo_sala, [[u.username, u.resume_token, u.is_leader] for u in sala.users],
+                     sala.game.snapshot() if sala.game is not None and not sala.game.game_ended else None]
+                    for codigo_sala, sala in self.rooms.items()
+                ]
+            seq = self.journal.cut()
+            # El log cortado debe estar completo en disco antes de que el snapshot lo borre
+            await self.journal.flush(in_thread)
+            if in_thread:
+                await asyncio.to_thread(self.journal.write_snapshot, seq, rooms)
+            else:
+                self.journal.write_snapshot(seq, rooms)
+        except Exception:
+            logger.exception("No se pudo guardar el snapshot de salas")
+        finally:
+            if self.snapshot_task is asyncio.current_task():
+                self.snapshot_task = None
+        SNAPSHOT_DURATION.observe(time.perf_counter() - started)
+
+    def _restore_room(self, codigo_sala):
+        sala = Room(codigo_sala, self.backend)
+        self.rooms[codigo_sala] = sala
+        self.room_codes.reserve(codigo_sala)
+        return sala
+
+    def _restore_user(self, sala, username, token, is_leader):
+        # Sin conexión hasta que el cliente reanude la sesión con su token
+        user = User(DetachedSocket(), on_slow_consumer=self._evict_slow_consumer,
+                    on_connection_lost=self._connection_lost)
+        user.username = username
+        user.resume_token = token
+        user.is_leader = is_leader
+        sala.add_user(user)
+
+    def _replay(self, kind, codigo_sala, args, at, game_times):
+        # Aplica un cambio del log sobre las salas restauradas (sin backend ni mensajes)
+        if kind == "open":
+            if codigo_sala not in self.rooms:
+                self._restore_room(codigo_sala)
+            return
+        sala = self.rooms.get(codigo_sala)
+        if sala is None:
+            return
+        game = sala.game
+        if kind == "close":
+            del self.rooms[codigo_sala]
+            self.room_codes.release(codigo_sala, cooldown=0)
+        elif kind == "join":
+            self._restore_user(sala, *args)
+        elif kind == "leave":
+            user = sala.get_user_by_username(args[0])
+            if user is not None:
+                sala.remove_user(user)
+        elif kind == "leader":
+            leader = sala.get_user_by_username(args[0])
+            for u in sala.users:
+                u.is_leader = u is leader
+        elif kind == "game":
+            sala.game = Game.from_snapshot(sala, args[0], timers=self.timers)
+            game_times[codigo_sala] = at
+        elif game is None:
+            return
+        elif kind == "restaurants":
+            game._append_restaurants([Restaurant(*r) for r in args[0]])
+        elif kind == "vote":
+            game._apply_vote(*args)
+        elif kind == "cards":
+            game.cursors[args[0]] = args[1]
+        elif kind == "participants":
+            game.participants, game.pending = _mask_in(args[0]), _mask_in(args[1])
+        elif kind == "end":
+            sala.game = None
+
+    async def restore(self):
+        """
+        Reconstruye las salas y partidas del último snapshot más los cambios del log.
+        Los usuarios quedan sin conexión hasta que reanudan la sesión; si no lo hacen
+        en HEARTBEAT_TIMEOUT, el reaper los trata como desconectados.
+        """
+        started = time.perf_counter()
+        with paused_gc():
+            games, changes = await self._restore()
+        if self.rooms or changes:
+            logger.info("Restauradas %d salas y %d partidas (%d cambios del log) en %.2fs",
+                        len(self.rooms), games, changes, time.perf_counter() - started)
+            # Compactar: el siguiente arranque solo necesitará este snapshot
+            await self.snapshot(in_thread=False)
+
+    async def _restore(self):
+        rooms, saved_at, deltas = self.journal.load()
+        game_times = {}  # {codigo_sala: hora a la que corresponde el tiempo de partida guardado}
+        for codigo_sala, users, game_state in rooms:
+            sala = self._restore_room(codigo_sala)
+            for user_state in users:
+                self._restore_user(sala, *user_state)
+            if game_state is not None:
+                sala.game = Game.from_snapshot(sala, game_state, timers=self.timers)
+                game_times[codigo_sala] = saved_at
+        for at, (kind, codigo_sala, *args) in deltas:
+            self._replay(kind, codigo_sala, args, at, game_times)
+        # El tiempo de partida cuenta hasta el último cambio guardado, no durante la parada
+        last_change = deltas[-1][0] if deltas else saved_at
+
+        now = self.timers.clock()
+        games = 0
+        for codigo_sala, sala in list(self.rooms.items()):
+            if sala.is_empty():
+                del self.rooms[codigo_sala]
+                self.room_codes.release(codigo_sala, cooldown=0)
+                continue
+            sala.journal = self.journal
+            sala.last_activity = now
+            # Con un backend compartido la sala puede seguir existiendo: entonces ya tiene sus miembros
+            claimed = await self.backend.claim_room(codigo_sala)
+            await self.backend.subscribe(codigo_sala)
+            for user in sala.users:
+                user.last_seen = now
+                self._watch(user)
+                self.websocket_to_room[user.websocket] = codigo_sala
+                if claimed:
+                    await self.backend.add_member(codigo_sala, user.username)
+                if user.is_leader and claimed:
+                    await self.backend.set_leader(codigo_sala, user.username)
+            game = sala.game
+            if game is not None:
+                offset = max(last_change - game_times[codigo_sala], 0.0) if last_change else 0.0
+                game.timer_origin -= offset
+                game.started_at -= offset
+                await game._save_game(game.restaurants)
+                await game.resume()
+                games += 1
+
+        return games, len(deltas)
+
+    def touch(self, websocket):
+        # Registrar actividad del cliente (cualquier mensaje recibido cuenta como pong)
+        sala = self.get_room_by_websocket(websocket)
+        if sala is None:
+            return
+        now = self.timers.clock()
+        sala.last_activity = now
+        user = sala.get_user_by_websocket(websocket)
+        if user is not None:
+            user.last_seen = now
+
+    def _watch(self, user: User):
+        """
+        Programa en la rueda de temporizadores el plazo de silencio de una conexión. La
+        comprobación solo vuelve a mirar last_seen cuando vence, así recibir mensajes no
+        reprograma nada y no hay que recorrer todas las conexiones periódicamente.
+        """
+        if user.heartbeat is not None:
+            user.heartbeat.cancel()
+            user.heartbeat = None
+        if user.app_pings or (user.detached and HEARTBEAT_TIMEOUT):
+            user.heartbeat = self.timers.schedule(HEARTBEAT_INTERVAL, self._check_heartbeat, user)
+
+    async def _check_heartbeat(self, user: User):
+        codigo_sala = self.websocket_to_room.get(user.websocket)
+        sala = self.rooms.get(codigo_sala) if codigo_sala is not None else None
+        if sala is None or sala.get_user_by_websocket(user.websocket) is not user:
+            user.heartbeat = None  # Ya no está en la sala
+            return
+
+        now = self.timers.clock()
+        idle = now - user.last_seen
+        if HEARTBEAT_TIMEOUT and idle > HEARTBEAT_TIMEOUT:
+            # Conexión muda: se trata como una desconexión normal (reasignando el liderazgo)
+            user.heartbeat = None
+            REAPED_CONNECTIONS.inc()
+            REAPED_BYTES.inc(deep_sizeof(user))
+            await self._disconnect_slow_consumer(user)
+            return
+
+        if idle >= HEARTBEAT_INTERVAL:
+            if user.app_pings and not user.detached:
+                user.enqueue(encode_frame("PING"))
+                HEARTBEAT_PINGS.inc()
+            delay = HEARTBEAT_INTERVAL
+        else:
+            delay = HEARTBEAT_INTERVAL - idle
+        if HEARTBEAT_TIMEOUT:
+            delay = min(delay, HEARTBEAT_TIMEOUT - idle)
+        user.heartbeat = self.timers.schedule(delay, self._check_heartbeat, user)
+
+    async def reap(self):
+        """
+        Tarea periódica: renueva en el backend el alquiler de las salas de este worker y
+        elimina las salas sin actividad. Devuelve los bytes estimados liberados. Las
+        conexiones mudas las cierra su propio temporizador (ver _watch).
+        """
+        try:
+            await self.backend.refresh(list(self.rooms))
+        except Exception:
+            logger.exception("No se pudo renovar el alquiler de las salas en el backend")
+
+        now = self.timers.clock()
+        idle_rooms = [
+            codigo_sala for codigo_sala, sala in self.rooms.items()
+            if sala.game is None and not sala.remote_game and now - sala.last_activity > ROOM_IDLE_TIMEOUT
+        ]
+
+        reclaimed = 0
+        for codigo_sala in idle_rooms:
+            reclaimed += deep_sizeof(self.rooms[codigo_sala])
+            await self.expire_room(codigo_sala)
+
+        REAPED_ROOMS.inc(len(idle_rooms))
+        REAPED_BYTES.inc(reclaimed)
+        if idle_rooms:
+            logger.info("Reaper: %d salas inactivas cerradas (~%d bytes liberados)", len(idle_rooms), reclaimed)
+        return reclaimed
+
+    async def expire_room(self, codigo_sala):
+        # Cerrar una sala inactiva: avisar, cerrar las conexiones locales y liberar su estado
+        sala = self.rooms.get(codigo_sala)
+        if sala is None:
+            return
+        await sala.notify_room_closed()
+        for user in sala.users:
+            user.close()
+            await self.backend.remove_member(codigo_sala, user.username)
+        await self.remove_room(codigo_sala)
+        if not await self.backend.members(codigo_sala):
+            ROOMS_CLOSED.inc()
+            await self.backend.delete_room(codigo_sala)
+
     def get_room_by_websocket(self, websocket):
         codigo_sala = self.websocket_to_room.get(websocket)
         if not codigo_sala:
             return None
         return self.rooms.get(codigo_sala)
+
+
+async def _close_websocket(websocket):
+    try:
+        await asyncio.wait_for(websocket.close(), SEND_TIMEOUT)
+    except Exception:
+        pass  # Ignorar errores si el websocket ya estaba cerrado
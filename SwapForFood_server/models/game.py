@@ -1,79 +1,417 @@
+import asyncio
+import logging
+import os
 import time
+import secrets
+from array import array
+from contextlib import aclosing
 from models.restaurant import Restaurant
-from utils.restaurant_fetcher import fetch_restaurants
-import asyncio
+from utils.restaurant_cache import stream_restaurants_cached
+from utils.frames import encode_frame, dumps_text
+from utils.timer_wheel import timer_wheel
+from utils.analytics import analytics_sink
+from utils.metrics import GAMES_STARTED, GAMES_FINISHED, GAMES_IN_PROGRESS, GAME_DURATION, VOTES, PREFETCHES
+
+logger = logging.getLogger(__name__)
+
+# Modo streaming: cada usuario recibe las cartas en lotes pequeños a medida que vota
+GAME_STREAM_MODE = os.getenv("GAME_STREAM_MODE", "0") == "1"  # Modo por defecto de las partidas
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "2"))  # Cartas por envío
+STREAM_REFILL_AT = int(os.getenv("STREAM_REFILL_AT", "1"))  # Enviar más cuando le queden estas cartas sin votar
+STREAM_VOTE_TIMEOUT = float(os.getenv("STREAM_VOTE_TIMEOUT", "30"))  # Segundos sin votos antes de terminar
+
+
+def _mask_out(mask: int):
+    # Las máscaras de más de 63 usuarios no caben en un entero de MessagePack
+    return mask if mask < 1 << 63 else format(mask, "x")
+
+
+def _mask_in(value) -> int:
+    return int(value, 16) if isinstance(value, str) else value
+
 
 class Game:
-    def __init__(self, leader_location, room, offline=False):
+    __slots__ = (
+        "game_id", "leader_location", "room", "restaurants", "restaurant_index", "total_votes_needed",
+        "timers", "timer", "timer_origin", "game_ended", "streaming", "stream_task", "stream_mode", "cursors", "card_frames", "offline", "started", "started_at", "votes_cast",
+        "user_slots", "slot_names", "voted", "liked", "vote_counts", "participants", "pending"
+    )
+
+    def __init__(self, leader_location, room, offline=False, timers=None, stream_mode=None):
+        self.game_id = None  # Identificador de la partida en la analítica (ver utils/analytics.py)
         self.leader_location = leader_location
         self.room = room
         self.restaurants = []
-        self.votes = {}
+        self.restaurant_index = {}  # {restaurant_id: posición en restaurants}
         self.total_votes_needed = 0
-        self.timer_task = None
+        self.timers = timers if timers is not None else timer_wheel  # Rueda de temporizadores compartida
+        self.timer = None
+        self.timer_origin = 0.0  # Reloj de timers al empezar la partida
         self.game_ended = False
+        self.streaming = False  # Todavía pueden llegar más restaurantes
+        self.stream_task = None
+        self.stream_mode = GAME_STREAM_MODE if stream_mode is None else stream_mode
+        self.cursors = array("H")  # Por bit: cartas ya enviadas al usuario (modo streaming)
+        self.card_frames = {}  # {(desde, hasta): Frame}, compartidos por los usuarios con el mismo cursor
         self.offline = offline
+        self.started = False
+        self.started_at = None
+        self.votes_cast = 0
+        # Cada usuario ocupa un bit; los votos se guardan como máscaras por restaurante
+        self.user_slots = {}  # {username: bit}
+        self.slot_names = []  # username de cada bit
+        self.voted = []  # Por restaurante: máscara de usuarios que ya han votado
+        self.liked = []  # Por restaurante: máscara de usuarios que dieron like
+        self.vote_counts = array("H")  # Por bit: votos emitidos por el usuario
+        self.participants = 0  # Máscara de usuarios presentes al empezar la partida
+        self.pending = 0  # Máscara de participantes que aún no han votado todos los restaurantes
+
+    def _journal(self, kind, *args):
+        # Registrar el cambio en el log de snapshots (ver utils/snapshots.py)
+        journal = self.room.journal
+        if journal is not None:
+            journal.record(kind, self.room.code, *args)
+
+    def snapshot(self) -> list:
+        """
+        Estado de la partida para el snapshot de salas (ver RoomManager.snapshot).
+        """
+        return [
+            self.leader_location, self.offline, self.stream_mode, self._elapsed(),
+            [[r.id, r.name, r.rating, r.distance, r.photo_url] for r in self.restaurants],
+            self.slot_names, [_mask_out(m) for m in self.voted], [_mask_out(m) for m in self.liked],
+            list(self.vote_counts), list(self.cursors), _mask_out(self.participants), _mask_out(self.pending),
+            self.votes_cast, self.game_id
+        ]
+
+    @classmethod
+    def from_snapshot(cls, room, state, timers=None):
+        (leader_location, offline, stream_mode, elapsed, restaurants, slot_names, voted, liked,
+         vote_counts, cursors, participants, pending, votes_cast, game_id) = state
+        game = cls(leader_location, room, offline=offline, timers=timers, stream_mode=stream_mode)
+        game.game_id = game_id
+        game.started = True
+        game.started_at = time.monotonic() - elapsed
+        game.timer_origin = game.timers.clock() - elapsed
+        for slot, username in enumerate(slot_names):
+            game.user_slots[username] = slot
+        game.slot_names = list(slot_names)
+        game._append_restaurants([Restaurant(*r) for r in restaurants])
+        game.voted = [_mask_in(m) for m in voted]
+        game.liked = [_mask_in(m) for m in liked]
+        game.vote_counts = array("H", vote_counts)
+        game.cursors = array("H", cursors)
+        game.participants = _mask_in(participants)
+        game.pending = _mask_in(pending)
+        game.votes_cast = votes_cast
+        game.total_votes_needed = game.participants.bit_count() * len(game.restaurants)
+        return game
+
+    async def resume(self):
+        """
+        Reanuda una partida restaurada: vuelve a programar su fin. Las páginas de
+        restaurantes que faltaban por llegar se pierden con el reinicio.
+        """
+        GAMES_IN_PROGRESS.inc()
+        for slot in range(len(self.slot_names)):
+            if self.vote_counts[slot] >= len(self.restaurants):
+                self.pending &= ~(1 << slot)
+        if not self.pending or not self.restaurants:
+            await self.end_game()
+        elif self.stream_mode:
+            self._schedule_end(STREAM_VOTE_TIMEOUT)
+        else:
+            self._schedule_end()
+
+    def resync(self, username) -> list:
+        """
+        Frames para ponerse al día tras reanudar la sesión: el inicio de la partida y
+        las cartas que ya se le habían enviado.
+        """
+        slot = self.user_slots.get(username)
+        sent = self.cursors[slot] if self.stream_mode and slot is not None else len(self.restaurants)
+        frames = [encode_frame("GAME_START.")]
+        if sent:
+            restaurants_data = dumps_text([r.to_dict() for r in self.restaurants[:sent]])
+            frames.append(encode_frame(f"NEW_RESTAURANT.{restaurants_data}", id=sent))
+        return frames
+
+    def voted_by(self, username) -> list:
+        slot = self.user_slots.get(username)
+        if slot is None:
+            return []
+        return [r.id for r, mask in zip(self.restaurants, self.voted) if mask >> slot & 1]
+
+    def _slot_for(self, username) -> int:
+        slot = self.user_slots.get(username)
+        if slot is None:
+            slot = len(self.slot_names)
+            self.user_slots[username] = slot
+            self.slot_names.append(username)
+            self.vote_counts.append(0)
+            self.cursors.append(0)
+        return slot
+
+    def _names_in(self, mask: int) -> list:
+        return [name for slot, name in enumerate(self.slot_names) if mask >> slot & 1]
+
+    @property
+    def results(self) -> dict:
+        # {nombre_restaurante: usernames que dieron like}
+        return {r.name: self._names_in(self.liked[i]) for i, r in enumerate(self.restaurants)}
 
     async def start(self):
-        # Obtener restaurantes (offline o usando la API real)
-        raw_restaurants = fetch_restaurants(self.leader_location, offline=self.offline)
-        self.restaurants = [Restaurant(**r.to_dict()) for r in raw_restaurants]
-
-        for r in self.restaurants:
-            self.votes[r.id] = {}
-
-        num_users = len(self.room.users)
-        num_restaurants = len(self.restaurants)
-        self.total_votes_needed = num_users * num_restaurants
-
-        await self.room.broadcast_json({
-            "id": 0,
-            "message": "GAME_START.",
-            "timestamp": int(time.time() * 1000)
-        })
-
-        restaurants_data = [r.to_dict() for r in self.restaurants]
-        await self.room.broadcast_json({
-            "id": num_restaurants,
-            "message": f"NEW_RESTAURANT.{restaurants_data}",
-            "timestamp": int(time.time() * 1000)
-        })
-
-        self.timer_task = asyncio.create_task(self.end_game_in_x_seconds(num_restaurants))
-
-    async def end_game_in_x_seconds(self, num_restaurants):
-        await asyncio.sleep(num_restaurants * 10)
-        if not self.game_ended:
+        # La precarga de la sala solo ha calentado la caché: la búsqueda es siempre la misma
+        # (offline o usando la API real) y encuentra sus páginas en caché o en curso
+        prefetch, self.room.prefetch = self.room.prefetch, None
+        if prefetch is not None:
+            prefetch.take(self.leader_location)
+        elif not self.offline:
+            PREFETCHES.inc(result="none")
+        batches = stream_restaurants_cached(self.leader_location, offline=self.offline)
+
+        # En modo streaming el primer lote se espera antes de anunciar la partida y los
+        # siguientes se envían en segundo plano a medida que llegan las páginas de resultados.
+        # Si no, los clientes (los legados esperan un único NEW_RESTAURANT) reciben todo de una
+        # vez: stream_candidates deja de paginar en cuanto el top-k ya no puede cambiar
+        try:
+            if self.stream_mode:
+                first_batch = await anext(batches, [])
+            else:
+                first_batch = await self._collect(batches)
+        except BaseException:
+            await batches.aclose()
+            raise
+
+        for username in await self.room.member_names():
+            self.participants |= 1 << self._slot_for(username)
+        self.pending = self.participants
+        self.started = True
+        self.started_at = time.monotonic()
+        self.timer_origin = self.timers.clock()
+        GAMES_STARTED.inc()
+        GAMES_IN_PROGRESS.inc()
+        self.game_id = secrets.token_hex(8)
+        self._journal("game", self.snapshot())
+        analytics_sink.emit("game", self.game_id, self.room.code, time.time(), self.offline, self.stream_mode,
+                            self.participants.bit_count())
+
+        # Registrar la partida en el estado compartido para que otros workers le reenvíen los votos
+        await self._save_game(first_batch)
+        await self.room.publish_event({"type": "game", "active": True})
+
+        await self.room.broadcast(encode_frame("GAME_START."))
+        await self._add_restaurants(first_batch)
+        if self.stream_mode:
+            # Las primeras cartas ya salieron con _add_restaurants
+            self._schedule_end(STREAM_VOTE_TIMEOUT)
+
+        self.streaming = True
+        if self.offline or not self.stream_mode:
+            # Lote único: no hay páginas pendientes que esperar
+            await self._stream_remaining(batches, len(first_batch))
+        else:
+            self.stream_task = asyncio.create_task(self._stream_remaining(batches, len(first_batch)))
+
+    async def _collect(self, batches) -> list:
+        restaurants = []
+        try:
+            async for batch in batches:
+                restaurants.extend(batch)
+        except Exception as e:
+            if not restaurants:
+                raise
+            # Se juega con los restaurantes que ya llegaron
+            logger.warning("Error al obtener más restaurantes para la sala %s: %s", self.room.code, e)
+        return restaurants
+
+    async def _stream_remaining(self, batches, first_count):
+        async with aclosing(batches):
+            try:
+                async for batch in batches:
+                    if self.game_ended:
+                        return
+                    await self._add_restaurants(batch)
+            except Exception as e:
+                # Se juega con los restaurantes que ya se enviaron
+                logger.warning("Error al obtener más restaurantes para la sala %s: %s", self.room.code, e)
+            finally:
+                self.streaming = False
+                self.stream_task = None
+
+        if self.game_ended:
+            return
+        if len(self.restaurants) > first_count:
+            await self._save_game(self.restaurants)
+        if not self.restaurants:
+            self._schedule_end(0)
+        # Quien ya votó todos los restaurantes mientras llegaban lotes ha terminado
+        for slot in range(len(self.slot_names)):
+            if self.vote_counts[slot] >= len(self.restaurants):
+                self.pending &= ~(1 << slot)
+        if not self.pending:
             await self.end_game()
 
-    async def register_vote(self, username, vote, restaurant_id):
-        if restaurant_id not in self.votes:
+    async def _save_game(self, restaurants):
+        if self.room.backend is not None:
+            await self.room.backend.save_game(self.room.code, {
+                "leader_location": self.leader_location,
+                "restaurants": [r.id for r in restaurants]
+            })
+
+    def _append_restaurants(self, batch) -> list:
+        # Places puede repetir un restaurante entre páginas. Devuelve los que son nuevos
+        batch = [r for r in batch if r.id not in self.restaurant_index]
+        for r in batch:
+            self.restaurant_index[r.id] = len(self.restaurants)
+            self.restaurants.append(r)
+            self.voted.append(0)
+            self.liked.append(0)
+        self.total_votes_needed = self.participants.bit_count() * len(self.restaurants)
+        return batch
+
+    async def _add_restaurants(self, batch):
+        previous = len(self.restaurants)
+        batch = self._append_restaurants(batch)
+        if not batch:
+            return
+        self._journal("restaurants", [[r.id, r.name, r.rating, r.distance, r.photo_url] for r in batch])
+        analytics_sink.emit("restaurants", self.game_id, self._elapsed(), previous, [[r.id, r.name] for r in batch])
+
+        if self.stream_mode:
+            # Solo reciben cartas nuevas los participantes que ya tenían todas las anteriores
+            for slot in range(len(self.slot_names)):
+                if self.participants >> slot & 1 and self.cursors[slot] == previous:
+                    await self._send_cards(slot)
+            return
+
+        # La lista de restaurantes se envía como JSON real, serializada una sola vez por lote.
+        # id lleva el total de restaurantes enviados hasta ahora
+        restaurants_data = dumps_text([r.to_dict() for r in batch])
+        await self.room.broadcast(encode_frame(f"NEW_RESTAURANT.{restaurants_data}", id=len(self.restaurants)))
+        self._schedule_end()
+
+    def _elapsed(self) -> float:
+        # Segundos desde el inicio de la partida (se conservan al restaurar un snapshot)
+        return self.timers.clock() - self.timer_origin
+
+    def _schedule_end(self, delay=None):
+        # Por defecto, 10 segundos por restaurante desde el inicio de la partida
+        if self.timer is not None:
+            self.timer.cancel()
+        if delay is None:
+            delay = len(self.restaurants) * 10 - self._elapsed()
+        self.timer = self.timers.schedule(max(delay, 0), self.end_game)
+
+    async def _send_cards(self, slot):
+        # Envía al usuario el siguiente lote de cartas a partir de su cursor
+        start = self.cursors[slot]
+        end = min(start + STREAM_BATCH_SIZE, len(self.restaurants))
+        if end <= start:
             return
+        frame = self.card_frames.get((start, end))
+        if frame is None:
+            restaurants_data = dumps_text([r.to_dict() for r in self.restaurants[start:end]])
+            frame = encode_frame(f"NEW_RESTAURANT.{restaurants_data}", id=end)
+            self.card_frames[(start, end)] = frame
+        self.cursors[slot] = end
+        self._journal("cards", slot, end)
+        await self.room.send_to(self.slot_names[slot], frame)
+
+    def _has_match(self) -> bool:
+        # Algún restaurante con like de todos los participantes que siguen en la sala
+        participants = self.participants
+        return bool(participants) and any(liked & participants == participants for liked in self.liked)
 
-        if username not in self.votes[restaurant_id]:
-            self.votes[restaurant_id][username] = vote
+    def _apply_vote(self, username, vote, restaurant_id):
+        # Anota el voto en las máscaras. Devuelve (índice, bit) o None si no cuenta
+        index = self.restaurant_index.get(restaurant_id)
+        if index is None:
+            return None
+        slot = self._slot_for(username)
+        bit = 1 << slot
+        if self.voted[index] & bit:
+            return None
+        if self.stream_mode and index >= self.cursors[slot]:
+            return None  # Carta que todavía no se le ha enviado
 
-            total_cast_votes = sum(len(user_votes) for user_votes in self.votes.values())
+        self.voted[index] |= bit
+        self.votes_cast += 1
+        if vote == '0':
+            self.liked[index] |= bit
+        self.vote_counts[slot] += 1
+        return index, bit
+
+    async def register_vote(self, username, vote, restaurant_id):
+        applied = self._apply_vote(username, vote, restaurant_id)
+        if applied is None:
+            return
+        index, bit = applied
+        slot = self.user_slots[username]
+        VOTES.inc()
+        self._journal("vote", username, vote, restaurant_id)
+        analytics_sink.emit("vote", self.game_id, username, restaurant_id, int(vote == '0'), self._elapsed())
+
+        if self.stream_mode:
+            # Coincidencia unánime: no hace falta seguir votando
+            if vote == '0' and self.liked[index] & self.participants == self.participants:
+                await self.end_game()
+                return
+            self._schedule_end(STREAM_VOTE_TIMEOUT)
+            if self.cursors[slot] - self.vote_counts[slot] <= STREAM_REFILL_AT:
+                await self._send_cards(slot)
 
-            if total_cast_votes >= self.total_votes_needed:
-                if self.timer_task:
-                    self.timer_task.cancel()
+        if self.vote_counts[slot] == len(self.restaurants) and not self.streaming:
+            self.pending &= ~bit
+            if not self.pending:
                 await self.end_game()
 
+    async def check_results(self):
+        """
+        Recalcula los votos necesarios tras la salida de usuarios y termina la
+        partida si todos los participantes que quedan ya han votado.
+        """
+        if self.game_ended or not self.started:
+            return
+
+        remaining = 0
+        for username in await self.room.member_names():
+            slot = self.user_slots.get(username)
+            if slot is not None:
+                remaining |= 1 << slot
+        if self.participants & ~remaining:
+            self.participants &= remaining
+            self.pending &= remaining
+            self._journal("participants", _mask_out(self.participants), _mask_out(self.pending))
+        self.total_votes_needed = self.participants.bit_count() * len(self.restaurants)
+
+        if not self.pending or (self.stream_mode and self._has_match()):
+            await self.end_game()
+
     async def end_game(self):
         if self.game_ended:
             return
         self.game_ended = True
+        self._journal("end")
+
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.stream_task is not None and self.stream_task is not asyncio.current_task():
+            self.stream_task.cancel()
 
-        results = {}
-        for r in self.restaurants:
-            likes = [user for user, v in self.votes[r.id].items() if v == '0']
-            results[r.name] = likes
+        if self.started_at is not None:
+            GAMES_FINISHED.inc()
+            GAMES_IN_PROGRESS.dec()
+            GAME_DURATION.observe(time.monotonic() - self.started_at)
 
-        await self.room.broadcast_json({
-            "id": 0,
-            "message": f"GAME_RESULTS.{results}",
-            "timestamp": int(time.time() * 1000)
-        })
+        await self.room.broadcast(encode_frame(f"GAME_RESULTS.{self.results}"))
+        if self.started:
+            analytics_sink.emit("end", self.game_id, time.time(), self._elapsed(), self.participants.bit_count(),
+                                self.votes_cast, [[r.id, self.liked[i].bit_count(), self.voted[i].bit_count()]
+                                                  for i, r in enumerate(self.restaurants)])
 
         self.room.game = None
+        if self.room.backend is not None:
+            await self.room.backend.delete_game(self.room.code)
+        await self.room.publish_event({"type": "game", "active": False})
@@ -1,4 +1,6 @@
 class Restaurant:
+    __slots__ = ("id", "name", "rating", "distance", "photo_url")
+
     def __init__(self, id: str, name: str, rating: str = "N/A", distance: str = "", photo_url: str = ""):
         self.id = id
         self.name = name
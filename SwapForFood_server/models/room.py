@@ -1,101 +1,178 @@
-import json
+import asyncio
+import logging
 import time
-from typing import List
+from typing import Dict, List
 from .user import User
+from utils.frames import Frame, encode_frame, dumps_text
+from utils.metrics import BROADCASTS, BROADCAST_RECIPIENTS, BROADCAST_DURATION
+
+logger = logging.getLogger(__name__)
 
 class Room:
-    def __init__(self):
-        self.users: List[User] = []
+    __slots__ = (
+        "code", "backend", "journal", "users", "game", "remote_game", "last_activity", "prefetch", "rate_buckets",
+        "chat_buffer", "chat_flush", "chat_tasks",
+        "users_by_websocket", "users_by_username"
+    )
+
+    def __init__(self, code: str = None, backend=None):
+        self.code = code
+        self.backend = backend  # Estado compartido entre workers (ver backends/)
+        self.journal = None  # Log de cambios para los snapshots (ver utils/snapshots.py)
+        self.users: List[User] = []  # Solo los usuarios conectados a este worker
         self.game = None  # Agregamos este atributo para almacenar la instancia del juego.
+        self.remote_game = False  # Hay una partida en curso gestionada por otro worker
+        self.last_activity = 0.0  # Último comando recibido en la sala (reloj de RoomManager.timers)
+        self.prefetch = None  # Búsqueda de restaurantes lanzada antes de empezar la partida
+        self.rate_buckets = {}  # Límites de frecuencia compartidos por la sala (ver utils/rate_limit.py)
+        self.chat_buffer = None  # Mensajes de chat pendientes de enviar agrupados [(sender, content)]
+        self.chat_flush = None  # Envío programado de chat_buffer (asyncio.TimerHandle)
+        self.chat_tasks = None  # Envíos de chat_buffer en curso; se crea con el primero
+        # Índices para búsquedas O(1) junto a la lista ordenada de usuarios
+        self.users_by_websocket: Dict[object, User] = {}
+        self.users_by_username: Dict[str, User] = {}
 
     def add_user(self, user: User):
         self.users.append(user)
+        self.users_by_websocket[user.websocket] = user
+        # Con nombres repetidos se conserva el primero, como hacía la búsqueda lineal
+        self.users_by_username.setdefault(user.username, user)
 
     def remove_user(self, user: User):
-        if user in self.users:
+        if self.users_by_websocket.get(user.websocket) is user:
             self.users.remove(user)
+            del self.users_by_websocket[user.websocket]
+            if self.users_by_username.get(user.username) is user:
+                del self.users_by_username[user.username]
+                # Si había otro usuario con el mismo nombre, pasa a ser el indexado
+                for u in self.users:
+                    if u.username == user.username:
+                        self.users_by_username[u.username] = u
+                        break
             # Si era líder y quedan usuarios, reasignar liderazgo
             if user.is_leader and self.users:
                 self.users[0].is_leader = True
                 return self.users[0]
         return None
 
+    def reattach_user(self, user: User, websocket):
+        # Asocia al usuario una nueva conexión conservando su posición en la sala
+        del self.users_by_websocket[user.websocket]
+        user.websocket = websocket
+        self.users_by_websocket[websocket] = user
+
     def get_user_by_websocket(self, websocket):
-        for u in self.users:
-            if u.websocket == websocket:
-                return u
-        return None
+        return self.users_by_websocket.get(websocket)
 
     def get_user_by_username(self, username: str):
-        for u in self.users:
-            if u.username == username:
-                return u
-        return None
+        return self.users_by_username.get(username)
 
     def is_empty(self):
         return len(self.users) == 0
 
-    async def broadcast(self, message: str):
-        # Envía mensaje de texto a todos en la sala
+    async def member_names(self) -> List[str]:
+        # Miembros de la sala en todos los workers, en orden de llegada
+        if self.backend is not None:
+            return await self.backend.members(self.code)
+        return [u.username for u in self.users]
+
+    async def publish_event(self, event: dict):
+        if self.backend is not None:
+            await self.backend.publish(self.code, event)
+
+    def deliver_local(self, message, exclude_websocket=None):
+        # Encola el mensaje para los usuarios de este worker; cada uno lo envía desde su propia tarea.
+        # message puede ser un Frame ya serializado (compartido por todos), un str o bytes
         for u in self.users:
-            try:
-                await u.websocket.send_text(message)
-            except:
-                pass
+            if u.websocket != exclude_websocket:
+                u.enqueue(message)
+
+    async def broadcast(self, message, exclude_websocket=None):
+        start = time.perf_counter()
+        self.deliver_local(message, exclude_websocket)
+        BROADCASTS.inc()
+        BROADCAST_RECIPIENTS.inc(len(self.users))
+        # Reenviar a los usuarios de la sala conectados a otros workers
+        if self.backend is not None and self.backend.distributed:
+            await self.backend.publish(self.code, {
+                "type": "frame",
+                "text": message.text if isinstance(message, Frame) else message
+            })
+        BROADCAST_DURATION.observe(time.perf_counter() - start)
+
+    async def send_to(self, username: str, message: Frame):
+        # Envía un mensaje a un solo usuario, esté en este worker o en otro
+        user = self.users_by_username.get(username)
+        if user is not None:
+            user.enqueue(message)
+        elif self.backend is not None and self.backend.distributed:
+            await self.backend.publish(self.code, {"type": "frame", "text": message.text, "to": username})
 
     async def broadcast_json(self, data: dict):
-        msg = json.dumps(data)
-        await self.broadcast(msg)
+        await self.broadcast(Frame.from_obj(data))
 
     async def notify_room_closed(self):
         message = "ROOM_CLOSED"
-        response = json.dumps({
-            "id": 0,
-            "message": message,
-            "timestamp": int(time.time() * 1000)
-        })
+        response = encode_frame(message)
         await self.broadcast(response)
 
     async def notify_user_left(self, username: str):
         message = f"USER_LEFT.{username}"
-        response = json.dumps({
-            "id": 0,
-            "message": message,
-            "timestamp": int(time.time() * 1000)
-        })
+        response = encode_frame(message)
         await self.broadcast(response)
 
     async def notify_new_user(self, username: str, exclude_websocket):
         message = f"USER_JOINED.{username}"
-        response = json.dumps({
-            "id": 0,
-            "message": message,
-            "timestamp": int(time.time() * 1000)
-        })
-        for u in self.users:
-            if u.websocket != exclude_websocket:
-                try:
-                    await u.websocket.send_text(response)
-                except:
-                    pass
+        response = encode_frame(message)
+        await self.broadcast(response, exclude_websocket)
 
     async def notify_user_removed(self, user: User):
         message = "REMOVED"
-        response = json.dumps({
-            "id": 0,
-            "message": message,
-            "timestamp": int(time.time() * 1000)
-        })
-        try:
-            await user.websocket.send_text(response)
-            await user.websocket.close()
-        except:
-            pass
+        response = encode_frame(message)
+        user.enqueue(response)
+        user.close()
 
     async def broadcast_message(self, sender: str, content: str):
-        msg = json.dumps({
-            "id": 0,
-            "message": f"NEW_MESSAGE.{sender}:{content}",
-            "timestamp": int(time.time() * 1000)
-        })
-        await self.broadcast(msg)
\ No newline at end of file
+        await self.broadcast(encode_frame(f"NEW_MESSAGE.{sender}:{content}"))
+
+    async def queue_chat_message(self, sender: str, content: str, window: float, max_batch: int):
+        """
+        Acumula el mensaje y lo envía junto con los que lleguen durante los próximos
+        window segundos, o en cuanto haya max_batch mensajes. Se conserva el orden.
+        """
+        if self.chat_buffer is None:
+            self.chat_buffer = []
+        self.chat_buffer.append((sender, content))
+        if len(self.chat_buffer) >= max_batch:
+            await self.flush_chat()
+        elif self.chat_flush is None:
+            self.chat_flush = asyncio.get_running_loop().call_later(window, self._flush_chat_later)
+
+    def _flush_chat_later(self):
+        self.chat_flush = None
+        # Referencia propia hasta que termina: asyncio solo guarda referencias débiles a las tareas
+        if self.chat_tasks is None:
+            self.chat_tasks = set()
+        task = asyncio.create_task(self.flush_chat())
+        self.chat_tasks.add(task)
+        task.add_done_callback(self._chat_flushed)
+
+    def _chat_flushed(self, task):
+        self.chat_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Error enviando el chat de la sala %s", self.code, exc_info=task.exception())
+
+    async def flush_chat(self):
+        if self.chat_flush is not None:
+            self.chat_flush.cancel()
+            self.chat_flush = None
+        # Se vacía el buffer antes de cualquier await para que el orden no dependa de las tareas
+        batch, self.chat_buffer = self.chat_buffer, None
+        if not batch:
+            return
+        if len(batch) == 1:
+            # Un mensaje suelto sale en el formato de siempre
+            await self.broadcast_message(*batch[0])
+            return
+        messages = dumps_text([{"sender": sender, "content": content} for sender, content in batch])
+        await self.broadcast(encode_frame(f"NEW_MESSAGES.{messages}"))
\ No newline at end of file
@@ -1,5 +1,151 @@
+import os
+import asyncio
+from utils.frames import Frame
+
+# Tamaño máximo de la cola de salida de cada conexión y tiempo máximo por envío
+SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "64"))
+SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10.0"))  # segundos
+
+# Marca que indica al escritor que debe cerrar la conexión tras vaciar la cola
+_CLOSE = object()
+
+# Cierres lanzados sin esperar: asyncio solo guarda referencias débiles a las tareas
+_closing_tasks = set()
+
+
+class DetachedSocket:
+    """
+    Conexión de un usuario restaurado de un snapshot que todavía no ha reanudado su sesión.
+    """
+    __slots__ = ()
+
+    async def close(self):
+        pass
+
+
 class User:
-    def __init__(self, websocket):
+    __slots__ = (
+        "websocket", "username", "is_leader", "binary_frames", "compress_frames", "send_queue",
+        "writer_task", "on_slow_consumer", "on_connection_lost", "evicted", "last_seen", "resume_token",
+        "app_pings", "heartbeat"
+    )
+
+    def __init__(self, websocket, on_slow_consumer=None, binary_frames=False, compress_frames=False,
+                 on_connection_lost=None, app_pings=False):
         self.websocket = websocket
         self.username = None
         self.is_leader = False
+        self.binary_frames = binary_frames  # Protocolo v2 MessagePack: los broadcasts van en binario
+        self.compress_frames = compress_frames  # Protocolo v2 "+deflate": los frames grandes van comprimidos
+        # Cola de salida propia, vaciada por una tarea escritora independiente.
+        # Se crea con el primer mensaje: los usuarios inactivos no pagan su coste
+        self.send_queue = None
+        self.writer_task = None
+        self.on_slow_consumer = on_slow_consumer  # callback(user) si el cliente no da abasto
+        self.on_connection_lost = on_connection_lost  # callback(user) si un envío falla
+        self.evicted = False
+        self.last_seen = 0.0  # Último mensaje recibido del cliente (reloj de RoomManager.timers)
+        self.resume_token = None  # Secreto para reanudar la sesión desde otra conexión
+        self.app_pings = app_pings  # El cliente responde al PING de aplicación (protocolo v2)
+        self.heartbeat = None  # Próxima comprobación de silencio en la rueda de temporizadores
+
+    @property
+    def detached(self) -> bool:
+        return isinstance(self.websocket, DetachedSocket)
+
+    def enqueue(self, message) -> bool:
+        """
+        Encola un mensaje para este usuario sin bloquear. Si la cola está llena,
+        el cliente se considera lento y se expulsa.
+        """
+        if self.evicted or self.detached:
+            return False
+        if self.send_queue is None:
+            self.send_queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        try:
+            self.send_queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self._evict()
+            return False
+        if self.writer_task is None:
+            self.writer_task = asyncio.create_task(self._writer())
+        return True
+
+    def close(self):
+        """
+        Cierra la conexión después de enviar lo que ya estaba encolado.
+        """
+        if self.evicted or self.detached:
+            return
+        if self.send_queue is None:
+            self.send_queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        try:
+            self.send_queue.put_nowait(_CLOSE)
+        except asyncio.QueueFull:
+            self.stop()
+            task = asyncio.create_task(self.close_websocket())
+            _closing_tasks.add(task)
+            task.add_done_callback(_closing_tasks.discard)
+            return
+        if self.writer_task is None:
+            self.writer_task = asyncio.create_task(self._writer())
+
+    def stop(self):
+        """
+        Detiene la tarea escritora descartando los mensajes pendientes.
+        """
+        task = self.writer_task
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+        self.writer_task = None
+
+    async def _writer(self):
+        try:
+            while True:
+                message = await self.send_queue.get()
+                if message is _CLOSE:
+                    await self.close_websocket()
+                    return
+                if isinstance(message, Frame):
+                    message = message.wire(self.binary_frames, self.compress_frames)
+                try:
+                    # asyncio.timeout y no wait_for: en Python 3.11 wait_for puede perder una
+                    # cancelación que llega justo cuando termina el envío y el escritor no se detiene
+                    async with asyncio.timeout(SEND_TIMEOUT):
+                        if isinstance(message, bytes):
+                            await self.websocket.send_bytes(message)
+                        else:
+                            await self.websocket.send_text(message)
+                except TimeoutError:
+                    # El cliente lleva demasiado tiempo sin aceptar datos
+                    self._evict()
+                    return
+                except Exception:
+                    # Conexión rota: no esperar a que se llene la cola para darla por perdida
+                    self._lost()
+                    return
+        finally:
+            # Un escritor terminado no debe seguir figurando como activo
+            if self.writer_task is asyncio.current_task():
+                self.writer_task = None
+
+    async def close_websocket(self):
+        try:
+            async with asyncio.timeout(SEND_TIMEOUT):
+                await self.websocket.close()
+        except Exception:
+            pass  # Ignorar errores si el websocket ya estaba cerrado
+
+    def _evict(self):
+        if self.evicted:
+            return
+        self.evicted = True
+        if self.on_slow_consumer is not None:
+            self.on_slow_consumer(self)
+
+    def _lost(self):
+        if self.evicted:
+            return
+        self.evicted = True  # No se encolan más mensajes para esta conexión
+        if self.on_connection_lost is not None:
+            self.on_connection_lost(self)
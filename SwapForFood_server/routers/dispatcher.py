@@ -0,0 +1,158 @@
+import inspect
+import json
+from utils.frames import dumps_bytes, deflate_payload
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Subprotocolos negociados al conectar. Sin subprotocolo se usa el protocolo legado de texto.
+PROTOCOL_LEGACY = "legacy"
+PROTOCOL_JSON = "swapforfood.v2.json"
+PROTOCOL_MSGPACK = "swapforfood.v2.msgpack"
+# Variantes con frames comprimidos (ver Frame.wire): los mensajes grandes llegan en binario
+# con DEFLATE_MARKER delante; el cliente sigue enviando sin comprimir
+PROTOCOL_JSON_DEFLATE = "swapforfood.v2.json+deflate"
+PROTOCOL_MSGPACK_DEFLATE = "swapforfood.v2.msgpack+deflate"
+SUPPORTED_PROTOCOLS = (
+    (PROTOCOL_MSGPACK_DEFLATE, PROTOCOL_MSGPACK, PROTOCOL_JSON_DEFLATE, PROTOCOL_JSON) if msgpack
+    else (PROTOCOL_JSON_DEFLATE, PROTOCOL_JSON)
+)
+BINARY_PROTOCOLS = (PROTOCOL_MSGPACK, PROTOCOL_MSGPACK_DEFLATE)
+COMPRESSED_PROTOCOLS = (PROTOCOL_JSON_DEFLATE, PROTOCOL_MSGPACK_DEFLATE)
+
+
+def negotiate_protocol(offered) -> str:
+    """
+    Elige el protocolo v2 preferido entre los ofrecidos por el cliente (Sec-WebSocket-Protocol).
+    """
+    for protocol in SUPPORTED_PROTOCOLS:
+        if protocol in offered:
+            return protocol
+    return PROTOCOL_LEGACY
+
+
+class Connection:
+    """
+    Estado de una conexión websocket que reciben los handlers de comandos.
+    """
+    __slots__ = ("websocket", "protocol", "sender", "rate_buckets")
+
+    def __init__(self, websocket, protocol=PROTOCOL_LEGACY):
+        self.websocket = websocket
+        self.protocol = protocol
+        self.sender = "unknown"
+        self.rate_buckets = {}  # Límites de frecuencia de esta conexión (ver utils/rate_limit.py)
+
+    @property
+    def binary(self) -> bool:
+        return self.protocol in BINARY_PROTOCOLS
+
+    @property
+    def compressed(self) -> bool:
+        return self.protocol in COMPRESSED_PROTOCOLS
+
+    @property
+    def app_pings(self) -> bool:
+        # Los clientes legados no conocen el PING de aplicación: les basta el ping del protocolo websocket
+        return self.protocol != PROTOCOL_LEGACY
+
+
+class CommandReply:
+    __slots__ = ("message", "data", "ok")
+
+    def __init__(self, message: str, data: dict = None, ok: bool = None):
+        self.message = message  # Respuesta en el formato legado
+        self.data = data  # Campos tipados para el protocolo v2
+        self.ok = ok if ok is not None else not message.startswith(("1000", "ERROR"))
+
+
+class Command:
+    __slots__ = ("opcode", "name", "handler", "parse_legacy", "params")
+
+    def __init__(self, opcode, name, handler, parse_legacy):
+        self.opcode = opcode
+        self.name = name
+        self.handler = handler
+        self.parse_legacy = parse_legacy  # Convierte el resto del contenido legado en argumentos
+        # Argumentos que acepta el handler (además de la conexión), con su tipo anotado
+        self.params = dict(list(inspect.signature(handler, eval_str=True).parameters.items())[1:])
+
+    def accepts(self, name: str, value) -> bool:
+        """
+        Comprueba un argumento v2 contra la anotación del handler.
+        """
+        param = self.params[name]
+        if param.annotation is inspect.Parameter.empty:
+            return True
+        if value is None:
+            return param.default is None
+        return isinstance(value, param.annotation)
+
+
+class CommandDispatcher:
+    """
+    Tabla de comandos indexada por opcode (protocolo legado) y por nombre (protocolo v2).
+    Los opcodes legados se resuelven por el prefijo más largo registrado, así "21"
+    no depende del orden en que se comprueban los demás prefijos.
+    """
+
+    def __init__(self):
+        self.by_opcode = {}
+        self.by_name = {}
+        self.opcode_lengths = []  # Longitudes de opcode registradas, de mayor a menor
+
+    def command(self, opcode: str, name: str, parse_legacy=lambda rest: {}):
+        def decorator(handler):
+            cmd = Command(opcode, name, handler, parse_legacy)
+            self.by_opcode[opcode] = cmd
+            self.by_name[name] = cmd
+            self.opcode_lengths = sorted({len(op) for op in self.by_opcode}, reverse=True)
+            return handler
+        return decorator
+
+    def resolve_legacy(self, content: str):
+        """
+        Devuelve (comando, argumentos) para un contenido legado, o (None, None).
+        """
+        for length in self.opcode_lengths:
+            cmd = self.by_opcode.get(content[:length])
+            if cmd is not None:
+                return cmd, cmd.parse_legacy(content[length:])
+        return None, None
+
+    def resolve_v2(self, message: dict):
+        """
+        Devuelve (comando, argumentos) para un mensaje v2, o (None, None) si la operación
+        no existe. Los argumentos son None si alguno no tiene el tipo que espera el handler.
+        """
+        cmd = self.by_name.get(message.get("op"))
+        if cmd is None:
+            return None, None
+        args = message.get("args")
+        if not isinstance(args, dict):
+            return cmd, {}
+        # Ignorar argumentos que el handler no conoce
+        args = {k: v for k, v in args.items() if k in cmd.params}
+        if not all(cmd.accepts(k, v) for k, v in args.items()):
+            return cmd, None
+        return cmd, args
+
+
+def decode_v2(protocol: str, data) -> dict:
+    if protocol in BINARY_PROTOCOLS:
+        return msgpack.unpackb(data, raw=False)
+    return json.loads(data)
+
+
+def encode_v2(protocol: str, obj):
+    if protocol in BINARY_PROTOCOLS:
+        data = msgpack.packb(obj, use_bin_type=True)
+    else:
+        data = dumps_bytes(obj)
+    if protocol in COMPRESSED_PROTOCOLS:
+        deflated = deflate_payload(data)
+        if deflated is not None:
+            return deflated
+    return data if protocol in BINARY_PROTOCOLS else data.decode("utf-8")
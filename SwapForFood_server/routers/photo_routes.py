@@ -0,0 +1,60 @@
+# routers/photo_routes.py
+
+import os
+import httpx
+from fastapi import APIRouter, Request, Response
+from fastapi.responses import FileResponse
+from utils.photo_cache import photo_cache, snap_width, valid_reference, PhotoNotFound, PhotoFetchError
+
+router = APIRouter()
+
+PHOTO_MAX_AGE = int(os.getenv("PHOTO_MAX_AGE", "604800"))  # segundos que el cliente puede reutilizar una foto
+
+
+class _PinnedFileResponse(FileResponse):
+    """
+    FileResponse que mantiene la entrada fijada en la caché hasta terminar de
+    enviarla (o hasta que el cliente se desconecta), para que una expulsión
+    concurrente no borre el fichero a medias.
+    """
+
+    def __init__(self, entry, headers):
+        super().__init__(entry.path, media_type=entry.content_type, headers=headers)
+        self.entry = entry
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            photo_cache.release(self.entry)
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+@router.get("/photos/{reference}")
+async def photo(reference: str, request: Request, w: int = 400):
+    """
+    Proxy de fotos de Places: descarga cada referencia una sola vez, la guarda en
+    la caché de disco y la sirve en el ancho pedido sin exponer la API key.
+    """
+    if not valid_reference(reference) or w <= 0:
+        return Response(status_code=404)
+
+    try:
+        entry = await photo_cache.get(reference, snap_width(w), pin=True)
+    except PhotoNotFound:
+        return Response(status_code=404)
+    except (PhotoFetchError, httpx.HTTPError):
+        return Response(status_code=502)
+
+    # El contenido está direccionado por su hash, así que nunca cambia para un mismo ETag
+    etag = f'"{entry.digest}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={PHOTO_MAX_AGE}, immutable"}
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        photo_cache.release(entry)
+        return Response(status_code=304, headers=headers)
+    # FileResponse lee el fichero por bloques en lugar de cargarlo entero en memoria
+    return _PinnedFileResponse(entry, headers)
@@ -2,91 +2,284 @@
 
 import json
 import time
+import logging
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from managers.room_manager import RoomManager
 from models.game import Game
+from backends.factory import create_backend
+from routers.dispatcher import (
+    CommandDispatcher, CommandReply, Connection, PROTOCOL_LEGACY,
+    negotiate_protocol, decode_v2, encode_v2
+)
+from utils.frames import encode_frame
+from utils.restaurant_fetcher import OFFLINE_MODE
+from utils.metrics import registry, COMMANDS, COMMAND_DURATION
+from utils.rate_limit import RateLimiter
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-room_manager = RoomManager()
+room_manager = RoomManager(create_backend())
+dispatcher = CommandDispatcher()
+rate_limiter = RateLimiter(clock=room_manager.timers.clock)
+THROTTLED_ERROR = "1000Error: Demasiadas peticiones."
+
+registry.gauge("swapforfood_active_rooms", "Salas con usuarios en este worker",
+               func=lambda: len(room_manager.rooms))
+registry.gauge("swapforfood_connected_sockets", "Websockets asociados a una sala",
+               func=lambda: len(room_manager.websocket_to_room))
+
+
+def _resume_token(conn: Connection):
+    # Token para reanudar la sesión tras un corte o un reinicio del servidor.
+    # v2 lo recibe en la respuesta; el protocolo legado lo pide con el comando "9"
+    room = room_manager.get_room_by_websocket(conn.websocket)
+    user = room.get_user_by_websocket(conn.websocket) if room else None
+    return user.resume_token if user else None
+
+
+@dispatcher.command("0", "create_room", parse_legacy=lambda rest: {"username": rest})
+async def create_room(conn: Connection, username: str = "", location: str = ""):
+    response = await room_manager.join_room_with_prefix_0(
+        conn.websocket, f"0{username}", binary_frames=conn.binary, compress_frames=conn.compressed,
+        app_pings=conn.app_pings
+    )
+    data = None
+    if response.startswith("0000"):
+        data = {"room": response[4:9], "username": username, "resume_token": _resume_token(conn)}
+    # v2: con la ubicación del líder se empiezan a buscar restaurantes mientras se une la gente
+    if data is not None and location:
+        prefetch_response = await room_manager.prefetch_restaurants(conn.websocket, location, offline=OFFLINE_MODE)
+        data["prefetching"] = prefetch_response.startswith("0000")
+    return CommandReply(response, data)
+
+
+@dispatcher.command("1", "join_room", parse_legacy=lambda rest: {"room": rest[:5], "username": rest[5:]})
+async def join_room(conn: Connection, room: str = "", username: str = ""):
+    # content: "1roomCodeusername"
+    response = await room_manager.join_room_with_prefix_1(
+        conn.websocket, f"1{room}{username}", binary_frames=conn.binary, compress_frames=conn.compressed,
+        app_pings=conn.app_pings
+    )
+    data = None
+    if response.startswith("0001"):
+        sala = room_manager.get_room_by_websocket(conn.websocket)
+        data = {"room": room, "users": await sala.member_names(), "resume_token": _resume_token(conn)}
+    return CommandReply(response, data)
+
+
+# Legado: "8" + código de sala (5) + token (22) + nombre de usuario
+@dispatcher.command("8", "resume", parse_legacy=lambda rest: {"room": rest[:5], "token": rest[5:27], "username": rest[27:]})
+async def resume(conn: Connection, room: str = "", username: str = "", token: str = ""):
+    response = await room_manager.resume_session(
+        conn.websocket, room, username, token, binary_frames=conn.binary, compress_frames=conn.compressed,
+        app_pings=conn.app_pings
+    )
+    data = None
+    if response.startswith("0002"):
+        sala = room_manager.get_room_by_websocket(conn.websocket)
+        user = sala.get_user_by_websocket(conn.websocket)
+        game = sala.game
+        data = {"room": room, "users": await sala.member_names(), "leader": user.is_leader, "game": None}
+        if game is not None:
+            data["game"] = {
+                "restaurants": [r.id for r in game.restaurants],
+                "voted": game.voted_by(username)
+            }
+    return CommandReply(response, data)
+
+
+@dispatcher.command("9", "resume_token")
+async def resume_token(conn: Connection):
+    # Solo a petición: los clientes legados que no reanudan sesiones no reciben frames nuevos
+    token = _resume_token(conn)
+    if token is None:
+        return CommandReply("1000ERROR: Room not found.")
+    return CommandReply(f"0000RESUME_TOKEN.{token}", {"resume_token": token})
+
+
+@dispatcher.command("21", "remove_user", parse_legacy=lambda rest: {"username": rest})
+async def remove_user(conn: Connection, username: str = ""):
+    return CommandReply(await room_manager.remove_user_by_username(username, conn.websocket))
+
+
+@dispatcher.command("3", "chat", parse_legacy=lambda rest: {"text": rest})
+async def chat(conn: Connection, text: str = ""):
+    # Mensaje de chat
+    return CommandReply(await room_manager.broadcast_chat_message(conn.sender, text, conn.websocket))
+
+
+@dispatcher.command("4", "start_game", parse_legacy=lambda rest: {"location": rest})
+async def start_game(conn: Connection, location: str = "", stream: bool = None):
+    # Iniciar el juego: "4lat,lng"
+    room = room_manager.get_room_by_websocket(conn.websocket)
+    if not room:
+        return CommandReply("1000ERROR: Room not found.")
+
+    acting_user = room.get_user_by_websocket(conn.websocket)
+    if not acting_user or not acting_user.is_leader:
+        return CommandReply("1000ERROR: Only the leader can start the game.")
+
+    # v2 puede elegir el modo streaming (cartas por lotes según se vota); si no, GAME_STREAM_MODE
+    game = Game(location, room, offline=OFFLINE_MODE, timers=room_manager.timers, stream_mode=stream)
+    room.game = game
+    try:
+        await game.start()
+    except Exception as e:
+        if game.started:
+            raise
+        # Ni Places ni resultados guardados: la sala sigue esperando y el líder puede reintentar
+        logger.warning("No se pudo iniciar la partida en la sala %s: %s", room.code, e)
+        room.game = None
+        return CommandReply("1000ERROR: Restaurants unavailable, try again later.")
+    return CommandReply("0000GAME_STARTED", {
+        "restaurants": [r.id for r in game.restaurants], "stream": game.stream_mode
+    })
+
+
+def _parse_legacy_vote(rest: str):
+    # Votar: "5{0|1}{IDRestaurante}"
+    # Ejemplo: "5012" => "5" prefijo, "0" like, "12" id del restaurante
+    return {"like": rest[:1] == "0", "restaurant_id": rest[1:]}
+
+
+@dispatcher.command("5", "vote", parse_legacy=_parse_legacy_vote)
+async def vote(conn: Connection, restaurant_id: str | int = "", like: bool = False):
+    vote_char = "0" if like else "1"  # '0' es like en el protocolo legado
+    return CommandReply(await room_manager.register_vote(conn.websocket, vote_char, str(restaurant_id)))
+
+
+@dispatcher.command("6", "pong")
+async def pong(conn: Connection):
+    # Respuesta al PING del heartbeat: la actividad ya se registró al recibir el mensaje
+    return None
+
+
+@dispatcher.command("7", "prefetch", parse_legacy=lambda rest: {"location": rest})
+async def prefetch(conn: Connection, location: str = ""):
+    # Precargar restaurantes antes de empezar: "7lat,lng"
+    return CommandReply(await room_manager.prefetch_restaurants(conn.websocket, location, offline=OFFLINE_MODE))
+
+
+async def dispatch(conn: Connection, cmd, args):
+    if cmd is None:
+        COMMANDS.inc(opcode="unknown")
+        return CommandReply("1000Error: Comando no reconocido."), "unknown"
+    if args is None:
+        COMMANDS.inc(opcode="invalid")
+        return CommandReply("1000Error: Argumentos no válidos."), cmd.name
+
+    # Límite por conexión y por sala (para unirse, la sala es la indicada en el comando)
+    room = room_manager.get_room_by_websocket(conn.websocket)
+    if room is None and "room" in args:
+        room = room_manager.rooms.get(args["room"])
+    if not rate_limiter.allow_command(cmd.name, conn.rate_buckets, room.rate_buckets if room else None):
+        return CommandReply(THROTTLED_ERROR), cmd.name
+
+    started = time.perf_counter()
+    try:
+        reply = await cmd.handler(conn, **args)
+    except Exception:
+        # Un fallo en un comando no debe cerrar la conexión ni dejar la sala a medias
+        logger.exception("Error en el comando %s", cmd.name)
+        reply = CommandReply("1000Error: Error interno.")
+    COMMANDS.inc(opcode=cmd.opcode)
+    COMMAND_DURATION.observe(time.perf_counter() - started, opcode=cmd.opcode)
+    return reply, cmd.name
+
 
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
+    # Negociar el protocolo v2 si el cliente lo ofrece; si no, protocolo legado de texto
+    protocol = negotiate_protocol(websocket.scope.get("subprotocols", []))
+    await websocket.accept(subprotocol=None if protocol == PROTOCOL_LEGACY else protocol)
+    conn = Connection(websocket, protocol)
+
+    if protocol == PROTOCOL_LEGACY:
+        await _legacy_loop(conn)
+    else:
+        await _v2_loop(conn)
+
+
+async def _legacy_loop(conn: Connection):
+    websocket = conn.websocket
     message_id = 1
 
     try:
         while True:
             data = await websocket.receive_text()
+            timestamp = int(time.time() * 1000)
+            if not rate_limiter.allow_frame(conn.rate_buckets):
+                # Por encima del límite de frames no se decodifica, pero se responde con el
+                # error para que el cliente no se quede esperando (p. ej. tras un voto)
+                reply = CommandReply(THROTTLED_ERROR)
+            else:
+                try:
+                    msg_data = json.loads(data)
+                    conn.sender = msg_data.get('sender', 'unknown')
+                    content = msg_data.get('content', '')
+                except:
+                    continue
+
+                room_manager.touch(websocket)
+
+                # Procesar el mensaje según el opcode
+                cmd, args = dispatcher.resolve_legacy(content)
+                reply, _ = await dispatch(conn, cmd, args)
+            if reply is None:
+                continue
+
+            resp_frame = encode_frame(reply.message, id=message_id, timestamp=timestamp)
+            message_id += 1
+            await room_manager.send_reply(websocket, resp_frame)
+
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # También si el bucle termina por un error inesperado: la sala no debe conservar el socket
+        await room_manager.handle_disconnect(websocket)
+
+
+async def _v2_loop(conn: Connection):
+    websocket = conn.websocket
+    message_id = 1
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if not rate_limiter.allow_frame(conn.rate_buckets):
+                continue
+            raw = message.get("bytes") if message.get("bytes") is not None else message.get("text")
             try:
-                msg_data = json.loads(data)
-                sender = msg_data.get('sender', 'unknown')
-                content = msg_data.get('content', '')
-                timestamp = int(time.time() * 1000)
-            except:
+                msg_data = decode_v2(conn.protocol, raw)
+                conn.sender = msg_data.get("sender", conn.sender)
+            except Exception:
                 continue
 
-            # Procesar el mensaje según el prefijo
-            if content.startswith("0"):
-                response_message = await room_manager.join_room_with_prefix_0(websocket, content)
-
-            elif content.startswith("1"):
-                response_message = await room_manager.join_room_with_prefix_1(websocket, content)
-
-            elif content.startswith("21"):
-                username_to_remove = content[2:]
-                response_message = await room_manager.remove_user_by_username(username_to_remove, websocket)
-
-            elif content.startswith("3"):
-                # Mensaje de chat
-                message_content = content[1:]
-                response_message = await room_manager.broadcast_chat_message(sender, message_content, websocket)
-
-            elif content.startswith("4"):
-                # Iniciar el juego
-                room = room_manager.get_room_by_websocket(websocket)
-                if room:
-                    acting_user = room.get_user_by_websocket(websocket)
-                    if acting_user and acting_user.is_leader:
-                        leader_location = content[1:]  # "4lat,lng"
-                        game = Game(leader_location, room)
-                        room.game = game
-                        await game.start()
-                        response_message = "0000GAME_STARTED"
-                    else:
-                        response_message = "1000ERROR: Only the leader can start the game."
-                else:
-                    response_message = "1000ERROR: Room not found."
-
-            elif content.startswith("5"):
-                # Votar: "5{0|1}{IDRestaurante}"
-                # Ejemplo: "5012" => "5" prefijo, "0" like, "12" id del restaurante
-                # Extraer voto y ID del restaurante
-                # Voto es el segundo caracter, ID del restaurante es el resto
-                # 5 (prefijo) + {0 o 1} + {IDRestaurante}
-                room = room_manager.get_room_by_websocket(websocket)
-                if room and room.game:
-                    acting_user = room.get_user_by_websocket(websocket)
-                    if acting_user:
-                        vote_char = content[1]  # '0' o '1'
-                        restaurant_id = content[2:]  # El resto del string es la ID
-                        await room.game.register_vote(acting_user.username, vote_char, restaurant_id)
-                        response_message = "VOTE_REGISTERED"
-                    else:
-                        response_message = "ERROR: User not found."
-                else:
-                    response_message = "ERROR: Room or Game not found."
+            room_manager.touch(websocket)
 
-            else:
-                response_message = "1000Error: Comando no reconocido."
+            cmd, args = dispatcher.resolve_v2(msg_data)
+            reply, name = await dispatch(conn, cmd, args)
+            if reply is None:
+                continue
 
-            resp_json = json.dumps({
-                "id": message_id,
-                "message": response_message,
-                "timestamp": timestamp
-            })
+            response = {
+                "id": msg_data.get("id", message_id),
+                "op": name,
+                "ok": reply.ok,
+                "message": reply.message,
+                "timestamp": int(time.time() * 1000)
+            }
+            if reply.data is not None:
+                response["data"] = reply.data
             message_id += 1
-            await websocket.send_text(resp_json)
+            await room_manager.send_reply(websocket, encode_v2(conn.protocol, response))
 
     except WebSocketDisconnect:
+        pass
+    finally:
+        # También si el bucle termina por un error inesperado: la sala no debe conservar el socket
         await room_manager.handle_disconnect(websocket)
@@ -0,0 +1,42 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# Los módulos del servidor se importan como en producción (from utils..., from models...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def places_stub(monkeypatch):
+    """
+    benchmarks/places_stub.py sirviendo en un puerto local, con restaurant_fetcher
+    apuntando a él y su estado global (cliente HTTP, semáforo, circuit breaker) limpio.
+    Devuelve el StubConfig para ajustar latencia y errores y contar peticiones.
+    """
+    uvicorn = pytest.importorskip("uvicorn")
+    from benchmarks.places_stub import StubConfig, create_app
+    from utils import restaurant_fetcher
+    from utils.circuit_breaker import CircuitBreaker
+
+    config = StubConfig()
+    server = uvicorn.Server(uvicorn.Config(create_app(config), host="127.0.0.1", port=0, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        assert thread.is_alive() and time.monotonic() < deadline, "El stub de Places no arrancó"
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+
+    monkeypatch.setattr(restaurant_fetcher, "NEARBY_SEARCH_URL", f"http://127.0.0.1:{port}/nearbysearch/json")
+    monkeypatch.setattr(restaurant_fetcher, "NEXT_PAGE_DELAY", 0.0)
+    # Ligados al event loop de cada prueba: se crean de nuevo en cada una
+    monkeypatch.setattr(restaurant_fetcher, "_async_client", None)
+    monkeypatch.setattr(restaurant_fetcher, "_lookup_semaphore", None)
+    monkeypatch.setattr(restaurant_fetcher, "places_breaker", CircuitBreaker("places"))
+    yield config
+    server.should_exit = True
+    thread.join(10)
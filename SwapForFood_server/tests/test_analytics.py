@@ -0,0 +1,111 @@
+import asyncio
+import os
+
+import pytest
+
+from utils.analytics import AnalyticsSink, like_rates, decision_latency
+from utils.metrics import ANALYTICS_EVENTS
+
+
+def _counts():
+    return {r: ANALYTICS_EVENTS.values.get((("result", r),), 0) for r in ("written", "dropped", "spilled")}
+
+
+def _delta(before):
+    return {r: value - before[r] for r, value in _counts().items()}
+
+
+def _emit_votes(sink, count):
+    for i in range(count):
+        sink.emit("vote", "g", f"user{i}", "r1", i % 2, float(i))
+
+
+def test_full_buffer_drops_and_counts(tmp_path):
+    async def main():
+        sink = AnalyticsSink(str(tmp_path / "a.db"), capacity=4, flush_interval=3600, overflow="drop")
+        await sink.start()
+        before = _counts()
+        _emit_votes(sink, 10)
+        assert _delta(before)["dropped"] == 6
+        await sink.close()
+        assert _delta(before) == {"written": 4, "dropped": 6, "spilled": 0}
+
+    asyncio.run(main())
+    assert len(like_rates(str(tmp_path / "a.db"))) == 1
+
+
+def test_spill_stays_off_the_event_loop_and_is_ingested(tmp_path):
+    path = str(tmp_path / "a.db")
+
+    async def main():
+        sink = AnalyticsSink(path, capacity=4, flush_interval=3600, overflow="spill", spill_buffer=3)
+        await sink.start()
+        before = _counts()
+        _emit_votes(sink, 10)
+        # emit() no toca el disco: lo que no cabe espera en el segundo buffer
+        assert not os.path.exists(sink.spill_path)
+        assert len(sink.overflow) == 3 and _delta(before)["dropped"] == 3
+        await sink.close()
+        assert _delta(before) == {"written": 7, "dropped": 3, "spilled": 3}
+        assert not os.path.exists(sink.spill_path)
+
+    asyncio.run(main())
+    assert like_rates(path)[0]["votes"] == 7
+
+
+def test_spill_file_size_limit_drops_the_rest(tmp_path):
+    async def main():
+        sink = AnalyticsSink(str(tmp_path / "a.db"), capacity=2, flush_interval=3600, overflow="spill",
+                             spill_buffer=10, spill_max_bytes=60)  # Caben un par de líneas
+        before = _counts()
+        _emit_votes(sink, 12)
+        await sink.start()
+        await sink.close()
+        delta = _delta(before)
+        assert 0 < delta["spilled"] < 10
+        assert delta["spilled"] + delta["dropped"] == 10
+        assert delta["written"] == 2 + delta["spilled"]
+
+    asyncio.run(main())
+
+
+def _game_events(sink):
+    sink.emit("game", "g1", "12345", 1000.0, False, False, 2)
+    sink.emit("restaurants", "g1", 0.0, 0, [["r1", "Uno"], ["r2", "Dos"]])
+    sink.emit("restaurants", "g1", 5.0, 2, [["r3", "Tres"]])
+    for username, rid, liked, at in (("ana", "r1", 1, 1.0), ("luis", "r1", 1, 3.0), ("ana", "r2", 0, 2.0),
+                                     ("luis", "r2", 1, 4.0), ("ana", "r3", 1, 6.0), ("luis", "r3", 0, 8.0)):
+        sink.emit("vote", "g1", username, rid, liked, at)
+    sink.emit("end", "g1", 1010.0, 10.0, 2, 6, [("r1", 2, 2), ("r2", 1, 2), ("r3", 1, 2)])
+
+    # Partida sin coincidencia: nadie da like a todo
+    sink.emit("game", "g2", "54321", 2000.0, False, True, 2)
+    sink.emit("restaurants", "g2", 0.0, 0, [["r1", "Uno"]])
+    sink.emit("vote", "g2", "ana", "r1", 1, 2.0)
+    sink.emit("vote", "g2", "luis", "r1", 0, 4.0)
+    sink.emit("end", "g2", 2005.0, 5.0, 2, 2, [("r1", 1, 2)])
+
+
+def test_like_rates_and_decision_latency(tmp_path):
+    path = str(tmp_path / "a.db")
+
+    async def main():
+        sink = AnalyticsSink(path, flush_interval=3600)
+        await sink.start()
+        _game_events(sink)
+        await sink.close()
+
+    asyncio.run(main())
+
+    rates = {row["restaurant_id"]: row for row in like_rates(path)}
+    assert rates["r1"]["name"] == "Uno" and (rates["r1"]["likes"], rates["r1"]["votes"]) == (3, 4)
+    assert rates["r1"]["like_rate"] == 0.75
+    assert rates["r2"]["like_rate"] == 0.5 and rates["r3"]["like_rate"] == 0.5
+    assert [row["restaurant_id"] for row in like_rates(path, min_votes=3)] == ["r1"]
+
+    games = {row["game_id"]: row for row in decision_latency(path)}
+    assert games["g1"]["match_latency"] == 3.0
+    assert games["g1"]["vote_latency"] == pytest.approx((1 + 3 + 2 + 4 + 1 + 3) / 6)
+    assert games["g1"]["duration"] == 10.0 and games["g1"]["final_participants"] == 2
+    assert games["g2"]["match_latency"] is None
+    assert [row["game_id"] for row in decision_latency(path, game_id="g2")] == ["g2"]
@@ -0,0 +1,49 @@
+import asyncio
+
+from utils.candidates import stream_candidates
+
+
+def _place(place_id, lat, rating=4.0):
+    return {"place_id": place_id, "geometry": {"location": {"lat": lat, "lng": 0.0}}, "rating": rating}
+
+
+# Páginas ordenadas por distancia al punto (0, 0), como rankby=distance
+PAGES = [
+    [_place(f"p1_{i}", 0.001 * (i + 1)) for i in range(5)],
+    [_place(f"p2_{i}", 0.01 + 0.001 * i) for i in range(5)],
+    [_place(f"p3_{i}", 0.02 + 0.001 * i) for i in range(5)],
+]
+
+
+async def _collect(pages, top_k):
+    requested = []
+
+    async def source():
+        for index, page in enumerate(pages):
+            requested.append(index)
+            yield page
+
+    batches = []
+    async for batch in stream_candidates(source(), 0.0, 0.0, top_k, len(pages)):
+        batches.append([r["place_id"] for r, _ in batch])
+    return batches, requested
+
+
+def test_stops_paging_once_top_k_is_settled():
+    batches, requested = asyncio.run(_collect(PAGES, 3))
+    assert batches == [["p1_0", "p1_1", "p1_2"]]
+    assert requested == [0]
+
+
+def test_fetches_more_pages_when_a_page_falls_short():
+    # Sin ubicación no se pueden puntuar: la primera página no llega a top_k válidos
+    first = [dict(r, geometry={}) for r in PAGES[0][:3]] + PAGES[0][3:]
+    batches, requested = asyncio.run(_collect([first, *PAGES[1:]], 4))
+    assert requested == [0, 1]
+    assert [place for batch in batches for place in batch] == ["p1_3", "p1_4", "p2_0", "p2_1"]
+
+
+def test_duplicates_across_pages_are_skipped():
+    pages = [PAGES[0][:2], PAGES[0][:2] + PAGES[1][:2]]
+    batches, requested = asyncio.run(_collect(pages, 4))
+    assert [place for batch in batches for place in batch] == ["p1_0", "p1_1", "p2_0", "p2_1"]
@@ -0,0 +1,136 @@
+import asyncio
+import json
+
+from managers.room_manager import RoomManager
+from utils.room_codes import RoomCodeAllocator
+from utils.timer_wheel import TimerWheel
+
+WINDOW = 0.05
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text)["message"])
+
+    async def send_bytes(self, data):
+        self.sent.append(data)
+
+    async def close(self):
+        pass
+
+
+async def _eventually(check, timeout=3.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not check():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("La condición no se cumplió a tiempo")
+        await asyncio.sleep(0.01)
+
+
+async def _room(max_batch=3):
+    manager = RoomManager(timers=TimerWheel(), room_codes=RoomCodeAllocator(cooldown=0),
+                          chat_window=WINDOW, chat_max_batch=max_batch)
+    ana, luis = FakeWebSocket(), FakeWebSocket()
+    response = await manager.join_room_with_prefix_0(ana, "0ana")
+    code = response[4:9]
+    await manager.join_room_with_prefix_1(luis, f"1{code}luis")
+    await _eventually(lambda: "USER_JOINED.luis" in ana.sent)
+    return manager, manager.rooms[code], ana, luis
+
+
+def _chat(sent):
+    # Mensajes de chat recibidos, en orden, como (remitente, texto)
+    received = []
+    for message in sent:
+        if message.startswith("NEW_MESSAGE."):
+            sender, content = message[len("NEW_MESSAGE."):].split(":", 1)
+            received.append((sender, content))
+        elif message.startswith("NEW_MESSAGES."):
+            received.extend((m["sender"], m["content"]) for m in json.loads(message[len("NEW_MESSAGES."):]))
+    return received
+
+
+def _batches(sent):
+    return [message for message in sent if message.startswith(("NEW_MESSAGE.", "NEW_MESSAGES."))]
+
+
+def test_single_message_goes_out_as_new_message():
+    async def main():
+        manager, sala, ana, luis = await _room()
+        try:
+            assert await manager.broadcast_chat_message("ana", "hola", ana) == "0000"
+            # Dentro de la ventana todavía no ha salido nada
+            assert not _batches(luis.sent)
+            await _eventually(lambda: _batches(luis.sent))
+            assert _batches(luis.sent) == ["NEW_MESSAGE.ana:hola"]
+            await _eventually(lambda: not sala.chat_tasks)
+        finally:
+            await manager.handle_disconnect(luis)
+            await manager.handle_disconnect(ana)
+
+    asyncio.run(main())
+
+
+def test_messages_in_the_window_keep_their_order():
+    async def main():
+        manager, sala, ana, luis = await _room(max_batch=10)
+        try:
+            expected = []
+            for n in range(4):
+                websocket, sender = (ana, "ana") if n % 2 == 0 else (luis, "luis")
+                await manager.broadcast_chat_message(sender, f"m{n}", websocket)
+                expected.append((sender, f"m{n}"))
+            await _eventually(lambda: _batches(ana.sent))
+            # Un único envío con los cuatro mensajes, en el orden en que llegaron
+            assert len(_batches(ana.sent)) == 1 and _batches(ana.sent)[0].startswith("NEW_MESSAGES.")
+            assert _chat(ana.sent) == expected
+            await _eventually(lambda: _chat(luis.sent) == expected)
+        finally:
+            await manager.handle_disconnect(luis)
+            await manager.handle_disconnect(ana)
+
+    asyncio.run(main())
+
+
+def test_full_batch_is_sent_without_waiting_for_the_window():
+    async def main():
+        manager, sala, ana, luis = await _room(max_batch=3)
+        try:
+            for n in range(4):
+                await manager.broadcast_chat_message("ana", f"m{n}", ana)
+            # Los tres primeros salen en cuanto se llena el lote; el cuarto espera su ventana
+            assert sala.chat_buffer == [("ana", "m3")] and sala.chat_flush is not None
+            await _eventually(lambda: len(_batches(luis.sent)) == 2)
+            first, second = _batches(luis.sent)
+            assert len(json.loads(first[len("NEW_MESSAGES."):])) == 3
+            assert second == "NEW_MESSAGE.ana:m3"
+            assert _chat(luis.sent) == [("ana", f"m{n}") for n in range(4)]
+        finally:
+            await manager.handle_disconnect(luis)
+            await manager.handle_disconnect(ana)
+
+    asyncio.run(main())
+
+
+def test_closing_the_room_mid_window_does_not_raise():
+    async def main():
+        loop = asyncio.get_running_loop()
+        errors = []
+        loop.set_exception_handler(lambda _, context: errors.append(context))
+        manager, sala, ana, luis = await _room()
+        await manager.broadcast_chat_message("ana", "adiós", ana)
+        assert sala.chat_flush is not None
+        await manager.handle_disconnect(luis)
+        await manager.handle_disconnect(ana)
+        assert sala.code not in manager.rooms and sala.chat_flush is None
+        # Pasada la ventana no queda ningún envío pendiente ni errores sin recoger
+        await asyncio.sleep(WINDOW * 3)
+        assert not sala.chat_tasks
+        assert "NEW_MESSAGE.ana:adiós" not in luis.sent
+        await manager.close()
+        assert errors == []
+
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+import asyncio
+import json
+
+import pytest
+
+from routers import websocket_routes
+from routers.dispatcher import CommandDispatcher, Connection, PROTOCOL_JSON
+from routers.websocket_routes import dispatch, dispatcher, room_manager
+
+
+class FakeWebSocket:
+    def __init__(self, incoming=()):
+        self.incoming = list(incoming)
+        self.sent = []
+
+    async def receive_text(self):
+        if not self.incoming:
+            await asyncio.sleep(0.01)  # Dejar que el escritor envíe las respuestas
+            raise RuntimeError("Conexión rota")
+        return json.dumps(self.incoming.pop(0))
+
+    async def receive(self):
+        if not self.incoming:
+            await asyncio.sleep(0.01)  # Dejar que el escritor envíe las respuestas
+            raise RuntimeError("Conexión rota")
+        return {"type": "websocket.receive", "text": json.dumps(self.incoming.pop(0))}
+
+    async def send_text(self, text):
+        self.sent.append(text)
+
+    async def send_bytes(self, data):
+        self.sent.append(data)
+
+    async def close(self):
+        pass
+
+
+def test_resolve_v2_rejects_mistyped_args():
+    cmd, args = dispatcher.resolve_v2({"op": "remove_user", "args": {"username": ["x"]}})
+    assert cmd.name == "remove_user" and args is None
+    cmd, args = dispatcher.resolve_v2({"op": "start_game", "args": {"location": "40.4,-3.7", "stream": None}})
+    assert args == {"location": "40.4,-3.7", "stream": None}
+    cmd, args = dispatcher.resolve_v2({"op": "vote", "args": {"restaurant_id": 12, "like": True, "extra": 1}})
+    assert args == {"restaurant_id": 12, "like": True}
+    cmd, args = dispatcher.resolve_v2({"op": "vote", "args": {"restaurant_id": 12, "like": "yes"}})
+    assert args is None
+
+
+def test_dispatch_replies_with_error_for_invalid_args():
+    async def main():
+        conn = Connection(FakeWebSocket(), PROTOCOL_JSON)
+        cmd, args = dispatcher.resolve_v2({"op": "create_room", "args": {"username": "ana", "location": 40.4}})
+        reply, name = await dispatch(conn, cmd, args)
+        assert name == "create_room" and not reply.ok
+        assert conn.websocket not in room_manager.websocket_to_room
+    asyncio.run(main())
+
+
+def test_dispatch_turns_handler_errors_into_replies():
+    local = CommandDispatcher()
+
+    @local.command("9", "explode")
+    async def explode(conn: Connection):
+        raise KeyError("boom")
+
+    async def main():
+        cmd, args = local.resolve_v2({"op": "explode"})
+        reply, name = await dispatch(Connection(FakeWebSocket(), PROTOCOL_JSON), cmd, args)
+        assert name == "explode" and not reply.ok
+    asyncio.run(main())
+
+
+def test_prefetch_rejects_non_string_location():
+    async def main():
+        websocket = FakeWebSocket()
+        await room_manager.join_room_with_prefix_0(websocket, "0ana")
+        try:
+            assert await room_manager.prefetch_restaurants(websocket, ["40.4", "-3.7"]) == "1000ERROR: Invalid location."
+        finally:
+            await room_manager.handle_disconnect(websocket)
+    asyncio.run(main())
+
+
+def test_v2_loop_releases_socket_on_unexpected_error():
+    async def main():
+        websocket = FakeWebSocket([{"id": 1, "op": "create_room", "args": {"username": "ana"}}])
+        with pytest.raises(RuntimeError):
+            await websocket_routes._v2_loop(Connection(websocket, PROTOCOL_JSON))
+        assert websocket not in room_manager.websocket_to_room
+    asyncio.run(main())
+
+
+def test_legacy_clients_get_resume_token_only_on_request():
+    async def main():
+        websocket = FakeWebSocket([
+            {"sender": "ana", "content": "0ana"},
+            {"sender": "ana", "content": "9"},
+        ])
+        with pytest.raises(RuntimeError):
+            await websocket_routes._legacy_loop(Connection(websocket))
+        messages = [json.loads(text)["message"] for text in websocket.sent]
+        assert messages[0].startswith("0000")
+        assert messages[1].startswith("0000RESUME_TOKEN.")
+        assert len(messages) == 2
+    asyncio.run(main())
@@ -0,0 +1,137 @@
+import asyncio
+import json
+
+import msgpack
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from managers.room_manager import RoomManager
+from routers import websocket_routes
+from routers.dispatcher import PROTOCOL_JSON_DEFLATE, PROTOCOL_MSGPACK_DEFLATE, encode_v2
+from utils import frames
+from utils.frames import DEFLATE_MARKER, encode_frame, inflate_payload
+from utils.room_codes import RoomCodeAllocator
+from utils.timer_wheel import TimerWheel
+
+LONG_TEXT = "Vamos al asador de siempre, que tiene terraza " * 20
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text):
+        self.sent.append(text)
+
+    async def send_bytes(self, data):
+        self.sent.append(data)
+
+    async def close(self):
+        pass
+
+
+def _decode(data, binary):
+    # Lo que haría un cliente "+deflate": inflar si llega el marcador y decodificar
+    if isinstance(data, bytes) and data.startswith(DEFLATE_MARKER):
+        data = inflate_payload(data)
+    return msgpack.unpackb(data, raw=False) if binary else json.loads(data)
+
+
+@pytest.fixture
+def deflate_calls(monkeypatch):
+    calls = []
+    original = frames.deflate_payload
+
+    def counting(data, *args, **kwargs):
+        calls.append(data)
+        return original(data, *args, **kwargs)
+
+    monkeypatch.setattr(frames, "deflate_payload", counting)
+    return calls
+
+
+def test_small_frames_are_sent_raw(deflate_calls):
+    frame = encode_frame("USER_JOINED.luis", timestamp=1)
+    assert len(frame.data) < frames.COMPRESSION_MIN_BYTES
+    assert frame.wire(binary=False, compress=True) == frame.text
+    assert frame.wire(binary=True, compress=True) == frame.packed
+    assert not frame.wire(binary=True, compress=True).startswith(DEFLATE_MARKER)
+    # Las respuestas v2 siguen la misma regla
+    assert encode_v2(PROTOCOL_JSON_DEFLATE, {"op": "chat", "ok": True}) == '{"op":"chat","ok":true}'
+
+
+def test_large_frames_are_compressed_and_round_trip():
+    frame = encode_frame(f"NEW_MESSAGE.ana:{LONG_TEXT}", timestamp=1)
+    for binary in (False, True):
+        wire = frame.wire(binary=binary, compress=True)
+        assert isinstance(wire, bytes) and wire.startswith(DEFLATE_MARKER)
+        assert len(wire) < len(frame.packed if binary else frame.data)
+        assert _decode(wire, binary) == frame.obj
+    # Sin "+deflate" no cambia nada
+    assert frame.wire(binary=False, compress=False) == frame.text
+
+
+def test_broadcast_compresses_once_per_room(deflate_calls):
+    async def main():
+        manager = RoomManager(timers=TimerWheel(), room_codes=RoomCodeAllocator(cooldown=0))
+        # Tres clientes JSON y tres MessagePack, todos con compresión
+        sockets = [(FakeWebSocket(), n >= 3) for n in range(6)]
+        leader, binary = sockets[0]
+        response = await manager.join_room_with_prefix_0(leader, "0user0", binary_frames=binary, compress_frames=True)
+        code = response[4:9]
+        for n, (websocket, binary) in enumerate(sockets[1:], start=1):
+            await manager.join_room_with_prefix_1(websocket, f"1{code}user{n}", binary_frames=binary,
+                                                  compress_frames=True)
+        await asyncio.sleep(0.05)
+        for websocket, _ in sockets:
+            websocket.sent.clear()
+        deflate_calls.clear()
+
+        frame = encode_frame(f"NEW_MESSAGE.user0:{LONG_TEXT}")
+        await manager.rooms[code].broadcast(frame)
+        await asyncio.sleep(0.05)
+
+        # Una compresión por codificación, no por destinatario
+        assert deflate_calls == [frame.data, frame.packed]
+        for websocket, binary in sockets:
+            assert len(websocket.sent) == 1
+            assert _decode(websocket.sent[0], binary) == frame.obj
+        for websocket, _ in sockets:
+            await manager.handle_disconnect(websocket)
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("protocol,binary", ((PROTOCOL_JSON_DEFLATE, False), (PROTOCOL_MSGPACK_DEFLATE, True)))
+def test_deflate_client_decodes_what_it_receives(protocol, binary, monkeypatch):
+    monkeypatch.setattr(websocket_routes.room_manager, "chat_window", 0)
+    app = FastAPI()
+    app.include_router(websocket_routes.router)
+
+    def send(websocket, obj):
+        obj["sender"] = "ana"
+        if binary:
+            websocket.send_bytes(msgpack.packb(obj, use_bin_type=True))
+        else:
+            websocket.send_text(json.dumps(obj))
+
+    def receive(websocket):
+        message = websocket.receive()
+        return message.get("bytes") if message.get("bytes") is not None else message.get("text")
+
+    with TestClient(app) as client:
+        with client.websocket_connect("/ws", subprotocols=[protocol]) as websocket:
+            assert websocket.accepted_subprotocol == protocol
+            send(websocket, {"id": 1, "op": "create_room", "args": {"username": "ana"}})
+            assert _decode(receive(websocket), binary)["ok"]
+            send(websocket, {"id": 2, "op": "chat", "args": {"text": LONG_TEXT}})
+            # El broadcast del chat y la respuesta al comando, en cualquier orden
+            received = [receive(websocket) for _ in range(2)]
+            decoded = [_decode(data, binary) for data in received]
+            chat = next(n for n, d in enumerate(decoded) if d["message"].startswith("NEW_MESSAGE."))
+            assert decoded[chat]["message"] == f"NEW_MESSAGE.ana:{LONG_TEXT}"
+            # El mensaje grande llega comprimido; la respuesta corta, tal cual
+            assert received[chat].startswith(DEFLATE_MARKER)
+            reply = decoded[1 - chat]
+            assert reply["id"] == 2 and reply["ok"]
@@ -0,0 +1,51 @@
+import asyncio
+import json
+
+from managers.room_manager import RoomManager
+from models import game as game_module
+from models.game import Game
+from models.restaurant import Restaurant
+from utils.room_codes import RoomCodeAllocator
+from utils.timer_wheel import TimerWheel
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text)["message"])
+
+    async def send_bytes(self, data):
+        self.sent.append(data)
+
+    async def close(self):
+        pass
+
+
+def _restaurant(n):
+    return Restaurant(id=f"r{n}", name=f"Sitio {n}", rating="4.5", distance="0.10", photo_url="")
+
+
+def test_classic_game_sends_a_single_restaurant_batch(monkeypatch):
+    async def paged(location, offline=False):
+        yield [_restaurant(0), _restaurant(1)]
+        await asyncio.sleep(0.01)
+        yield [_restaurant(2)]
+
+    monkeypatch.setattr(game_module, "stream_restaurants_cached", paged)
+
+    async def main():
+        manager = RoomManager(timers=TimerWheel(), room_codes=RoomCodeAllocator(cooldown=0))
+        websocket = FakeWebSocket()
+        response = await manager.join_room_with_prefix_0(websocket, "0ana")
+        sala = manager.rooms[response[4:9]]
+        sala.game = Game("40.4,-3.7", sala, timers=manager.timers, stream_mode=False)
+        await sala.game.start()
+        await asyncio.sleep(0.02)
+        return websocket.sent
+
+    sent = asyncio.run(main())
+    batches = [m for m in sent if m.startswith("NEW_RESTAURANT.")]
+    assert len(batches) == 1
+    assert [r["id"] for r in json.loads(batches[0][len("NEW_RESTAURANT."):])] == ["r0", "r1", "r2"]
@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+from managers.room_manager import RoomManager, HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT
+from utils.room_codes import RoomCodeAllocator
+from utils.timer_wheel import TimerWheel
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+        self.closed = False
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text)["message"])
+
+    async def send_bytes(self, data):
+        self.sent.append(data)
+
+    async def close(self):
+        self.closed = True
+
+
+async def _room(app_pings):
+    clock = FakeClock()
+    manager = RoomManager(timers=TimerWheel(clock=clock), room_codes=RoomCodeAllocator(cooldown=0, clock=clock))
+    leader, guest = FakeWebSocket(), FakeWebSocket()
+    response = await manager.join_room_with_prefix_0(leader, "0ana", app_pings=app_pings)
+    await manager.join_room_with_prefix_1(guest, f"1{response[4:9]}luis", app_pings=app_pings)
+    return manager, clock, leader, guest
+
+
+async def _run_until(manager, clock, until, step=5.0):
+    while clock.now < until:
+        clock.now += step
+        await manager.timers.advance()
+        await manager.timers.drain()
+
+
+def test_silent_v2_session_is_pinged_and_then_dropped():
+    async def main():
+        manager, clock, leader, guest = await _room(app_pings=True)
+        start = clock.now
+        # El invitado responde (cualquier mensaje cuenta); el líder calla
+        while clock.now < start + HEARTBEAT_TIMEOUT + 2 * HEARTBEAT_INTERVAL:
+            await _run_until(manager, clock, clock.now + HEARTBEAT_INTERVAL)
+            manager.touch(guest)
+        assert "PING" in leader.sent
+        assert leader not in manager.websocket_to_room and leader.closed
+        assert guest in manager.websocket_to_room
+        # El liderazgo pasa al invitado como en una desconexión normal
+        sala = manager.rooms[manager.websocket_to_room[guest]]
+        assert sala.get_user_by_websocket(guest).is_leader
+    asyncio.run(main())
+
+
+def test_legacy_session_gets_no_app_ping_or_silence_timeout():
+    async def main():
+        manager, clock, leader, guest = await _room(app_pings=False)
+        await _run_until(manager, clock, clock.now + HEARTBEAT_TIMEOUT * 2)
+        assert "PING" not in leader.sent and "PING" not in guest.sent
+        assert leader in manager.websocket_to_room and guest in manager.websocket_to_room
+        assert manager.timers.pending() == 0
+    asyncio.run(main())
+
+
+def test_departed_user_timer_is_dropped():
+    async def main():
+        manager, clock, leader, guest = await _room(app_pings=True)
+        await manager.handle_disconnect(guest)
+        await _run_until(manager, clock, clock.now + HEARTBEAT_INTERVAL * 2)
+        # Solo queda el temporizador del líder
+        assert manager.timers.pending() == 1
+    asyncio.run(main())
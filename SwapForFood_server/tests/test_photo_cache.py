@@ -0,0 +1,178 @@
+import asyncio
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import routers.photo_routes as photo_routes
+import utils.photo_cache as photo_cache_module
+from utils.photo_cache import PhotoCache, PhotoNotFound, PhotoFetchError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class StubOrigin:
+    """
+    Origen de fotos local: /photo?photoreference=...&maxwidth=... devuelve una
+    imagen de 1000 bytes por referencia, o el estado HTTP configurado para ella.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.statuses = {}  # {referencia: estado HTTP}
+        self.requests = []
+        origin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                reference = query["photoreference"][0]
+                origin.requests.append(reference)
+                time.sleep(origin.latency)
+                status = origin.statuses.get(reference, 200)
+                body = origin.image(reference) if status == 200 else b"error"
+                self.send_response(status)
+                self.send_header("Content-Type", "image/jpeg" if status == 200 else "text/plain")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @staticmethod
+    def image(reference):
+        return (reference.encode() * 1000)[:1000]
+
+    def url(self, reference, max_width=400):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}/photo?maxwidth={max_width}&photoreference={reference}"
+
+
+@pytest.fixture
+def origin(monkeypatch):
+    stub = StubOrigin()
+    stub.thread.start()
+    monkeypatch.setattr(photo_cache_module, "get_place_photo_url", stub.url)
+    # Un cliente por prueba: el compartido queda ligado al event loop que lo creó
+    clients = []
+
+    def client():
+        if not clients or clients[-1].is_closed:
+            clients.append(httpx.AsyncClient())
+        return clients[-1]
+
+    monkeypatch.setattr(photo_cache_module, "get_async_client", client)
+    yield stub
+    stub.server.shutdown()
+    stub.server.server_close()
+
+
+def _cache(tmp_path, **kwargs):
+    # Anchos a partir de 100 se piden directamente al origen, sin redimensionar
+    return PhotoCache(directory=str(tmp_path), source_width=100, **kwargs)
+
+
+def test_concurrent_requests_share_one_download(origin, tmp_path):
+    async def main():
+        cache = _cache(tmp_path)
+        entries = await asyncio.gather(*(cache.get("ref1", 400) for _ in range(5)))
+        assert len({entry.digest for entry in entries}) == 1
+        with open(entries[0].path, "rb") as f:
+            assert f.read() == StubOrigin.image("ref1")
+        assert (await cache.get("ref1", 400)) is entries[0]
+        return cache.stats()
+
+    stats = asyncio.run(main())
+    assert origin.requests == ["ref1"]
+    assert stats["misses"] == 1 and stats["coalesced"] == 4 and stats["hits"] == 1
+
+
+def test_not_found_is_cached_until_it_expires(origin, tmp_path):
+    origin.statuses["gone"] = 404
+    origin.statuses["forbidden"] = 403
+
+    async def main():
+        clock = FakeClock()
+        cache = _cache(tmp_path, not_found_ttl=60, clock=clock)
+        for _ in range(3):
+            with pytest.raises(PhotoNotFound):
+                await cache.get("gone", 400)
+        assert origin.requests == ["gone"]
+        clock.now = 61
+        with pytest.raises(PhotoNotFound):
+            await cache.get("gone", 400)
+        assert origin.requests == ["gone", "gone"]
+
+        # Un 403 es un problema de credenciales, no de la referencia: no se recuerda
+        for _ in range(2):
+            with pytest.raises(PhotoFetchError):
+                await cache.get("forbidden", 400)
+        assert origin.requests.count("forbidden") == 2
+
+        # Las referencias mal formadas no llegan al origen
+        with pytest.raises(PhotoNotFound):
+            await cache.get("../etc/passwd", 400)
+        assert len(origin.requests) == 4
+
+    asyncio.run(main())
+
+
+def test_pinned_entries_are_not_evicted(origin, tmp_path):
+    async def main():
+        cache = _cache(tmp_path, max_bytes=1500)  # Cabe una foto de 1000 bytes
+        first = await cache.get("first", 400, pin=True)
+        await cache.get("second", 400)
+        # Por encima del límite, pero la primera se está enviando
+        assert os.path.exists(first.path) and cache.blobs.get(first.digest) is first
+
+        cache.release(first)
+        await cache.get("third", 400)
+        assert not os.path.exists(first.path) and first.digest not in cache.blobs
+        assert cache.total_bytes <= 1500
+
+    asyncio.run(main())
+
+
+def test_index_is_rebuilt_from_disk(origin, tmp_path):
+    async def main():
+        entry = await _cache(tmp_path).get("ref1", 400)
+        restarted = _cache(tmp_path)
+        again = await restarted.get("ref1", 400)
+        assert again.digest == entry.digest and restarted.stats()["hits"] == 1
+
+    asyncio.run(main())
+    assert origin.requests == ["ref1"]
+
+
+def test_route_releases_the_pin_after_sending(origin, tmp_path, monkeypatch):
+    cache = _cache(tmp_path)
+    monkeypatch.setattr(photo_routes, "photo_cache", cache)
+    app = FastAPI()
+    app.include_router(photo_routes.router)
+
+    with TestClient(app) as client:
+        response = client.get("/photos/ref1?w=400")
+        assert response.status_code == 200 and response.content == StubOrigin.image("ref1")
+        etag = response.headers["etag"]
+        assert client.get("/photos/ref1?w=400", headers={"If-None-Match": etag}).status_code == 304
+        origin.statuses["gone"] = 404
+        assert client.get("/photos/gone?w=400").status_code == 404
+
+    entry = cache.blobs[etag.strip('"')]
+    assert entry.pins == 0
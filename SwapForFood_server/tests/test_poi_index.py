@@ -0,0 +1,121 @@
+import math
+import random
+
+import pytest
+
+from benchmarks.gen_poi_dataset import generate
+from utils.poi_index import EARTH_RADIUS_KM, PoiIndex, write_poi_file
+
+# Tolerancia en km: las coordenadas se guardan como f32
+TOLERANCE = 1e-3
+
+
+def _edge_records():
+    # Puntos a ambos lados del antimeridiano y alrededor de los dos polos
+    rng = random.Random(7)
+    records = []
+    for n in range(40):
+        records.append((f"am-{n}", f"Antimeridiano {n}", rng.uniform(-1, 1), rng.choice((-1, 1)) * rng.uniform(179.5, 180)))
+        records.append((f"np-{n}", f"Polo norte {n}", rng.uniform(89.5, 90), rng.uniform(-180, 180)))
+        records.append((f"sp-{n}", f"Polo sur {n}", rng.uniform(-90, -89.5), rng.uniform(-180, 180)))
+    return [(*record, None) for record in records]
+
+
+@pytest.fixture(scope="module")
+def index(tmp_path_factory):
+    path = tmp_path_factory.mktemp("poi") / "pois.bin"
+    # Hojas pequeñas para que las búsquedas recorran varios niveles del árbol
+    write_poi_file(str(path), list(generate(3000, seed=1)) + _edge_records(), leaf_size=4)
+    index = PoiIndex(str(path))
+    yield index
+    index.close()
+
+
+def _haversine(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2 +
+         math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def _brute_force(index, lat, lng):
+    distances = [(_haversine(lat, lng, index.lat[i], index.lng[i]), i) for i in range(len(index))]
+    distances.sort()
+    return distances
+
+
+QUERIES = (
+    (40.4168, -3.7038),   # Madrid, zona densa
+    (41.40, 2.15),        # Barcelona
+    (36.0, -10.0),        # En el mar, lejos de todo
+    (0.0, 180.0),         # Antimeridiano
+    (0.3, -179.8),
+    (90.0, 0.0),          # Polos
+    (89.9, 135.0),
+    (-89.8, -45.0),
+)
+
+
+@pytest.mark.parametrize("lat,lng", QUERIES)
+@pytest.mark.parametrize("k", (1, 5, 25))
+def test_nearest_matches_brute_force(index, lat, lng, k):
+    max_km = 200.0
+    expected = [(d, i) for d, i in _brute_force(index, lat, lng) if d <= max_km][:k]
+    found = index.nearest(lat, lng, k, max_km)
+
+    assert len(found) == len(expected)
+    assert [d for _, d in found] == pytest.approx([d for d, _ in expected], abs=TOLERANCE)
+    # Ordenados del más cercano al más lejano
+    assert all(a[1] <= b[1] + TOLERANCE for a, b in zip(found, found[1:]))
+    # Mismos puntos salvo empates dentro de la tolerancia
+    for (i, d), (_, j) in zip(found, expected):
+        assert i == j or abs(_haversine(lat, lng, index.lat[j], index.lng[j]) - d) <= TOLERANCE
+
+
+@pytest.mark.parametrize("lat,lng", QUERIES)
+@pytest.mark.parametrize("radius", (0.5, 5.0, 60.0))
+def test_within_matches_brute_force(index, lat, lng, radius):
+    distances = _brute_force(index, lat, lng)
+    found = index.within(lat, lng, radius)
+    found_ids = {i for i, _ in found}
+
+    # Todo lo claramente dentro aparece y nada de lo devuelto queda claramente fuera
+    assert {i for d, i in distances if d <= radius - TOLERANCE} <= found_ids
+    assert found_ids <= {i for d, i in distances if d <= radius + TOLERANCE}
+    assert len(found_ids) == len(found)
+    assert all(a[1] <= b[1] + TOLERANCE for a, b in zip(found, found[1:]))
+
+
+def test_k_larger_than_the_index_returns_everything(index):
+    found = index.nearest(40.4168, -3.7038, len(index) + 100, max_km=30000)
+    assert sorted(i for i, _ in found) == list(range(len(index)))
+    assert index.nearest(40.4168, -3.7038, 0) == []
+
+
+def test_empty_radius(index):
+    assert index.within(-30.0, 100.0, 50.0) == []  # Océano Índico
+    assert index.nearest(-30.0, 100.0, 10, max_km=50.0) == []
+    # Radio mínimo sobre un POI: solo ese punto
+    i = 17
+    lat, lng = index.lat[i], index.lng[i]
+    assert [j for j, _ in index.within(lat, lng, 0.01)] == [i]
+
+
+def test_antimeridian_neighbors_are_found_across_the_line(index):
+    # Un punto al este de la línea ve los del oeste a pocos km
+    found = index.within(0.0, 179.99, 120.0)
+    lngs = [index.lng[i] for i, _ in found]
+    assert any(lng < 0 for lng in lngs) and any(lng > 0 for lng in lngs)
+
+
+def test_nearest_restaurants_reads_the_records(tmp_path):
+    path = tmp_path / "pois.bin"
+    write_poi_file(str(path), [("a", "Casa Ana", 40.0, -3.0, 4.26), ("b", "Bar Luis", 40.01, -3.0, None)])
+    index = PoiIndex(str(path))
+    try:
+        first, second = index.nearest_restaurants(40.0, -3.0, 5)
+        assert (first.id, first.name, first.rating, first.distance) == ("a", "Casa Ana", "4.3", "0.00")
+        assert (second.id, second.rating) == ("b", "N/A")
+        assert float(second.distance) == pytest.approx(1.11, abs=0.01)
+    finally:
+        index.close()
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from managers.room_manager import RoomManager
+from models.game import Game
+from models.restaurant import Restaurant
+from utils import restaurant_cache as restaurant_cache_module
+from utils import restaurant_fetcher
+from utils.prefetch import RestaurantPrefetch
+from utils.restaurant_cache import RestaurantCache
+from utils.restaurant_fetcher import close_async_client
+from utils.room_codes import RoomCodeAllocator
+from utils.timer_wheel import TimerWheel
+
+LOCATION = "40.4168,-3.7038"
+
+
+class FakeWebSocket:
+    async def send_text(self, text):
+        pass
+
+    async def send_bytes(self, data):
+        pass
+
+    async def close(self):
+        pass
+
+
+class FakePoiIndex:
+    def nearest_restaurants(self, lat, lng, limit, max_distance_km):
+        return [Restaurant(id="poi1", name="POI 1", rating="4.0", distance="0.10", photo_url="")]
+
+
+@pytest.fixture
+def cache(places_stub, monkeypatch):
+    # Tres páginas por celda: el top-k queda decidido con la primera
+    places_stub.pages = 3
+    places_stub.latency = 0.05
+    cache = RestaurantCache(page_wait=0.1)
+    monkeypatch.setattr(restaurant_cache_module, "restaurant_cache", cache)
+    return cache
+
+
+async def _start_game(prefetch=None, wait_prefetch=False):
+    manager = RoomManager(timers=TimerWheel(), room_codes=RoomCodeAllocator(cooldown=0))
+    response = await manager.join_room_with_prefix_0(FakeWebSocket(), "0ana")
+    sala = manager.rooms[response[4:9]]
+    try:
+        if prefetch:
+            sala.prefetch = RestaurantPrefetch(LOCATION)
+            if wait_prefetch:
+                await asyncio.wait([sala.prefetch.task])
+        sala.game = Game(LOCATION, sala, timers=manager.timers, stream_mode=False)
+        await sala.game.start()
+        return [r.id for r in sala.game.restaurants]
+    finally:
+        await close_async_client()
+
+
+def test_prefetched_start_costs_no_more_upstream_requests(places_stub, cache):
+    normal = asyncio.run(_start_game())
+    assert places_stub.requests == 1
+
+    # Otra celda vacía: la precarga termina antes de empezar
+    cache.entries.clear()
+    prefetched = asyncio.run(_start_game(prefetch=True, wait_prefetch=True))
+    assert prefetched == normal
+    assert places_stub.requests == 2
+
+    # La precarga sigue en curso al empezar: la partida se une a su petición
+    cache.entries.clear()
+    pending = asyncio.run(_start_game(prefetch=True))
+    assert pending == normal
+    assert places_stub.requests == 3
+
+
+def test_failed_prefetch_falls_back_like_a_normal_start(places_stub, cache, monkeypatch):
+    places_stub.error_rate = 1.0
+    places_stub.error_status = "500"
+    monkeypatch.setattr(restaurant_cache_module, "get_poi_index", lambda: FakePoiIndex())
+    monkeypatch.setattr(restaurant_fetcher, "get_poi_index", lambda: FakePoiIndex())
+
+    assert asyncio.run(_start_game(prefetch=True, wait_prefetch=True)) == ["poi1"]
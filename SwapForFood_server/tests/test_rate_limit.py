@@ -0,0 +1,149 @@
+import asyncio
+import json
+
+import pytest
+
+from routers import websocket_routes
+from routers.dispatcher import Connection, PROTOCOL_JSON
+from routers.websocket_routes import dispatch, dispatcher, room_manager
+from utils.metrics import THROTTLED
+from utils import rate_limit
+from utils.rate_limit import RateLimiter, TokenBucket, _limits, _parse_limit
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeWebSocket:
+    def __init__(self, incoming=()):
+        self.incoming = list(incoming)
+        self.sent = []
+
+    async def receive_text(self):
+        if not self.incoming:
+            await asyncio.sleep(0.01)  # Dejar que el escritor envíe las respuestas
+            raise RuntimeError("Conexión rota")
+        return json.dumps(self.incoming.pop(0))
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text)["message"])
+
+    async def send_bytes(self, data):
+        pass
+
+    async def close(self):
+        pass
+
+
+def _throttled(scope, cls):
+    return THROTTLED.values.get((("scope", scope), ("cls", cls)), 0)
+
+
+def test_parse_limit():
+    assert _parse_limit("2/10") == (2.0, 10.0)
+    assert _parse_limit("3") == (3.0, 3.0)
+    assert _parse_limit("0") is None and _parse_limit("") is None
+
+
+def test_limits_are_off_unless_enabled(monkeypatch):
+    defaults = (("frame", "20/40"), ("vote", "10/20"))
+    monkeypatch.delenv("RATE_LIMIT_FRAME", raising=False)
+    monkeypatch.delenv("RATE_LIMIT_VOTE", raising=False)
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_ENABLED", False)
+    assert _limits("RATE_LIMIT_", defaults) == {"frame": None, "vote": None}
+    # Un límite concreto puede activarse sin los demás
+    monkeypatch.setenv("RATE_LIMIT_FRAME", "5/10")
+    assert _limits("RATE_LIMIT_", defaults) == {"frame": (5.0, 10.0), "vote": None}
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_ENABLED", True)
+    assert _limits("RATE_LIMIT_", defaults) == {"frame": (5.0, 10.0), "vote": (10.0, 20.0)}
+
+
+def test_bucket_allows_burst_then_refills_with_the_clock():
+    bucket = TokenBucket(rate=2, burst=3, now=0.0)
+    assert [bucket.allow(0.0) for _ in range(4)] == [True, True, True, False]
+    assert not bucket.allow(0.25)  # Medio token
+    assert bucket.allow(0.5)
+    # Tras mucho tiempo parado no se acumula más que la ráfaga
+    assert sum(bucket.allow(100.0) for _ in range(10)) == 3
+
+
+def test_frame_limit_per_socket():
+    clock = FakeClock()
+    limiter = RateLimiter(socket_limits={"frame": (10, 5)}, room_limits={}, clock=clock)
+    first, second = {}, {}
+    before = _throttled("socket", "frame")
+    assert sum(limiter.allow_frame(first) for _ in range(20)) == 5
+    # Cada conexión tiene sus propios buckets
+    assert limiter.allow_frame(second)
+    clock.now += 0.3
+    assert sum(limiter.allow_frame(first) for _ in range(20)) == 3
+    assert _throttled("socket", "frame") - before == 32
+
+
+def test_room_limit_is_shared_by_all_sockets():
+    clock = FakeClock()
+    limiter = RateLimiter(socket_limits={"chat": (1, 2)}, room_limits={"chat": (1, 3)}, clock=clock)
+    room = {}
+    sockets = [{} for _ in range(3)]
+    allowed = [limiter.allow_command("chat", buckets, room) for buckets in sockets for _ in range(2)]
+    # Cada conexión podría enviar 2, pero la sala entera solo 3
+    assert allowed.count(True) == 3
+    # Comandos sin clase (p. ej. remove_user) no se limitan
+    assert all(limiter.allow_command("remove_user", sockets[0], room) for _ in range(10))
+    # Clases sin límite configurado tampoco
+    assert all(limiter.allow_command("vote", sockets[0], room) for _ in range(10))
+    clock.now += 1
+    assert limiter.allow_command("chat", sockets[2], room)
+
+
+def test_dispatch_rejects_throttled_chat(monkeypatch):
+    clock = FakeClock()
+    limiter = RateLimiter(socket_limits={"chat": (1, 2)}, room_limits={"chat": (1, 3)}, clock=clock)
+    monkeypatch.setattr(websocket_routes, "rate_limiter", limiter)
+
+    async def main():
+        leader, guest = FakeWebSocket(), FakeWebSocket()
+        response = await room_manager.join_room_with_prefix_0(leader, "0ana")
+        await room_manager.join_room_with_prefix_1(guest, f"1{response[4:9]}luis")
+        try:
+            cmd, args = dispatcher.resolve_v2({"op": "chat", "args": {"text": "hola"}})
+            leader_conn, guest_conn = Connection(leader, PROTOCOL_JSON), Connection(guest, PROTOCOL_JSON)
+            replies = []
+            for conn in (leader_conn, leader_conn, leader_conn, guest_conn, guest_conn):
+                reply, _ = await dispatch(conn, cmd, args)
+                replies.append(reply.message)
+            throttled = [message == "1000Error: Demasiadas peticiones." for message in replies]
+            # El tercero supera el límite del líder; el último, el de la sala
+            assert throttled == [False, False, True, False, True]
+        finally:
+            await room_manager.handle_disconnect(guest)
+            await room_manager.handle_disconnect(leader)
+
+    asyncio.run(main())
+
+
+def test_legacy_loop_answers_frames_over_the_limit(monkeypatch):
+    limiter = RateLimiter(socket_limits={"frame": (1, 2)}, room_limits={}, clock=FakeClock())
+    monkeypatch.setattr(websocket_routes, "rate_limiter", limiter)
+
+    async def main():
+        websocket = FakeWebSocket([
+            {"sender": "ana", "content": "0ana"},
+            {"sender": "ana", "content": "9"},
+            {"sender": "ana", "content": "51r1"},  # Un voto por encima del límite
+        ])
+        with pytest.raises(RuntimeError):
+            await websocket_routes._legacy_loop(Connection(websocket))
+        # Cada frame tiene su respuesta; el voto no se pierde en silencio
+        assert len(websocket.sent) == 3
+        assert websocket.sent[0].startswith("0000") and websocket.sent[1].startswith("0000RESUME_TOKEN.")
+        assert websocket.sent[2] == "1000Error: Demasiadas peticiones."
+
+    before = _throttled("socket", "frame")
+    asyncio.run(main())
+    assert _throttled("socket", "frame") == before + 1
@@ -0,0 +1,128 @@
+import asyncio
+import json
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from backends.redis_backend import RedisBackend
+from managers.room_manager import RoomManager
+from models.game import Game
+from utils.room_codes import RoomCodeAllocator
+from utils.timer_wheel import TimerWheel
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text)["message"])
+
+    async def send_bytes(self, data):
+        self.sent.append(data)
+
+    async def close(self):
+        pass
+
+
+async def _eventually(check, timeout=3.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not check():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("La condición no se cumplió a tiempo")
+        await asyncio.sleep(0.02)
+
+
+def _worker(server):
+    client = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    backend = RedisBackend(client=client, lease_ttl=60)
+    return RoomManager(backend, timers=TimerWheel(), room_codes=RoomCodeAllocator(cooldown=0))
+
+
+def test_two_workers_share_rooms_chat_votes_and_leadership():
+    async def main():
+        server = fakeredis.FakeServer()
+        worker_a, worker_b = _worker(server), _worker(server)
+        await worker_a.backend.start(worker_a.handle_backend_event)
+        await worker_b.backend.start(worker_b.handle_backend_event)
+        ana, luis = FakeWebSocket(), FakeWebSocket()
+        try:
+            # Unirse desde otro worker a una sala creada en el primero
+            response = await worker_a.join_room_with_prefix_0(ana, "0ana")
+            code = response[4:9]
+            assert await worker_b.join_room_with_prefix_1(luis, f"1{code}luis") == "00012ana.luis"
+            await _eventually(lambda: "USER_JOINED.luis" in ana.sent)
+
+            # Chat entre workers
+            await worker_b.broadcast_chat_message("luis", "hola", luis)
+            await _eventually(lambda: "NEW_MESSAGE.luis:hola" in ana.sent)
+
+            # Los votos del otro worker llegan a la partida
+            sala_a = worker_a.rooms[code]
+            sala_a.game = Game("40.4168,-3.7038", sala_a, offline=True, timers=worker_a.timers)
+            await sala_a.game.start()
+            await _eventually(lambda: worker_b.rooms[code].remote_game)
+            restaurant = sala_a.game.restaurants[0]
+            assert await worker_b.register_vote(luis, "0", restaurant.id) == "VOTE_REGISTERED"
+            await _eventually(lambda: sala_a.game.votes_cast == 1)
+            assert sala_a.game.results[restaurant.name] == ["luis"]
+
+            # El liderazgo pasa al otro worker cuando el líder se va
+            await worker_a.handle_disconnect(ana)
+            await _eventually(lambda: worker_b.rooms[code].get_user_by_websocket(luis).is_leader)
+            assert await worker_b.backend.get_leader(code) == "luis"
+            assert "NEW_LEADER.luis" in luis.sent
+        finally:
+            await worker_a.backend.close()
+            await worker_b.backend.close()
+    asyncio.run(main())
+
+
+def test_room_keys_expire_unless_refreshed():
+    async def main():
+        server = fakeredis.FakeServer()
+        worker = _worker(server)
+        await worker.backend.start(worker.handle_backend_event)
+        redis = worker.backend.redis
+        try:
+            response = await worker.join_room_with_prefix_0(FakeWebSocket(), "0ana")
+            code = response[4:9]
+            room_key, members_key = worker.backend._room_key(code), worker.backend._members_key(code)
+            assert 0 < await redis.ttl(room_key) <= 60
+            assert 0 < await redis.ttl(members_key) <= 60
+
+            await redis.expire(room_key, 5)
+            await worker.reap()  # El reaper renueva el alquiler de las salas locales
+            assert await redis.ttl(room_key) > 5
+        finally:
+            await worker.backend.close()
+    asyncio.run(main())
+
+
+def test_reader_logs_failing_event_handlers(caplog):
+    async def main():
+        server = fakeredis.FakeServer()
+        a = RedisBackend(client=fakeredis.aioredis.FakeRedis(server=server, decode_responses=True))
+        b = RedisBackend(client=fakeredis.aioredis.FakeRedis(server=server, decode_responses=True))
+        received = []
+
+        async def failing(code, event):
+            received.append(event)
+            raise RuntimeError("evento roto")
+
+        await a.start(failing)
+        await b.start(failing)
+        try:
+            await a.subscribe("12345")
+            await asyncio.sleep(0.1)
+            await b.publish("12345", {"type": "frame", "text": "x"})
+            await b.publish("12345", {"type": "frame", "text": "y"})
+            await _eventually(lambda: len(received) == 2)  # La lectura sigue tras el error
+        finally:
+            await a.close()
+            await b.close()
+
+    with caplog.at_level("ERROR", logger="backends.redis_backend"):
+        asyncio.run(main())
+    assert "evento roto" in caplog.text
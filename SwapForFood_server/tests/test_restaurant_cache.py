@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from utils.restaurant_cache import RestaurantCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def paged_fetcher(pages, delay=0.01, calls=None):
+    async def fetcher(lat, lng):
+        if calls is not None:
+            calls.append((lat, lng))
+        for page in pages:
+            await asyncio.sleep(delay)
+            yield page
+    return fetcher
+
+
+PAGES = [[{"place_id": "a"}, {"place_id": "b"}], [{"place_id": "c"}], [{"place_id": "d"}]]
+
+
+def test_waiter_survives_owner_cancellation():
+    async def main():
+        calls = []
+        cache = RestaurantCache(fetcher=paged_fetcher(PAGES, calls=calls), clock=FakeClock())
+        owner = asyncio.create_task(cache.fetch(40.0, -3.0))
+        await asyncio.sleep(0.015)  # El dueño ya tiene la primera página
+        waiter = asyncio.create_task(cache.fetch(40.0, -3.0))
+        await asyncio.sleep(0)
+        owner.cancel()
+        results = await waiter
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        return calls, results, cache
+
+    calls, results, cache = asyncio.run(main())
+    assert [r["place_id"] for r in results] == ["a", "b", "c", "d"]
+    assert len(calls) == 1
+    assert cache.coalesced == 1
+
+
+def test_early_close_stops_paging_and_marks_entry_incomplete():
+    async def main():
+        calls = []
+        fetched = []
+
+        async def fetcher(lat, lng):
+            calls.append((lat, lng))
+            for page in PAGES:
+                await asyncio.sleep(0.01)
+                fetched.append(page)
+                yield page
+
+        cache = RestaurantCache(fetcher=fetcher, clock=FakeClock(), page_wait=0.02)
+        pages = cache.pages(40.0, -3.0)
+        first = await anext(pages)
+        await pages.aclose()  # El consumidor ya tiene suficientes candidatos
+        partial = cache.get(next(iter(cache.in_flight)))
+        while cache.in_flight:
+            await asyncio.sleep(0.01)
+        # Nadie pidió la segunda página: no se llegó a pedir a Places
+        assert fetched == PAGES[:1]
+        (cell, (_, results, cached_pages, complete)), = cache.entries.items()
+
+        # Quien necesita todo sigue leyendo y la celda se vuelve a pedir
+        everything = await cache.fetch(40.0, -3.0)
+        (_, (_, _, _, complete_after)), = cache.entries.items()
+        return first, partial, results, complete, everything, complete_after, calls
+
+    first, partial, results, complete, everything, complete_after, calls = asyncio.run(main())
+    assert [r["place_id"] for r in first] == ["a", "b"]
+    assert partial is None
+    assert [r["place_id"] for r in results] == ["a", "b"] and not complete
+    assert [r["place_id"] for r in everything] == ["a", "b", "c", "d"]
+    assert complete_after and len(calls) == 2
+
+
+def test_upstream_error_reaches_every_waiter():
+    async def failing(lat, lng):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("Places caído")
+        yield
+
+    async def main():
+        cache = RestaurantCache(fetcher=failing, clock=FakeClock())
+        return await asyncio.gather(cache.fetch(1.0, 1.0), cache.fetch(1.0, 1.0), return_exceptions=True)
+
+    errors = asyncio.run(main())
+    assert all(isinstance(e, RuntimeError) for e in errors)
@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+import pytest
+
+from utils import restaurant_fetcher
+from utils.restaurant_fetcher import fetch_restaurants, fetch_restaurants_async, close_async_client
+
+LOCATION = "40.4168,-3.7038"
+
+
+async def _fetch_and_close():
+    try:
+        return await fetch_restaurants_async(LOCATION)
+    finally:
+        # El cliente compartido queda ligado al event loop de cada prueba
+        await close_async_client()
+
+
+def test_async_fetch_against_stub(places_stub):
+    restaurants = asyncio.run(_fetch_and_close())
+    assert len(restaurants) == restaurant_fetcher.MAX_RESULTS
+    assert all(r.id.startswith("stub-") and r.distance for r in restaurants)
+    assert places_stub.requests == 1
+
+
+def test_sync_fetch_is_still_available_for_scripts(places_stub):
+    async_restaurants = asyncio.run(_fetch_and_close())
+    restaurants = fetch_restaurants(LOCATION)
+    assert [r.id for r in restaurants] == [r.id for r in async_restaurants]
+    assert places_stub.requests == 2
+
+
+def test_slow_lookup_does_not_block_the_event_loop(places_stub):
+    places_stub.latency = 0.3
+
+    async def main():
+        gaps = []
+
+        async def ticker(stop):
+            last = time.perf_counter()
+            while not stop.is_set():
+                await asyncio.sleep(0.01)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        stop = asyncio.Event()
+        tick = asyncio.create_task(ticker(stop))
+        try:
+            await fetch_restaurants_async(LOCATION)
+        finally:
+            stop.set()
+            await tick
+            await close_async_client()
+        return gaps
+
+    gaps = asyncio.run(main())
+    # El resto de salas sigue atendiéndose mientras se espera a Places
+    assert len(gaps) >= 10
+    assert max(gaps) < 0.15
+
+
+def test_concurrent_lookups_are_bounded(places_stub, monkeypatch):
+    places_stub.latency = 0.05
+    monkeypatch.setattr(restaurant_fetcher, "MAX_CONCURRENT_LOOKUPS", 2)
+
+    async def main():
+        try:
+            return await asyncio.gather(*(
+                fetch_restaurants_async(f"40.{n}168,-3.7038") for n in range(6)
+            ))
+        finally:
+            await close_async_client()
+
+    results = asyncio.run(main())
+    assert all(len(r) == restaurant_fetcher.MAX_RESULTS for r in results)
+    assert places_stub.requests == 6
+    assert places_stub.max_in_flight == 2
+
+
+def test_upstream_error_status_raises(places_stub):
+    places_stub.error_rate = 1.0
+    places_stub.error_status = "REQUEST_DENIED"
+    with pytest.raises(Exception, match="REQUEST_DENIED"):
+        asyncio.run(_fetch_and_close())
@@ -0,0 +1,143 @@
+import asyncio
+import random
+
+import pytest
+
+from managers.room_manager import RoomManager
+from utils.room_codes import RoomCodeAllocator, RoomCodesExhausted, ROOM_CODE_SPACE, _IN_USE, _COOLING
+from utils.timer_wheel import TimerWheel
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeWebSocket:
+    async def send_text(self, text):
+        pass
+
+    async def send_bytes(self, data):
+        pass
+
+    async def close(self):
+        pass
+
+
+def _check_invariants(allocator, in_use):
+    # Cada código está exactamente en un sitio: la lista libre, en uso o en espera
+    assert len(set(allocator.free)) == len(allocator.free)
+    for index, code in enumerate(allocator.free):
+        assert allocator.position[code] == index
+    assert all(allocator.position[int(code)] == _IN_USE for code in in_use)
+    cooling = sum(1 for state in allocator.position if state == _COOLING)
+    assert len(allocator.free) + len(in_use) + cooling == allocator.size
+
+
+def test_fills_the_whole_code_space():
+    allocator = RoomCodeAllocator(cooldown=0, rng=random.Random(1))
+    codes = [allocator.allocate() for _ in range(ROOM_CODE_SPACE)]
+    assert len(set(codes)) == ROOM_CODE_SPACE
+    assert all(len(code) == 5 and code.isdigit() for code in codes)
+    with pytest.raises(RoomCodesExhausted):
+        allocator.allocate()
+
+    allocator.release(codes[123])
+    assert allocator.allocate() == codes[123]
+
+
+def test_churn_near_full_space_with_cooldown():
+    clock = FakeClock()
+    rng = random.Random(2)
+    allocator = RoomCodeAllocator(cooldown=30, clock=clock, rng=random.Random(3))
+    in_use = [allocator.allocate() for _ in range(ROOM_CODE_SPACE * 99 // 100)]
+
+    exhausted = 0
+    for _ in range(50000):
+        clock.now += rng.random()
+        if rng.random() < 0.5:
+            index = rng.randrange(len(in_use))
+            in_use[index], in_use[-1] = in_use[-1], in_use[index]
+            allocator.release(in_use.pop())
+        else:
+            try:
+                in_use.append(allocator.allocate())
+            except RoomCodesExhausted:
+                exhausted += 1
+
+    assert exhausted == 0
+    assert len(set(in_use)) == len(in_use)
+    _check_invariants(allocator, in_use)
+
+
+def test_cooldown_delays_reuse():
+    clock = FakeClock()
+    allocator = RoomCodeAllocator(size=2, cooldown=30, clock=clock)
+    first, second = allocator.allocate(), allocator.allocate()
+    allocator.release(first)
+    with pytest.raises(RoomCodesExhausted):
+        allocator.allocate()
+
+    # Reservado mientras esperaba (p. ej. al restaurar): no vuelve a la lista al caducar
+    assert allocator.reserve(first)
+    clock.now = 31
+    assert allocator.available() == 0
+    assert not allocator.reserve(first)
+
+    allocator.release(second, cooldown=0)
+    assert allocator.allocate() == second
+    _check_invariants(allocator, [first, second])
+
+
+def test_release_after_reserving_a_cooling_code_restarts_the_cooldown():
+    clock = FakeClock()
+    allocator = RoomCodeAllocator(size=2, cooldown=30, clock=clock)
+    code, other = allocator.allocate(), allocator.allocate()
+    allocator.release(code)  # Libre a partir de t=30
+
+    clock.now = 10
+    assert allocator.reserve(code)
+    clock.now = 20
+    allocator.release(code)  # La espera vuelve a empezar: libre a partir de t=50
+
+    # La entrada de la primera liberación no acorta la espera
+    clock.now = 31
+    assert allocator.available() == 0
+    with pytest.raises(RoomCodesExhausted):
+        allocator.allocate()
+    _check_invariants(allocator, [other])
+
+    clock.now = 50
+    assert allocator.available() == 1
+    assert allocator.allocate() == code
+    assert not allocator.cooling
+    _check_invariants(allocator, [code, other])
+
+
+def test_room_manager_reports_exhaustion_and_reuses_removed_rooms():
+    async def main():
+        clock = FakeClock()
+        allocator = RoomCodeAllocator(cooldown=0, clock=clock)
+        # Solo quedan diez códigos libres
+        for code in range(10, ROOM_CODE_SPACE):
+            allocator.reserve(f"{code:05}")
+        manager = RoomManager(timers=TimerWheel(clock=clock), room_codes=allocator)
+        leaders = [FakeWebSocket() for _ in range(10)]
+        for n, websocket in enumerate(leaders):
+            await manager.join_room_with_prefix_0(websocket, f"0user{n}")
+        codes = [manager.websocket_to_room[websocket] for websocket in leaders]
+        assert sorted(codes) == [f"{code:05}" for code in range(10)]
+
+        response = await manager.join_room_with_prefix_0(FakeWebSocket(), "0extra")
+        assert response == "1000Error: No quedan códigos de sala disponibles."
+
+        # El último usuario sale: la sala se cierra y su código vuelve al pool
+        await manager.handle_disconnect(leaders[4])
+        websocket = FakeWebSocket()
+        await manager.join_room_with_prefix_0(websocket, "0extra")
+        assert manager.websocket_to_room[websocket] == codes[4]
+
+    asyncio.run(main())
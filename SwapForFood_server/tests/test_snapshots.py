@@ -0,0 +1,52 @@
+import asyncio
+import os
+
+from utils.snapshots import StateJournal
+
+
+def _log_files(tmp_path):
+    return sorted(name for name in os.listdir(tmp_path) if name.endswith(".log"))
+
+
+def test_record_is_buffered_until_flush(tmp_path):
+    async def main():
+        journal = StateJournal(str(tmp_path / "state.bin"))
+        journal.record("open", "ABCDE")
+        journal.record("join", "ABCDE", "ana", "token", True)
+        assert _log_files(tmp_path) == []
+        await journal.flush()
+        await journal.close()
+
+        _, _, deltas = StateJournal(journal.path).load()
+        assert [delta for _, delta in deltas] == [["open", "ABCDE"], ["join", "ABCDE", "ana", "token", True]]
+    asyncio.run(main())
+
+
+def test_background_task_flushes_periodically(tmp_path):
+    async def main():
+        journal = StateJournal(str(tmp_path / "state.bin"), flush_interval=0.01)
+        await journal.start()
+        journal.record("open", "ABCDE")
+        await asyncio.sleep(0.05)
+        assert len(_log_files(tmp_path)) == 1
+        assert journal.pending == []
+        await journal.close()
+    asyncio.run(main())
+
+
+def test_cut_keeps_later_records_out_of_the_snapshot(tmp_path):
+    async def main():
+        journal = StateJournal(str(tmp_path / "state.bin"), flush_interval=0.01)
+        await journal.start()
+        journal.record("open", "ABCDE")
+        seq = journal.cut()
+        journal.record("join", "ABCDE", "ana", "token", True)  # Posterior al snapshot
+        await journal.flush()
+        journal.write_snapshot(seq, [["ABCDE", [], None]])
+        await journal.close()
+
+        rooms, _, deltas = StateJournal(journal.path).load()
+        assert rooms == [["ABCDE", [], None]]
+        assert [delta for _, delta in deltas] == [["join", "ABCDE", "ana", "token", True]]
+        assert len(_log_files(tmp_path)) == 1
+    asyncio.run(main())
@@ -0,0 +1,165 @@
+import asyncio
+import json
+
+import pytest
+
+from managers.room_manager import RoomManager
+from models import game as game_module
+from models.game import Game
+from utils import restaurant_fetcher
+from utils.restaurant_cache import stream_restaurants_cached
+from utils.room_codes import RoomCodeAllocator
+from utils.timer_wheel import TimerWheel
+
+LOCATION = "40.4168,-3.7038"
+# Restaurantes de prueba del modo offline, en su orden
+OFFLINE_IDS = ["1", "27", "3", "4"]
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text)["message"])
+
+    async def send_bytes(self, data):
+        self.sent.append(data)
+
+    async def close(self):
+        pass
+
+    def cards(self):
+        # Ids de cada lote NEW_RESTAURANT recibido
+        return [[r["id"] for r in json.loads(m[len("NEW_RESTAURANT."):])]
+                for m in self.sent if m.startswith("NEW_RESTAURANT.")]
+
+
+@pytest.fixture(autouse=True)
+def stream_settings(monkeypatch):
+    monkeypatch.setattr(game_module, "STREAM_BATCH_SIZE", 2)
+    monkeypatch.setattr(game_module, "STREAM_REFILL_AT", 1)
+    # Sin fichero de POIs: el fetcher offline devuelve sus cuatro restaurantes fijos
+    monkeypatch.setattr(restaurant_fetcher, "OFFLINE_POI_FILE", None)
+    monkeypatch.setattr(restaurant_fetcher, "_poi_index", None)
+
+
+async def _flush():
+    # Dejar que las tareas escritoras envíen lo encolado
+    await asyncio.sleep(0.02)
+
+
+async def _start(offline=True):
+    manager = RoomManager(timers=TimerWheel(), room_codes=RoomCodeAllocator(cooldown=0))
+    ana, luis = FakeWebSocket(), FakeWebSocket()
+    response = await manager.join_room_with_prefix_0(ana, "0ana")
+    await manager.join_room_with_prefix_1(luis, f"1{response[4:9]}luis")
+    sala = manager.rooms[response[4:9]]
+    sala.game = game = Game(LOCATION, sala, offline=offline, timers=manager.timers, stream_mode=True)
+    await game.start()
+    await _flush()
+    return manager, game, ana, luis
+
+
+async def _close(manager, *websockets):
+    for websocket in websockets:
+        await manager.handle_disconnect(websocket)
+
+
+def test_each_participant_has_their_own_cursor():
+    async def main():
+        manager, game, ana, luis = await _start()
+        try:
+            assert not game.streaming and list(game.cursors) == [2, 2]
+            assert ana.cards() == luis.cards() == [OFFLINE_IDS[:2]]
+
+            # Una carta que todavía no se le ha enviado no cuenta
+            await game.register_vote("luis", "1", "3")
+            assert game.votes_cast == 0
+
+            # Ana vota y recibe el siguiente lote; Luis sigue donde estaba
+            await game.register_vote("ana", "1", "1")
+            await _flush()
+            assert list(game.cursors) == [4, 2]
+            assert ana.cards() == [OFFLINE_IDS[:2], OFFLINE_IDS[2:]]
+            assert luis.cards() == [OFFLINE_IDS[:2]]
+            # El mismo lote se serializa una vez para todos los que tienen el mismo cursor
+            assert set(game.card_frames) == {(0, 2), (2, 4)}
+        finally:
+            await _close(manager, luis, ana)
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("refill_at", (0, 1))
+def test_refill_waits_for_stream_refill_at(monkeypatch, refill_at):
+    monkeypatch.setattr(game_module, "STREAM_REFILL_AT", refill_at)
+
+    async def main():
+        manager, game, ana, luis = await _start()
+        try:
+            # Con dos cartas por lote, el siguiente sale cuando quedan refill_at sin votar
+            for n, restaurant_id in enumerate(OFFLINE_IDS[:2], start=1):
+                await game.register_vote("ana", "1", restaurant_id)
+                await _flush()
+                unvoted = 2 - n
+                assert game.cursors[0] == (4 if unvoted <= refill_at else 2)
+            assert len(ana.cards()) == 2
+        finally:
+            await _close(manager, luis, ana)
+
+    asyncio.run(main())
+
+
+def test_unanimous_like_ends_the_game_early():
+    async def main():
+        manager, game, ana, luis = await _start()
+        sala = game.room
+        try:
+            await game.register_vote("ana", "0", "27")
+            assert not game.game_ended
+            await game.register_vote("luis", "0", "27")
+            await _flush()
+            # Quedaban cartas sin enviar ni votar
+            assert game.game_ended and sala.game is None
+            assert game.votes_cast == 2 and len(game.restaurants) == 4
+            results = [m for m in ana.sent if m.startswith("GAME_RESULTS.")]
+            assert len(results) == 1 and "'Restaurante Prueba 2': ['ana', 'luis']" in results[0]
+        finally:
+            await _close(manager, luis, ana)
+
+    asyncio.run(main())
+
+
+def test_game_ends_when_streaming_stops_with_all_cards_voted(monkeypatch):
+    more_pages = asyncio.Event()
+
+    async def paged(location, offline=False):
+        # Una página del fetcher offline; el stream no termina hasta que lo diga el test
+        async for batch in stream_restaurants_cached(location, offline=True):
+            yield batch[:2]
+            await more_pages.wait()
+
+    monkeypatch.setattr(game_module, "stream_restaurants_cached", paged)
+
+    async def main():
+        manager, game, ana, luis = await _start(offline=False)
+        try:
+            assert game.streaming and len(game.restaurants) == 2
+            for username in ("ana", "luis"):
+                for restaurant_id in OFFLINE_IDS[:2]:
+                    await game.register_vote(username, "1", restaurant_id)
+            # Todo votado, pero pueden llegar más restaurantes: la partida sigue
+            assert not game.game_ended and game.pending
+
+            stream_task = game.stream_task
+            more_pages.set()
+            await asyncio.wait_for(stream_task, 1)
+            await _flush()
+            assert not game.streaming
+            assert game.game_ended and game.room.game is None
+            assert any(m.startswith("GAME_RESULTS.") for m in luis.sent)
+        finally:
+            await _close(manager, luis, ana)
+
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+
+from utils.timer_wheel import TimerWheel
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def _wheel(slots=16):
+    clock = FakeClock()
+    return TimerWheel(tick=0.1, slots=slots, clock=clock), clock
+
+
+def test_timers_fire_on_their_tick_and_not_before():
+    async def main():
+        wheel, clock = _wheel()
+        fired = []
+        wheel.schedule(0.5, fired.append, "a")
+        wheel.schedule(1.0, fired.append, "b")
+        cancelled = wheel.schedule(0.3, fired.append, "x")
+        cancelled.cancel()
+
+        clock.now += 0.45
+        await wheel.advance()
+        assert fired == []
+        clock.now += 0.1
+        await wheel.advance()
+        assert fired == ["a"]
+        clock.now += 0.5
+        await wheel.advance()
+        assert fired == ["a", "b"]
+        assert wheel.pending() == 0
+    asyncio.run(main())
+
+
+def test_periodic_timer_and_jumps_longer_than_a_rotation():
+    async def main():
+        wheel, clock = _wheel(slots=4)
+        fired = []
+        wheel.schedule_periodic(0.2, lambda: fired.append(clock.now))
+        wheel.schedule(5.0, fired.append, "late")
+        for _ in range(3):
+            clock.now += 0.2
+            await wheel.advance()
+        assert len(fired) == 3
+        clock.now += 10.0  # Más de una vuelta de la rueda de golpe
+        await wheel.advance()
+        assert "late" in fired and len(fired) == 5
+    asyncio.run(main())
+
+
+def test_failing_callback_is_logged_and_others_still_fire(caplog):
+    async def main():
+        wheel, clock = _wheel()
+        fired = []
+
+        def broken():
+            raise ValueError("temporizador roto")
+
+        wheel.schedule(0.1, broken)
+        wheel.schedule(0.1, fired.append, "ok")
+        clock.now += 0.2
+        assert await wheel.advance() == 2
+        return fired
+
+    with caplog.at_level(logging.ERROR, logger="utils.timer_wheel"):
+        assert asyncio.run(main()) == ["ok"]
+    assert "temporizador roto" in caplog.text
+
+
+def test_coroutine_callbacks_run_as_tasks(caplog):
+    async def main():
+        wheel, clock = _wheel()
+        gate = asyncio.Event()
+        done = []
+
+        async def slow():
+            await gate.wait()
+            done.append("slow")
+
+        async def broken():
+            raise ValueError("corrutina rota")
+
+        wheel.schedule(0.1, slow)
+        wheel.schedule(0.1, broken)
+        clock.now += 0.2
+        # advance no espera al callback lento
+        assert await wheel.advance() == 2
+        assert done == [] and len(wheel.callback_tasks) == 2
+        gate.set()
+        await wheel.drain()
+        assert done == ["slow"] and not wheel.callback_tasks
+
+    with caplog.at_level(logging.ERROR, logger="utils.timer_wheel"):
+        asyncio.run(main())
+    assert "corrutina rota" in caplog.text
@@ -0,0 +1,137 @@
+import asyncio
+import time
+
+import pytest
+
+from utils import restaurant_fetcher
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError, CLOSED, OPEN
+from utils.metrics import PLACES_FALLBACKS
+from utils.restaurant_cache import RestaurantCache, geohash_encode, geohash_neighbors
+from utils.restaurant_fetcher import API_KEY, PLACE_TYPE, nearby_search_async, close_async_client
+
+LAT, LNG = 40.4168, -3.7038
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def breaker(places_stub, monkeypatch):
+    clock = FakeClock()
+    breaker = CircuitBreaker("places", failure_threshold=3, reset_timeout=30, clock=clock)
+    monkeypatch.setattr(restaurant_fetcher, "places_breaker", breaker)
+    monkeypatch.setattr(restaurant_fetcher, "PLACES_CALL_BUDGET", 0.2)
+    return breaker
+
+
+def _fallbacks(source):
+    return PLACES_FALLBACKS.values.get((("source", source),), 0)
+
+
+async def _search():
+    return await nearby_search_async(API_KEY, LAT, LNG, PLACE_TYPE)
+
+
+def test_slow_upstream_is_cut_by_the_call_budget(places_stub, breaker):
+    places_stub.latency = 1.0
+
+    async def main():
+        started = time.perf_counter()
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await _search()
+        finally:
+            await close_async_client()
+        return time.perf_counter() - started
+
+    assert asyncio.run(main()) < 0.6
+    assert breaker.failures == 1 and breaker.state == CLOSED
+
+
+def test_breaker_opens_after_repeated_failures_and_recovers(places_stub, breaker):
+    places_stub.error_rate = 1.0
+    places_stub.error_status = "500"
+
+    async def main():
+        try:
+            for _ in range(3):
+                with pytest.raises(Exception, match="500"):
+                    await _search()
+            assert breaker.state == OPEN and breaker.opens == 1
+
+            # Con el circuito abierto no se llama a Places
+            with pytest.raises(CircuitOpenError):
+                await _search()
+            assert places_stub.requests == 3
+
+            # Pasado reset_timeout, una llamada de prueba; si va bien, se cierra
+            breaker.clock.now += 31
+            places_stub.error_rate = 0.0
+            assert await _search()
+            assert breaker.state == CLOSED and places_stub.requests == 4
+        finally:
+            await close_async_client()
+
+    asyncio.run(main())
+
+
+def test_stale_entry_is_served_while_refreshing_in_background(places_stub, breaker):
+    async def main():
+        clock = FakeClock()
+        # page_wait corto: el refresco en segundo plano no espera a que nadie pida otra página
+        cache = RestaurantCache(ttl=10, stale_ttl=100, clock=clock, page_wait=0.2)
+        cell = geohash_encode(LAT, LNG, cache.precision)
+        try:
+            fresh = await cache.fetch(LAT, LNG)
+            assert places_stub.requests == 1
+
+            # Caducada y Places devolviendo errores: se sirve lo guardado sin esperar
+            clock.now += 20
+            places_stub.latency = 0.1
+            places_stub.error_rate = 1.0
+            before = _fallbacks("stale")
+            assert await cache.fetch(LAT, LNG) == fresh
+            refresh = cache.in_flight[cell].task
+            assert not refresh.done()
+            assert cache.stale_served == 1 and _fallbacks("stale") == before + 1
+            await refresh
+            assert breaker.failures == 1 and cache.get(cell) is None
+
+            # Places se recupera: el siguiente refresco en segundo plano renueva la entrada
+            places_stub.error_rate = 0.0
+            assert await cache.fetch(LAT, LNG) == fresh
+            await cache.in_flight[cell].task
+            assert cache.get(cell) == fresh and cache.stale_served == 2
+        finally:
+            await close_async_client()
+
+    asyncio.run(main())
+
+
+def test_failing_upstream_falls_back_to_a_neighbor_cell(places_stub, breaker):
+    async def main():
+        cache = RestaurantCache(clock=FakeClock())
+        # Un punto en una celda vecina de la del punto ya consultado
+        neighbor_lat = LAT + 0.006
+        assert geohash_encode(neighbor_lat, LNG, cache.precision) in geohash_neighbors(LAT, LNG, cache.precision)
+        try:
+            known = await cache.fetch(LAT, LNG)
+
+            places_stub.error_rate = 1.0
+            places_stub.error_status = "OVER_QUERY_LIMIT"
+            before = _fallbacks("neighbor")
+            assert await cache.fetch(neighbor_lat, LNG) == known
+            assert _fallbacks("neighbor") == before + 1
+
+            # Sin nada guardado cerca, el error llega a quien llama
+            with pytest.raises(Exception, match="OVER_QUERY_LIMIT"):
+                await cache.fetch(LAT + 1, LNG)
+        finally:
+            await close_async_client()
+
+    asyncio.run(main())
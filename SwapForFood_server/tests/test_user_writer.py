@@ -0,0 +1,120 @@
+import asyncio
+
+from managers.room_manager import RoomManager
+from models.user import User
+from utils.room_codes import RoomCodeAllocator
+from utils.timer_wheel import TimerWheel
+
+
+class BrokenWebSocket:
+    def __init__(self):
+        self.sent = []
+        self.closed = False
+
+    async def send_text(self, text):
+        raise RuntimeError("Cannot call send once a close message has been sent")
+
+    async def send_bytes(self, data):
+        raise RuntimeError("Cannot call send once a close message has been sent")
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeWebSocket(BrokenWebSocket):
+    async def send_text(self, text):
+        self.sent.append(text)
+
+    async def send_bytes(self, data):
+        self.sent.append(data)
+
+
+def test_send_error_clears_writer_and_reports_loss():
+    async def main():
+        lost = []
+        user = User(BrokenWebSocket(), on_connection_lost=lost.append)
+        assert user.enqueue("NEW_MESSAGE.ana:hola")
+        await asyncio.sleep(0.01)
+        assert lost == [user]
+        assert user.writer_task is None
+        # Los envíos posteriores se descartan en vez de llenar la cola
+        assert not user.enqueue("NEW_MESSAGE.ana:otra")
+        assert user.send_queue.qsize() == 0
+    asyncio.run(main())
+
+
+def test_writer_clears_task_after_close():
+    async def main():
+        websocket = FakeWebSocket()
+        user = User(websocket)
+        user.enqueue("USER_JOINED.ana")
+        user.close()
+        await asyncio.sleep(0.01)
+        assert websocket.sent == ["USER_JOINED.ana"]
+        assert websocket.closed
+        assert user.writer_task is None
+    asyncio.run(main())
+
+
+def test_manager_removes_user_on_send_error():
+    async def main():
+        manager = RoomManager(timers=TimerWheel(), room_codes=RoomCodeAllocator(cooldown=0))
+        leader = FakeWebSocket()
+        response = await manager.join_room_with_prefix_0(leader, "0ana")
+        code = response[4:9]
+        broken = BrokenWebSocket()
+        await manager.join_room_with_prefix_1(broken, f"1{code}luis")
+        assert len(manager.rooms[code].users) == 2
+
+        await manager.send_reply(broken, "NEW_MESSAGE.ana:hola")
+        await asyncio.sleep(0.01)
+        # La desconexión corre en una tarea con referencia propia que se suelta al terminar
+        assert not manager.background_tasks
+        assert broken not in manager.websocket_to_room
+        assert [u.username for u in manager.rooms[code].users] == ["ana"]
+        assert broken.closed
+    asyncio.run(main())
+
+
+def test_stop_is_not_lost_when_a_send_finishes_at_the_same_time():
+    class GatedWebSocket(FakeWebSocket):
+        def __init__(self):
+            super().__init__()
+            self.gate = asyncio.get_running_loop().create_future()
+
+        async def send_text(self, text):
+            await self.gate
+            self.sent.append(text)
+
+    async def main():
+        websocket = GatedWebSocket()
+        user = User(websocket)
+        user.enqueue("USER_JOINED.ana")
+        await asyncio.sleep(0.01)
+        task = user.writer_task
+        # El envío termina en la misma vuelta del bucle en la que llega la cancelación
+        websocket.gate.set_result(None)
+        user.stop()
+        await asyncio.sleep(0.01)
+        assert task.done()
+    asyncio.run(main())
+
+
+def test_background_task_errors_are_logged(caplog):
+    async def main():
+        manager = RoomManager(timers=TimerWheel(), room_codes=RoomCodeAllocator(cooldown=0))
+        broken = BrokenWebSocket()
+        await manager.join_room_with_prefix_0(broken, "0ana")
+
+        async def failing_disconnect(websocket):
+            raise KeyError("boom")
+
+        manager.handle_disconnect = failing_disconnect
+        await manager.send_reply(broken, "NEW_MESSAGE.ana:hola")
+        await asyncio.sleep(0)
+        assert len(manager.background_tasks) == 1
+        await manager.close()
+        assert not manager.background_tasks
+
+    asyncio.run(main())
+    assert "Error en una tarea en segundo plano" in caplog.text
@@ -0,0 +1,343 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+
+from utils.metrics import registry, ANALYTICS_EVENTS, ANALYTICS_FLUSH_DURATION
+
+logger = logging.getLogger(__name__)
+
+# Base de datos SQLite con el histórico de partidas y votos. Vacío: no se guarda nada
+ANALYTICS_DB = os.getenv("ANALYTICS_DB", "")
+ANALYTICS_BUFFER = int(os.getenv("ANALYTICS_BUFFER", "65536"))  # Eventos en memoria pendientes de escribir
+ANALYTICS_BATCH = int(os.getenv("ANALYTICS_BATCH", "2048"))  # Eventos por transacción
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv("ANALYTICS_FLUSH_INTERVAL", "1.0"))  # segundos
+# Con el buffer lleno: "drop" descarta el evento, "spill" lo pasa a un segundo buffer en memoria
+# que el escritor vuelca a un fichero y se importa cuando se pone al día (hasta
+# ANALYTICS_SPILL_MAX_BYTES; si el segundo buffer también se llena o se supera el tamaño, descarta)
+ANALYTICS_OVERFLOW = os.getenv("ANALYTICS_OVERFLOW", "drop")
+ANALYTICS_SPILL_BUFFER = int(os.getenv("ANALYTICS_SPILL_BUFFER", "16384"))  # Eventos pendientes de volcar
+ANALYTICS_SPILL_MAX_BYTES = int(os.getenv("ANALYTICS_SPILL_MAX_BYTES", str(64 * 2**20)))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    game_id TEXT PRIMARY KEY, room TEXT, started_at REAL, offline INTEGER, stream_mode INTEGER,
+    participants INTEGER, ended_at REAL, duration REAL, final_participants INTEGER, votes_cast INTEGER
+);
+CREATE TABLE IF NOT EXISTS game_restaurants (
+    game_id TEXT, position INTEGER, restaurant_id TEXT, name TEXT, shown_at REAL,
+    PRIMARY KEY (game_id, position)
+);
+CREATE TABLE IF NOT EXISTS votes (
+    game_id TEXT, username TEXT, restaurant_id TEXT, liked INTEGER, at REAL
+);
+CREATE TABLE IF NOT EXISTS results (
+    game_id TEXT, restaurant_id TEXT, likes INTEGER, votes INTEGER,
+    PRIMARY KEY (game_id, restaurant_id)
+);
+CREATE INDEX IF NOT EXISTS votes_restaurant ON votes (restaurant_id);
+CREATE INDEX IF NOT EXISTS votes_game ON votes (game_id);
+"""
+
+
+class EventRing:
+    """
+    Buffer circular de tamaño fijo. Solo se usa desde el event loop, así que añadir
+    y sacar eventos es O(1) y no necesita locks.
+    """
+    __slots__ = ("items", "head", "size")
+
+    def __init__(self, capacity):
+        self.items = [None] * capacity
+        self.head = 0  # Posición del evento más antiguo
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def capacity(self):
+        return len(self.items)
+
+    def push(self, event) -> bool:
+        if self.size == len(self.items):
+            return False
+        self.items[(self.head + self.size) % len(self.items)] = event
+        self.size += 1
+        return True
+
+    def pop_many(self, limit) -> list:
+        count = min(limit, self.size)
+        batch = []
+        for _ in range(count):
+            batch.append(self.items[self.head])
+            self.items[self.head] = None
+            self.head = (self.head + 1) % len(self.items)
+        self.size -= count
+        return batch
+
+
+class AnalyticsSink:
+    """
+    Registro del histórico de partidas: inicio, restaurantes mostrados, cada voto y
+    resultados. emit() solo guarda el evento en un buffer circular en memoria; una tarea
+    en segundo plano lo vacía por lotes en SQLite desde un hilo, de modo que votar nunca
+    espera al disco. Si el escritor no da abasto y el buffer se llena, los eventos se
+    descartan o pasan a un segundo buffer que el escritor vuelca a un fichero aparte
+    (ver ANALYTICS_OVERFLOW), y se cuentan. emit() nunca toca el disco.
+    """
+
+    def __init__(self, path, capacity=ANALYTICS_BUFFER, batch_size=ANALYTICS_BATCH,
+                 flush_interval=ANALYTICS_FLUSH_INTERVAL, overflow=ANALYTICS_OVERFLOW,
+                 spill_buffer=ANALYTICS_SPILL_BUFFER, spill_max_bytes=ANALYTICS_SPILL_MAX_BYTES):
+        self.path = path
+        self.enabled = bool(path)
+        self.ring = EventRing(capacity)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = f"{path}.spill" if overflow == "spill" and path else None
+        # Eventos que no cupieron en ring, pendientes de volcar al fichero desde el hilo de escritura
+        self.overflow = EventRing(spill_buffer) if self.spill_path is not None else None
+        self.spill_max_bytes = spill_max_bytes
+        self.spill_bytes = 0  # Tamaño del fichero de desbordamiento (solo lo usa el escritor)
+        self.db = None  # Conexión SQLite, usada solo desde el hilo de escritura
+        self.task = None
+        self.stopping = False
+        self.wakeup = None
+        self.flush_lock = None
+
+    def emit(self, kind, *fields):
+        """
+        Registra un evento sin bloquear: ("game" | "restaurants" | "vote" | "end", campos...).
+        """
+        if not self.enabled:
+            return
+        event = (kind, *fields)
+        if self.ring.push(event):
+            if self.ring.size == self.batch_size and self.wakeup is not None:
+                self.wakeup.set()
+            return
+        # Buffer lleno: el desbordamiento también se queda en memoria y el escritor lo vuelca
+        if self.overflow is not None and self.overflow.push(event):
+            if self.overflow.size == 1 and self.wakeup is not None:
+                self.wakeup.set()
+            return
+        ANALYTICS_EVENTS.inc(result="dropped")
+
+    async def start(self):
+        if not self.enabled or self.task is not None:
+            return
+        self.stopping = False
+        self.wakeup = asyncio.Event()
+        self.flush_lock = asyncio.Lock()
+        if self.spill_path is not None and os.path.exists(self.spill_path):
+            self.spill_bytes = os.path.getsize(self.spill_path)
+        self.task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self.task is None:
+            return
+        # No se cancela la tarea: un lote a medio escribir en el hilo seguiría adelante.
+        # Se le pide que haga una última escritura con lo pendiente y termine
+        self.stopping = True
+        self.wakeup.set()
+        await self.task
+        self.task = None
+        if self.db is not None:
+            await asyncio.to_thread(self.db.close)
+            self.db = None
+
+    async def _run(self):
+        while True:
+            if not self.stopping:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self.wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Error escribiendo eventos de analítica")
+            if self.stopping:
+                return
+
+    async def flush(self):
+        """
+        Escribe en SQLite todo lo pendiente del buffer y, si el buffer tiene sitio,
+        los eventos volcados al fichero de desbordamiento.
+        """
+        async with self.flush_lock:
+            # Primero lo desbordado: vaciar el segundo buffer cuanto antes deja sitio a los siguientes
+            if self.overflow is not None and self.overflow.size:
+                await self._spill(self.overflow.pop_many(self.overflow.size))
+            while self.ring.size:
+                batch = self.ring.pop_many(self.batch_size)
+                await self._write_batch(batch)
+            if self.spill_path is None or self.ring.size >= self.ring.capacity // 2:
+                return
+            count = await asyncio.to_thread(self._ingest_pending)
+            if count:
+                ANALYTICS_EVENTS.inc(count, result="written")
+
+    async def _spill(self, events):
+        try:
+            spilled, dropped = await asyncio.to_thread(self._append_spill, events)
+        except OSError:
+            logger.exception("No se pudieron volcar %d eventos de analítica", len(events))
+            spilled, dropped = 0, len(events)
+        if spilled:
+            ANALYTICS_EVENTS.inc(spilled, result="spilled")
+        if dropped:
+            ANALYTICS_EVENTS.inc(dropped, result="dropped")
+
+    def _append_spill(self, events):
+        # Hilo de escritura: una sola escritura en la caché del sistema, sin fsync.
+        # Devuelve (volcados, descartados por superar spill_max_bytes)
+        data = bytearray()
+        spilled = 0
+        for event in events:
+            line = (json.dumps(event, separators=(",", ":")) + "\n").encode("utf-8")
+            if self.spill_bytes + len(data) + len(line) > self.spill_max_bytes:
+                break
+            data += line
+            spilled += 1
+        if data:
+            with open(self.spill_path, "ab") as f:
+                f.write(data)
+            self.spill_bytes += len(data)
+        return spilled, len(events) - spilled
+
+    def _ingest_pending(self) -> int:
+        # Hilo de escritura. Un .ingest que ya existe quedó de una importación interrumpida: va primero
+        ingest_path = self.spill_path + ".ingest"
+        if self.spill_bytes and not os.path.exists(ingest_path):
+            os.replace(self.spill_path, ingest_path)
+            self.spill_bytes = 0
+        if os.path.exists(ingest_path):
+            return self._ingest_spill(ingest_path)
+        return 0
+
+    async def _write_batch(self, batch):
+        started = time.perf_counter()
+        try:
+            await asyncio.to_thread(self._write, batch)
+        except Exception:
+            logger.exception("No se pudieron guardar %d eventos de analítica", len(batch))
+            ANALYTICS_EVENTS.inc(len(batch), result="dropped")
+            return
+        ANALYTICS_EVENTS.inc(len(batch), result="written")
+        ANALYTICS_FLUSH_DURATION.observe(time.perf_counter() - started)
+
+    def _connect(self):
+        if self.db is None:
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.executescript(_SCHEMA)
+        return self.db
+
+    def _write(self, batch):
+        # Hilo de escritura: agrupa los eventos por tipo en una sola transacción
+        games, ends, shown, votes, results = [], [], [], [], []
+        for event in batch:
+            kind = event[0]
+            if kind == "vote":
+                votes.append(event[1:])
+            elif kind == "restaurants":
+                _, game_id, at, first, restaurants = event
+                shown.extend((game_id, first + i, rid, name, at) for i, (rid, name) in enumerate(restaurants))
+            elif kind == "game":
+                games.append(event[1:])
+            elif kind == "end":
+                _, game_id, ended_at, duration, participants, votes_cast, counts = event
+                ends.append((game_id, ended_at, duration, participants, votes_cast))
+                results.extend((game_id, rid, likes, total) for rid, likes, total in counts)
+        db = self._connect()
+        with db:
+            db.executemany(
+                "INSERT OR IGNORE INTO games (game_id, room, started_at, offline, stream_mode, participants) "
+                "VALUES (?, ?, ?, ?, ?, ?)", games)
+            db.executemany("INSERT OR REPLACE INTO game_restaurants VALUES (?, ?, ?, ?, ?)", shown)
+            db.executemany("INSERT INTO votes VALUES (?, ?, ?, ?, ?)", votes)
+            # El inicio puede haberse descartado por desbordamiento: el fin crea la fila si falta
+            db.executemany(
+                "INSERT INTO games (game_id, ended_at, duration, final_participants, votes_cast) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (game_id) DO UPDATE SET ended_at = excluded.ended_at, duration = excluded.duration, "
+                "final_participants = excluded.final_participants, votes_cast = excluded.votes_cast", ends)
+            db.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", results)
+
+    def _ingest_spill(self, path) -> int:
+        count = 0
+        batch = []
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    batch.append(json.loads(line))
+                except ValueError:
+                    continue  # Última línea cortada por una caída
+                if len(batch) >= self.batch_size:
+                    self._write(batch)
+                    count += len(batch)
+                    batch = []
+        if batch:
+            self._write(batch)
+            count += len(batch)
+        os.remove(path)
+        return count
+
+
+def _query(path, sql, params=()):
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        db.row_factory = sqlite3.Row
+        return [dict(row) for row in db.execute(sql, params)]
+    finally:
+        db.close()
+
+
+def like_rates(path=ANALYTICS_DB, min_votes=1, limit=100):
+    """
+    Porcentaje de likes por restaurante en todas las partidas, de más a menos gustado.
+    """
+    return _query(path, """
+        SELECT v.restaurant_id, n.name, SUM(v.liked) AS likes, COUNT(*) AS votes,
+               CAST(SUM(v.liked) AS REAL) / COUNT(*) AS like_rate
+        FROM votes v
+        LEFT JOIN (SELECT restaurant_id, MAX(name) AS name FROM game_restaurants GROUP BY restaurant_id) n
+            ON n.restaurant_id = v.restaurant_id
+        GROUP BY v.restaurant_id
+        HAVING COUNT(*) >= ?
+        ORDER BY like_rate DESC, votes DESC
+        LIMIT ?
+    """, (min_votes, limit))
+
+
+def decision_latency(path=ANALYTICS_DB, game_id=None, limit=100):
+    """
+    Por partida: duración, segundos hasta el primer restaurante con like de todos los
+    participantes (None si no hubo) y tiempo medio entre mostrar un restaurante y votarlo
+    (en modo streaming se cuenta desde que el restaurante llegó a la partida).
+    """
+    return _query(path, """
+        SELECT g.game_id, g.room, g.started_at, g.duration, g.final_participants, g.votes_cast,
+               (SELECT MIN(matched_at) FROM (
+                    SELECT MAX(v.at) AS matched_at FROM votes v
+                    WHERE v.game_id = g.game_id AND v.liked = 1
+                    GROUP BY v.restaurant_id
+                    HAVING COUNT(*) >= g.final_participants)) AS match_latency,
+               (SELECT AVG(v.at - r.shown_at) FROM votes v
+                    JOIN game_restaurants r ON r.game_id = v.game_id AND r.restaurant_id = v.restaurant_id
+                    WHERE v.game_id = g.game_id) AS vote_latency
+        FROM games g
+        WHERE g.ended_at IS NOT NULL AND (? IS NULL OR g.game_id = ?)
+        ORDER BY g.started_at DESC
+        LIMIT ?
+    """, (game_id, game_id, limit))
+
+
+analytics_sink = AnalyticsSink(ANALYTICS_DB)
+registry.gauge("swapforfood_analytics_buffered_events", "Eventos de analítica pendientes de escribir",
+               func=lambda: len(analytics_sink.ring))
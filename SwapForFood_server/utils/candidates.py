@@ -0,0 +1,174 @@
+import os
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Pesos de la puntuación de cada candidato (mayor puntuación = se muestra antes).
+# Por defecto solo cuenta la distancia, que equivale al orden rankby=distance de Places
+SCORE_WEIGHT_DISTANCE = float(os.getenv("SCORE_WEIGHT_DISTANCE", "1.0"))  # penalización por km
+SCORE_WEIGHT_RATING = float(os.getenv("SCORE_WEIGHT_RATING", "0.0"))  # bonificación por estrella
+SCORE_WEIGHT_OPEN_NOW = float(os.getenv("SCORE_WEIGHT_OPEN_NOW", "0.0"))  # bonificación si está abierto ahora
+
+EARTH_RADIUS_KM = 6371
+MAX_RATING = 5.0  # Valoración máxima de Google
+
+
+def _location_of(result):
+    loc = result.get("geometry", {}).get("location", {})
+    lat = loc.get("lat")
+    lng = loc.get("lng")
+    if lat is None or lng is None:
+        return math.nan, math.nan
+    return lat, lng
+
+
+def compute_distances(lat, lng, results) -> list:
+    """
+    Distancias en km desde (lat, lng) a cada resultado, en una sola pasada vectorizada
+    con NumPy si está instalado. Los resultados sin ubicación dan NaN.
+    """
+    coords = [_location_of(r) for r in results]
+    if np is not None:
+        points = np.radians(np.array(coords, dtype=float).reshape(-1, 2))
+        phi1 = math.radians(lat)
+        delta_phi = points[:, 0] - phi1
+        delta_lambda = points[:, 1] - math.radians(lng)
+        a = np.sin(delta_phi / 2) ** 2 + math.cos(phi1) * np.cos(points[:, 0]) * np.sin(delta_lambda / 2) ** 2
+        return (2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))).tolist()
+
+    distances = []
+    phi1 = math.radians(lat)
+    for lat_rest, lng_rest in coords:
+        phi2 = math.radians(lat_rest)
+        a = (math.sin((phi2 - phi1) / 2) ** 2 +
+             math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng_rest - lng) / 2) ** 2)
+        distances.append(2 * EARTH_RADIUS_KM * math.atan2(math.sqrt(a), math.sqrt(1 - a)))
+    return distances
+
+
+def score_bound(min_distance) -> float:
+    """
+    Puntuación máxima posible de un candidato a min_distance km o más: la mejor
+    valoración, abierto ahora y sin acercarse más.
+    """
+    bound = max(SCORE_WEIGHT_RATING * MAX_RATING, 0.0) + max(SCORE_WEIGHT_OPEN_NOW, 0.0)
+    if SCORE_WEIGHT_DISTANCE:
+        bound -= SCORE_WEIGHT_DISTANCE * min_distance
+    return bound
+
+
+def score_candidates(results, distances) -> list:
+    scores = []
+    for r, distance in zip(results, distances):
+        score = SCORE_WEIGHT_RATING * (r.get("rating") or 0.0)
+        if r.get("opening_hours", {}).get("open_now"):
+            score += SCORE_WEIGHT_OPEN_NOW
+        if SCORE_WEIGHT_DISTANCE:
+            # Los candidatos sin ubicación van al final si la distancia cuenta
+            score -= SCORE_WEIGHT_DISTANCE * (math.inf if math.isnan(distance) else distance)
+        scores.append(score)
+    return scores
+
+
+class CandidatePool:
+    """
+    Candidatos vistos y aún no enviados a la sala. take(n) saca los n mejores por
+    puntuación; a igual puntuación se respeta el orden en que llegaron.
+    """
+    __slots__ = ("lat", "lng", "results", "distances", "scores")
+
+    def __init__(self, lat, lng):
+        self.lat = lat
+        self.lng = lng
+        self.results = []
+        self.distances = []
+        self.scores = []
+
+    def __len__(self):
+        return len(self.results)
+
+    def add(self, page) -> list:
+        # Devuelve las distancias de la página
+        distances = compute_distances(self.lat, self.lng, page)
+        self.results.extend(page)
+        self.distances.extend(distances)
+        self.scores.extend(score_candidates(page, distances))
+        return distances
+
+    def count_at_least(self, score) -> int:
+        return sum(1 for s in self.scores if s >= score)
+
+    def take(self, n):
+        if n <= 0 or not self.results:
+            return []
+        if np is not None:
+            order = np.argsort(-np.array(self.scores), kind="stable")[:n].tolist()
+        else:
+            order = sorted(range(len(self.scores)), key=lambda i: -self.scores[i])[:n]
+        taken = [(self.results[i], self.distances[i]) for i in order]
+
+        chosen = set(order)
+        keep = [i for i in range(len(self.results)) if i not in chosen]
+        self.results = [self.results[i] for i in keep]
+        self.distances = [self.distances[i] for i in keep]
+        self.scores = [self.scores[i] for i in keep]
+        return taken
+
+
+def rank_candidates(results, lat, lng, limit) -> list:
+    """
+    Devuelve los limit mejores resultados como [(resultado, distancia_km)].
+    """
+    pool = CandidatePool(lat, lng)
+    pool.add(results)
+    return pool.take(limit)
+
+
+async def stream_candidates(pages, lat, lng, top_k, max_pages):
+    """
+    Recorre las páginas de resultados (iterable asíncrono) y va entregando lotes
+    ordenados de [(resultado, distancia_km)] hasta top_k en total. Tras cada página
+    se entrega la parte proporcional de lo que falta, elegida entre todo lo visto
+    y no enviado, así el primer lote sale sin esperar a las páginas siguientes.
+
+    Las páginas de Nearby Search (rankby=distance) llegan de más cerca a más lejos, así
+    que nada de lo que venga después puede puntuar más que score_bound() de la distancia
+    más lejana vista. En cuanto lo que falta está por encima de esa cota, el top_k ya no
+    puede cambiar: se entrega de una vez y no se piden más páginas.
+    """
+    pool = CandidatePool(lat, lng)
+    remaining = top_k
+    seen_ids = set()
+    pages_seen = 0
+    farthest = 0.0
+
+    async for page in pages:
+        pages_seen += 1
+        # Places puede repetir un mismo sitio en páginas distintas
+        new = [r for r in page if r.get("place_id") not in seen_ids]
+        seen_ids.update(r.get("place_id") for r in new)
+        distances = [d for d in pool.add(new) if not math.isnan(d)]
+        if distances:
+            farthest = max(farthest, max(distances))
+
+        if pool.count_at_least(score_bound(farthest)) >= remaining:
+            batch = pool.take(remaining)
+            if batch:
+                yield batch
+            return
+
+        pages_left = max(max_pages - pages_seen + 1, 1)
+        batch = pool.take(min(remaining, -(-remaining // pages_left)))
+        if batch:
+            remaining -= len(batch)
+            yield batch
+        if remaining <= 0:
+            return
+
+    # No hay más páginas: completar con lo mejor que quede
+    batch = pool.take(remaining)
+    if batch:
+        yield batch
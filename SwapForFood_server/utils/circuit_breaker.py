@@ -0,0 +1,71 @@
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Valor numérico de cada estado para exportarlo como gauge
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """
+    El circuito está abierto: no se hace la llamada al servicio externo.
+    """
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker clásico de tres estados. Tras failure_threshold fallos seguidos se
+    abre y rechaza las llamadas durante reset_timeout segundos; después deja pasar una
+    sola llamada de prueba (semiabierto) que lo cierra si va bien o lo vuelve a abrir.
+    Si la llamada de prueba no informa en reset_timeout (p. ej. se canceló), se permite
+    otra. El reloj es inyectable para poder probarlo sin esperas reales.
+    """
+    __slots__ = ("name", "failure_threshold", "reset_timeout", "clock", "state", "failures", "opened_at",
+                 "probe_started", "opens")
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0  # Fallos seguidos
+        self.opened_at = 0.0
+        self.probe_started = None  # Momento de la llamada de prueba en curso (semiabierto)
+        self.opens = 0  # Veces que se ha abierto
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        now = self.clock()
+        if self.state == OPEN:
+            if now - self.opened_at < self.reset_timeout:
+                return False
+            self.state = HALF_OPEN
+            self.probe_started = None
+        if self.probe_started is not None and now - self.probe_started < self.reset_timeout:
+            return False
+        self.probe_started = now
+        return True
+
+    def record_success(self):
+        if self.state != CLOSED:
+            logger.info("Circuito %s cerrado: el servicio responde de nuevo", self.name)
+        self.state = CLOSED
+        self.failures = 0
+        self.probe_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.opens += 1
+                logger.warning("Circuito %s abierto tras %d fallos seguidos", self.name, self.failures)
+            self.state = OPEN
+            self.opened_at = self.clock()
+            self.probe_started = None
@@ -0,0 +1,123 @@
+import os
+import json
+import time
+import zlib
+from utils.metrics import FRAME_COMPRESSIONS
+
+# Usar un codificador JSON rápido si está instalado
+try:
+    import orjson
+
+    def dumps_bytes(obj) -> bytes:
+        return orjson.dumps(obj)
+except ImportError:
+    def dumps_bytes(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Compresión de frames para los clientes que la negocian (protocolos v2 "+deflate").
+# Por debajo de WS_COMPRESSION_MIN_BYTES el frame se envía sin comprimir: los mensajes
+# cortos (chat, altas) no se reducen. El nivel 1 comprime casi igual que el 6 y es más
+# rápido (ver benchmarks/bench_compression.py)
+COMPRESSION_MIN_BYTES = int(os.getenv("WS_COMPRESSION_MIN_BYTES", "256"))
+COMPRESSION_LEVEL = int(os.getenv("WS_COMPRESSION_LEVEL", "1"))
+# Un frame comprimido es un mensaje binario con este byte seguido de un stream deflate
+# sin cabecera (wbits=-15). 0xC1 no es válido al inicio de MessagePack ni de UTF-8
+DEFLATE_MARKER = b"\xc1"
+
+_UNSET = object()
+
+
+def deflate_payload(data: bytes, min_bytes=None, level=None):
+    """
+    Comprime un mensaje ya serializado. Devuelve None si es pequeño o no se reduce.
+    """
+    if len(data) < (COMPRESSION_MIN_BYTES if min_bytes is None else min_bytes):
+        FRAME_COMPRESSIONS.inc(result="small")
+        return None
+    compressor = zlib.compressobj(COMPRESSION_LEVEL if level is None else level, zlib.DEFLATED, -15)
+    deflated = DEFLATE_MARKER + compressor.compress(data) + compressor.flush()
+    if len(deflated) >= len(data):
+        FRAME_COMPRESSIONS.inc(result="incompressible")
+        return None
+    FRAME_COMPRESSIONS.inc(result="compressed")
+    return deflated
+
+
+def inflate_payload(data: bytes) -> bytes:
+    return zlib.decompress(data[len(DEFLATE_MARKER):], -15)
+
+
+def dumps_text(obj) -> str:
+    """
+    Serializa un objeto a JSON (str) con el codificador disponible.
+    """
+    return dumps_bytes(obj).decode("utf-8")
+
+
+class Frame:
+    """
+    Mensaje ya serializado. Se construye una sola vez por broadcast y la misma
+    instancia se encola para todos los destinatarios. La variante MessagePack
+    (protocolo v2) y las comprimidas se calculan la primera vez que se necesitan
+    y también se comparten: se comprime una vez por sala, no por destinatario.
+    """
+    __slots__ = ("data", "text", "obj", "_packed", "_deflated", "_deflated_packed")
+
+    def __init__(self, data: bytes, obj=None):
+        self.data = data
+        self.text = data.decode("utf-8")
+        self.obj = obj
+        self._packed = None
+        self._deflated = _UNSET
+        self._deflated_packed = _UNSET
+
+    @classmethod
+    def from_obj(cls, obj):
+        return cls(dumps_bytes(obj), obj)
+
+    @classmethod
+    def from_text(cls, text: str):
+        return cls(text.encode("utf-8"))
+
+    @property
+    def packed(self) -> bytes:
+        if self._packed is None:
+            obj = self.obj if self.obj is not None else json.loads(self.data)
+            self._packed = msgpack.packb(obj, use_bin_type=True)
+        return self._packed
+
+    def wire(self, binary=False, compress=False):
+        """
+        Lo que se envía por el websocket según lo negociado: texto JSON, MessagePack
+        o cualquiera de los dos comprimido (bytes con DEFLATE_MARKER) si compensa.
+        """
+        if compress:
+            if binary:
+                if self._deflated_packed is _UNSET:
+                    self._deflated_packed = deflate_payload(self.packed)
+                deflated = self._deflated_packed
+            else:
+                if self._deflated is _UNSET:
+                    self._deflated = deflate_payload(self.data)
+                deflated = self._deflated
+            if deflated is not None:
+                return deflated
+        return self.packed if binary else self.text
+
+
+def encode_frame(message: str, id: int = 0, timestamp: int = None) -> Frame:
+    """
+    Construye el sobre {"id", "message", "timestamp"} y lo serializa una vez.
+    """
+    if timestamp is None:
+        timestamp = int(time.time() * 1000)
+    return Frame.from_obj({
+        "id": id,
+        "message": message,
+        "timestamp": timestamp
+    })
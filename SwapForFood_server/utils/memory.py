@@ -0,0 +1,34 @@
+import sys
+
+# Solo se recorren por dentro los objetos de estos módulos; el resto se cuenta de forma superficial
+_OWN_MODULES = ("models.", "utils.frames")
+_CONTAINERS = (dict, list, tuple, set, frozenset)
+
+
+def deep_sizeof(obj, seen=None) -> int:
+    """
+    Estima los bytes que ocupa un objeto del modelo (Room, User, Game...) junto con lo
+    que cuelga de él. No entra en objetos ajenos (websockets, event loop, callbacks)
+    para no contar memoria compartida con el resto del servidor.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += deep_sizeof(key, seen) + deep_sizeof(value, seen)
+    elif isinstance(obj, _CONTAINERS):
+        for item in obj:
+            size += deep_sizeof(item, seen)
+    elif type(obj).__module__.startswith(_OWN_MODULES):
+        if hasattr(obj, "__dict__"):
+            size += deep_sizeof(vars(obj), seen)
+        for cls in type(obj).__mro__:
+            for name in getattr(cls, "__slots__", ()):
+                if name != "__dict__" and hasattr(obj, name):
+                    size += deep_sizeof(getattr(obj, name), seen)
+    return size
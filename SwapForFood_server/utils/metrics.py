@@ -0,0 +1,157 @@
+import bisect
+
+# Límites de los histogramas de latencia (segundos)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    return "{" + inner + "}"
+
+
+class Counter:
+    __slots__ = ("name", "help", "values")
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}  # {tupla de etiquetas: valor}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.items())
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        if not self.values:
+            lines.append(f"{self.name} 0")
+        for key, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(dict(key))} {value}")
+        return lines
+
+
+class Gauge:
+    __slots__ = ("name", "help", "value", "func")
+
+    def __init__(self, name, help, func=None):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self.func = func  # Si se indica, el valor se calcula al exportar
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def render(self):
+        value = self.func() if self.func is not None else self.value
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class Histogram:
+    __slots__ = ("name", "help", "buckets", "series")
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.series = {}  # {tupla de etiquetas: [conteos por bucket..., suma, total]}
+
+    def observe(self, value, **labels):
+        key = tuple(labels.items())
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [0] * (len(self.buckets) + 3)
+        # Solo se incrementa el primer bucket que contiene el valor; se acumula al exportar
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in self.series.items():
+            labels = dict(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': bound})} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        # Registrar de nuevo un nombre reemplaza la métrica anterior
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help):
+        return self.register(Counter(name, help))
+
+    def gauge(self, name, help, func=None):
+        return self.register(Gauge(name, help, func))
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Métricas del servidor
+ROOMS_CREATED = registry.counter("swapforfood_rooms_created_total", "Salas creadas")
+ROOMS_CLOSED = registry.counter("swapforfood_rooms_closed_total", "Salas cerradas")
+USERS_JOINED = registry.counter("swapforfood_users_joined_total", "Usuarios unidos a una sala")
+USERS_LEFT = registry.counter("swapforfood_users_left_total", "Usuarios que han salido de una sala")
+SLOW_CONSUMERS = registry.counter("swapforfood_slow_consumers_evicted_total", "Clientes expulsados por no leer a tiempo")
+REAPED_ROOMS = registry.counter("swapforfood_reaped_rooms_total", "Salas inactivas cerradas por el reaper")
+REAPED_CONNECTIONS = registry.counter("swapforfood_reaped_connections_total", "Conexiones muertas cerradas por el reaper")
+REAPED_BYTES = registry.counter("swapforfood_reaped_bytes_total", "Memoria estimada liberada por el reaper")
+HEARTBEAT_PINGS = registry.counter("swapforfood_heartbeat_pings_total", "PING enviados a clientes inactivos")
+COMMANDS = registry.counter("swapforfood_commands_total", "Comandos recibidos por el websocket")
+COMMAND_DURATION = registry.histogram("swapforfood_command_duration_seconds", "Tiempo de proceso de cada comando")
+BROADCASTS = registry.counter("swapforfood_broadcasts_total", "Broadcasts enviados a una sala")
+BROADCAST_RECIPIENTS = registry.counter("swapforfood_broadcast_recipients_total", "Mensajes encolados por broadcasts")
+BROADCAST_DURATION = registry.histogram("swapforfood_broadcast_duration_seconds", "Tiempo de cada broadcast")
+GAMES_STARTED = registry.counter("swapforfood_games_started_total", "Partidas iniciadas")
+GAMES_FINISHED = registry.counter("swapforfood_games_finished_total", "Partidas terminadas")
+GAMES_IN_PROGRESS = registry.gauge("swapforfood_games_in_progress", "Partidas en curso")
+GAME_DURATION = registry.histogram(
+    "swapforfood_game_duration_seconds", "Duración de las partidas",
+    buckets=(5, 10, 20, 30, 60, 120, 300, 600)
+)
+VOTES = registry.counter("swapforfood_votes_total", "Votos registrados")
+PLACES_LOOKUPS = registry.counter("swapforfood_places_lookups_total", "Consultas a la API de Places")
+PLACES_LOOKUP_DURATION = registry.histogram("swapforfood_places_lookup_duration_seconds", "Latencia de Places")
+PLACES_FALLBACKS = registry.counter(
+    "swapforfood_places_fallbacks_total", "Búsquedas servidas sin una respuesta al día de Places (caducada, celda vecina u offline)"
+)
+THROTTLED = registry.counter("swapforfood_throttled_total", "Mensajes rechazados por límite de frecuencia")
+PREFETCHES = registry.counter("swapforfood_prefetches_total", "Partidas iniciadas según el uso de la precarga de restaurantes")
+PREFETCH_SAVED = registry.histogram("swapforfood_prefetch_saved_seconds", "Tiempo de búsqueda ahorrado al empezar la partida")
+SNAPSHOT_DURATION = registry.histogram("swapforfood_snapshot_duration_seconds", "Tiempo de cada snapshot del estado de las salas")
+SESSIONS_RESUMED = registry.counter("swapforfood_sessions_resumed_total", "Sesiones reanudadas con el token de reanudación")
+ANALYTICS_EVENTS = registry.counter(
+    "swapforfood_analytics_events_total", "Eventos de analítica según su destino (written, spilled, dropped)"
+)
+ANALYTICS_FLUSH_DURATION = registry.histogram("swapforfood_analytics_flush_seconds", "Tiempo de cada escritura por lotes de analítica")
+FRAME_COMPRESSIONS = registry.counter(
+    "swapforfood_frame_compressions_total", "Frames preparados para clientes con compresión (compressed, small, incompressible)"
+)
@@ -0,0 +1,393 @@
+import os
+import re
+import time
+import asyncio
+import hashlib
+import tempfile
+from collections import OrderedDict
+from utils.metrics import registry
+from utils.restaurant_fetcher import get_async_client, get_place_photo_url
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Configuración de la caché de fotos en disco
+PHOTO_CACHE_DIR = os.getenv("PHOTO_CACHE_DIR", os.path.join(tempfile.gettempdir(), "swapforfood_photos"))
+PHOTO_CACHE_MAX_BYTES = int(os.getenv("PHOTO_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+PHOTO_SOURCE_WIDTH = int(os.getenv("PHOTO_SOURCE_WIDTH", "1600"))  # Ancho del original que se descarga una sola vez
+# Anchos servidos; cualquier otro se redondea al siguiente para acotar el número de variantes
+PHOTO_WIDTHS = tuple(sorted(int(w) for w in os.getenv("PHOTO_WIDTHS", "100,200,400,800,1600").split(",")))
+PHOTO_JPEG_QUALITY = int(os.getenv("PHOTO_JPEG_QUALITY", "85"))
+# Caché negativa: referencias que el origen rechazó con un 4xx no se vuelven a pedir durante este tiempo
+PHOTO_NOT_FOUND_TTL = float(os.getenv("PHOTO_NOT_FOUND_TTL", "600"))  # segundos
+PHOTO_NOT_FOUND_MAX = int(os.getenv("PHOTO_NOT_FOUND_MAX", "10000"))
+
+_CHUNK_SIZE = 64 * 1024
+
+# Las referencias de Places son base64 url-safe; cualquier otra cosa se rechaza sin ir al origen
+_REFERENCE_RE = re.compile(r"^[A-Za-z0-9_-]{1,2048}$")
+
+# 4xx que no dicen nada de la referencia (credenciales, cuota, timeout): no se guardan como ausentes
+_TRANSIENT_CLIENT_ERRORS = (401, 403, 407, 408, 429)
+
+
+class PhotoNotFound(Exception):
+    pass
+
+
+class PhotoFetchError(Exception):
+    pass
+
+
+def valid_reference(reference) -> bool:
+    return isinstance(reference, str) and _REFERENCE_RE.match(reference) is not None
+
+
+def snap_width(width: int) -> int:
+    for allowed in PHOTO_WIDTHS:
+        if width <= allowed:
+            return allowed
+    return PHOTO_WIDTHS[-1]
+
+
+class PhotoEntry:
+    __slots__ = ("digest", "path", "size", "content_type", "pins")
+
+    def __init__(self, digest, path, size, content_type):
+        self.digest = digest  # sha256 del contenido: sirve también de ETag
+        self.path = path
+        self.size = size
+        self.content_type = content_type
+        self.pins = 0  # Lectores en curso (respuestas enviándose): no se puede expulsar
+
+
+class PhotoCache:
+    """
+    Caché en disco de fotos de Places, direccionada por contenido (sha256) y con
+    expulsión LRU al superar max_bytes. Cada referencia se descarga una sola vez
+    del origen; las variantes de otros anchos se generan a partir de ese original
+    con Pillow si está instalado (si no, se piden al origen con su maxwidth).
+    Variantes con el mismo contenido comparten fichero. Las descargas concurrentes
+    de la misma variante comparten una única petición (coalescing).
+
+    Todo el acceso a disco va a hilos (asyncio.to_thread); el índice solo se toca
+    desde el event loop. Las entradas fijadas con get(pin=True) no se expulsan
+    hasta que se liberan con release().
+    """
+
+    def __init__(self, directory=PHOTO_CACHE_DIR, max_bytes=PHOTO_CACHE_MAX_BYTES,
+                 source_width=PHOTO_SOURCE_WIDTH, not_found_ttl=PHOTO_NOT_FOUND_TTL,
+                 not_found_max=PHOTO_NOT_FOUND_MAX, clock=time.monotonic):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.source_width = source_width
+        self.not_found_ttl = not_found_ttl
+        self.not_found_max = not_found_max
+        self.clock = clock
+        self.blobs = OrderedDict()  # {digest: PhotoEntry}, del menos al más usado
+        self.keys = {}  # {(referencia, ancho): digest}
+        self.keys_by_digest = {}  # {digest: {(referencia, ancho)}}
+        self.total_bytes = 0
+        self.in_flight = {}  # {(referencia, ancho): Future}
+        self.not_found = OrderedDict()  # {referencia: caducidad}, de la más antigua a la más reciente
+        # Serializa las altas y expulsiones en disco: un unlink pendiente no puede borrar un blob recién escrito
+        self.disk_lock = asyncio.Lock()
+        self.loaded = False
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.not_found_hits = 0
+
+    def _blob_path(self, digest):
+        return os.path.join(self.directory, "blobs", digest[:2], digest)
+
+    def _ref_path(self, key):
+        name = hashlib.sha256(f"{key[0]}:{key[1]}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, "refs", name)
+
+    def _tmp_dir(self):
+        path = os.path.join(self.directory, "tmp")
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    async def load(self):
+        """
+        Reconstruye el índice a partir de lo que ya hay en disco (tras un reinicio).
+        """
+        async with self.disk_lock:
+            if self.loaded:
+                return
+            found = await asyncio.to_thread(self._scan)
+            for _, digest, size, content_type, key in sorted(found):
+                if digest not in self.blobs:
+                    self.blobs[digest] = PhotoEntry(digest, self._blob_path(digest), size, content_type)
+                    self.total_bytes += size
+                self.keys[key] = digest
+                self.keys_by_digest.setdefault(digest, set()).add(key)
+            # Ficheros sin referencia (descargas a medias o índices perdidos)
+            await asyncio.to_thread(self._remove_orphans, set(self.blobs))
+            self.loaded = True
+            await self._evict()
+
+    def _scan(self):
+        refs_dir = os.path.join(self.directory, "refs")
+        found = []
+        if os.path.isdir(refs_dir):
+            for name in os.listdir(refs_dir):
+                try:
+                    with open(os.path.join(refs_dir, name), encoding="utf-8") as f:
+                        reference, width, digest, content_type = f.read().split("\n")[:4]
+                    stat = os.stat(self._blob_path(digest))
+                except (OSError, ValueError):
+                    continue
+                found.append((stat.st_mtime, digest, stat.st_size, content_type, (reference, int(width))))
+        return found
+
+    def _remove_orphans(self, known):
+        blobs_dir = os.path.join(self.directory, "blobs")
+        if os.path.isdir(blobs_dir):
+            for prefix in os.listdir(blobs_dir):
+                for digest in os.listdir(os.path.join(blobs_dir, prefix)):
+                    if digest not in known:
+                        os.unlink(os.path.join(blobs_dir, prefix, digest))
+
+    async def get(self, reference: str, width: int, pin=False) -> PhotoEntry:
+        """
+        Devuelve la entrada de la variante pedida, descargándola o generándola si hace
+        falta. Con pin=True queda fijada hasta release(entry): mientras tanto su fichero
+        no se borra aunque la caché supere su límite.
+        """
+        if not valid_reference(reference):
+            raise PhotoNotFound(reference)
+        if not self.loaded:
+            await self.load()
+        expires = self.not_found.get(reference)
+        if expires is not None:
+            if expires > self.clock():
+                self.not_found_hits += 1
+                raise PhotoNotFound(reference)
+            del self.not_found[reference]
+
+        while True:
+            entry = await self._get((reference, width))
+            # Quien esperaba una descarga compartida retoma más tarde: la entrada pudo expulsarse
+            if self.blobs.get(entry.digest) is entry:
+                if pin:
+                    entry.pins += 1
+                return entry
+
+    def release(self, entry: PhotoEntry):
+        """
+        Libera una entrada fijada con get(pin=True). Si la caché sigue por encima de su
+        límite, la entrada se expulsará en la siguiente alta.
+        """
+        entry.pins -= 1
+
+    async def _get(self, key):
+        reference, width = key
+
+        digest = self.keys.get(key)
+        if digest is not None and digest in self.blobs:
+            self.hits += 1
+            self.blobs.move_to_end(digest)
+            return self.blobs[digest]
+
+        # Si ya se está descargando o generando esta variante, esperar a su resultado
+        pending = self.in_flight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            entry = await self._produce(reference, width)
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                if isinstance(e, PhotoNotFound):
+                    self._remember_not_found(reference)
+                future.set_exception(e)
+                # Evitar el aviso "exception was never retrieved" si nadie más esperaba
+                future.exception()
+            raise
+        else:
+            future.set_result(entry)
+            return entry
+        finally:
+            del self.in_flight[key]
+
+    def _remember_not_found(self, reference):
+        self.not_found[reference] = self.clock() + self.not_found_ttl
+        self.not_found.move_to_end(reference)
+        while len(self.not_found) > self.not_found_max:
+            self.not_found.popitem(last=False)
+
+    async def _produce(self, reference, width):
+        if width >= self.source_width or Image is None:
+            return await self._download(reference, width)
+
+        # Fijado mientras se lee: una expulsión concurrente no puede borrarlo a medias
+        original = await self.get(reference, self.source_width, pin=True)
+        try:
+            try:
+                result = await asyncio.to_thread(self._resize, original.path, width)
+            except OSError:
+                raise PhotoFetchError(f"No se pudo redimensionar la foto {reference}")
+            if result is None:
+                # El original ya es más pequeño que el ancho pedido: se comparte el mismo fichero
+                return await self._commit((reference, width), None, original.digest, original.size,
+                                          original.content_type)
+            return await self._commit((reference, width), *result)
+        finally:
+            self.release(original)
+
+    async def _download(self, reference, width):
+        url = get_place_photo_url(reference, max_width=width)
+        tmp_path = None
+        try:
+            async with get_async_client().stream("GET", url, follow_redirects=True) as response:
+                status = response.status_code
+                if 400 <= status < 500 and status not in _TRANSIENT_CLIENT_ERRORS:
+                    raise PhotoNotFound(reference)
+                content_type = response.headers.get("content-type", "")
+                if status != 200 or not content_type.startswith("image/"):
+                    raise PhotoFetchError(f"Respuesta {status} del origen para {reference}")
+
+                # Escribir en disco por bloques (en un hilo) mientras se calcula el hash
+                fd, tmp_path = await asyncio.to_thread(self._mkstemp)
+                hasher = hashlib.sha256()
+                size = 0
+                with os.fdopen(fd, "wb") as f:
+                    async for chunk in response.aiter_bytes(_CHUNK_SIZE):
+                        hasher.update(chunk)
+                        await asyncio.to_thread(f.write, chunk)
+                        size += len(chunk)
+        except BaseException:
+            if tmp_path is not None:
+                os.unlink(tmp_path)  # Solo en errores: puede ser una cancelación y no se debe esperar
+            raise
+        return await self._commit((reference, width), tmp_path, hasher.hexdigest(), size, content_type)
+
+    def _mkstemp(self):
+        return tempfile.mkstemp(dir=self._tmp_dir())
+
+    def _resize(self, source_path, width):
+        """
+        Genera la variante de width píxeles de ancho en un fichero temporal.
+        Devuelve (ruta, digest, tamaño, content_type) o None si no hace falta reducirla.
+        """
+        with Image.open(source_path) as image:
+            if image.width <= width:
+                return None
+            height = max(1, round(image.height * width / image.width))
+            resized = image.convert("RGB").resize((width, height), Image.LANCZOS)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self._tmp_dir())
+        with os.fdopen(fd, "wb") as f:
+            resized.save(f, "JPEG", quality=PHOTO_JPEG_QUALITY, optimize=True)
+
+        hasher = hashlib.sha256()
+        with open(tmp_path, "rb") as f:
+            for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+                hasher.update(chunk)
+        return tmp_path, hasher.hexdigest(), os.path.getsize(tmp_path), "image/jpeg"
+
+    async def _commit(self, key, tmp_path, digest, size, content_type):
+        async with self.disk_lock:
+            entry = self.blobs.get(digest)
+            if entry is None:
+                path = self._blob_path(digest)
+                await asyncio.to_thread(self._store_blob, tmp_path, path)
+                entry = PhotoEntry(digest, path, size, content_type)
+                self.blobs[digest] = entry
+                self.total_bytes += size
+            elif tmp_path is not None:
+                await asyncio.to_thread(os.unlink, tmp_path)  # Mismo contenido ya guardado
+            self.blobs.move_to_end(digest)
+
+            self.keys[key] = digest
+            self.keys_by_digest.setdefault(digest, set()).add(key)
+            await asyncio.to_thread(self._write_ref, key, digest, content_type)
+
+            await self._evict()
+        return entry
+
+    def _store_blob(self, tmp_path, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+
+    def _write_ref(self, key, digest, content_type):
+        ref_path = self._ref_path(key)
+        os.makedirs(os.path.dirname(ref_path), exist_ok=True)
+        with open(ref_path, "w", encoding="utf-8") as f:
+            f.write(f"{key[0]}\n{key[1]}\n{digest}\n{content_type}\n")
+
+    async def _evict(self):
+        """
+        Expulsa las entradas menos usadas hasta volver al límite. Se llama con disk_lock
+        tomado: el índice se actualiza en el loop y los ficheros se borran en un hilo.
+        """
+        excess = self.total_bytes - self.max_bytes
+        if excess <= 0 or not self.blobs:
+            return
+        # Siempre se conserva el último fichero usado aunque él solo supere el límite,
+        # y nunca los que se están enviando
+        newest = next(reversed(self.blobs))
+        victims = []
+        for digest, entry in self.blobs.items():
+            if excess <= 0 or digest == newest:
+                break
+            if entry.pins:
+                continue
+            victims.append(entry)
+            excess -= entry.size
+
+        paths = []
+        for entry in victims:
+            del self.blobs[entry.digest]
+            self.total_bytes -= entry.size
+            self.evictions += 1
+            for key in self.keys_by_digest.pop(entry.digest, ()):
+                if self.keys.get(key) == entry.digest:
+                    del self.keys[key]
+                paths.append(self._ref_path(key))
+            paths.append(entry.path)
+        if paths:
+            await asyncio.to_thread(self._unlink_all, paths)
+
+    @staticmethod
+    def _unlink_all(paths):
+        for path in paths:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "not_found_hits": self.not_found_hits,
+            "files": len(self.blobs),
+            "bytes": self.total_bytes,
+        }
+
+
+photo_cache = PhotoCache()
+
+for _stat in ("hits", "misses", "coalesced", "evictions", "not_found_hits"):
+    registry.gauge(
+        f"swapforfood_photo_cache_{_stat}",
+        f"Caché de fotos: {_stat}",
+        func=lambda stat=_stat: getattr(photo_cache, stat)
+    )
+registry.gauge("swapforfood_photo_cache_bytes", "Bytes ocupados por la caché de fotos en disco",
+               func=lambda: photo_cache.total_bytes)
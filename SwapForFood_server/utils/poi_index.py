@@ -0,0 +1,246 @@
+import heapq
+import math
+import mmap
+import struct
+from array import array
+
+from models.restaurant import Restaurant
+
+# Formato del fichero de POIs (little-endian). Tras la cabecera van las columnas, con los
+# registros reordenados como un KD-tree implícito: cada nodo cubre un rango contiguo
+# [lo, hi) y se parte por la mitad, así que el árbol no necesita punteros:
+#   x, y, z f32[N] (vector unitario de cada punto), lat, lng f32[N],
+#   rating u8[N] (x10, 0 = sin valoración), split f32[M], axis u8[M] (M nodos, en orden de heap),
+#   name_offsets u32[N+1], names utf-8, id_offsets u32[N+1], ids utf-8
+MAGIC = b"SFFPOI01"
+_HEADER = struct.Struct("<8sIII12Q")
+_SECTIONS = ("x", "y", "z", "lat", "lng", "rating", "split", "axis", "name_offsets", "names", "id_offsets", "ids")
+_TYPECODES = {"x": "f", "y": "f", "z": "f", "lat": "f", "lng": "f", "rating": "B", "split": "f", "axis": "B",
+              "name_offsets": "I", "id_offsets": "I"}
+
+EARTH_RADIUS_KM = 6371
+LEAF_SIZE = 16
+
+
+def _unit_vector(lat, lng):
+    phi = math.radians(lat)
+    lam = math.radians(lng)
+    return math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi)
+
+
+def _chord2(km):
+    # Cuerda al cuadrado entre dos puntos de la esfera unidad separados km por la superficie
+    return (2 * math.sin(min(km / EARTH_RADIUS_KM, math.pi) / 2)) ** 2
+
+
+def write_poi_file(path, records, leaf_size=LEAF_SIZE):
+    """
+    Escribe un fichero de POIs a partir de registros (id, nombre, lat, lng, rating o None).
+    """
+    records = list(records)
+    if not records:
+        raise ValueError("No hay POIs que escribir")
+    count = len(records)
+    coords = [array("d"), array("d"), array("d")]
+    for r in records:
+        for column, value in zip(coords, _unit_vector(r[2], r[3])):
+            column.append(value)
+
+    # Construir el árbol reordenando los índices de cada rango por su eje más disperso
+    depth = max(math.ceil(math.log2(count / leaf_size)), 0) if count > leaf_size else 0
+    num_nodes = 2 ** (depth + 1)
+    split = array("f", bytes(4 * num_nodes))
+    axis = array("B", bytes(num_nodes))
+    order = list(range(count))
+    stack = [(1, 0, count)]
+    while stack:
+        node, lo, hi = stack.pop()
+        if hi - lo <= leaf_size:
+            continue
+        part = order[lo:hi]
+        spreads = [max(column[i] for i in part) - min(column[i] for i in part) for column in coords]
+        node_axis = spreads.index(max(spreads))
+        part.sort(key=coords[node_axis].__getitem__)
+        order[lo:hi] = part
+        mid = (lo + hi) // 2
+        axis[node] = node_axis
+        split[node] = coords[node_axis][part[mid - lo]]
+        stack.append((2 * node, lo, mid))
+        stack.append((2 * node + 1, mid, hi))
+
+    columns = {name: array(code) for name, code in _TYPECODES.items()}
+    columns["split"] = split
+    columns["axis"] = axis
+    names = bytearray()
+    ids = bytearray()
+    columns["name_offsets"].append(0)
+    columns["id_offsets"].append(0)
+    for i in order:
+        poi_id, name, lat, lng, rating = records[i]
+        columns["x"].append(coords[0][i])
+        columns["y"].append(coords[1][i])
+        columns["z"].append(coords[2][i])
+        columns["lat"].append(lat)
+        columns["lng"].append(lng)
+        columns["rating"].append(0 if rating is None else max(1, min(50, round(rating * 10))))
+        names += name.encode("utf-8")
+        columns["name_offsets"].append(len(names))
+        ids += str(poi_id).encode("utf-8")
+        columns["id_offsets"].append(len(ids))
+
+    blobs = {name: column.tobytes() for name, column in columns.items()}
+    blobs["names"] = bytes(names)
+    blobs["ids"] = bytes(ids)
+
+    offsets = []
+    position = _HEADER.size
+    for name in _SECTIONS:
+        position += -position % 8  # Alinear cada sección a 8 bytes
+        offsets.append(position)
+        position += len(blobs[name])
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, count, num_nodes, leaf_size, *offsets))
+        for name, offset in zip(_SECTIONS, offsets):
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(blobs[name])
+
+
+class PoiIndex:
+    """
+    Índice espacial de solo lectura sobre un fichero de POIs mapeado en memoria.
+    Las columnas se leen directamente del mmap, así que varios workers que abren
+    el mismo fichero comparten las páginas de la caché del sistema operativo.
+    Las búsquedas recorren el KD-tree en 3D (vectores unitarios), donde la
+    distancia euclídea crece con la distancia sobre la superficie y la poda por
+    planos es exacta en cualquier latitud.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.num_nodes, self.leaf_size, *offsets = _HEADER.unpack_from(self.mm)
+        if magic != MAGIC:
+            raise ValueError(f"{path} no es un fichero de POIs")
+
+        view = memoryview(self.mm)
+        lengths = {"split": self.num_nodes, "axis": self.num_nodes,
+                   "name_offsets": self.count + 1, "id_offsets": self.count + 1}
+        for name, offset in zip(_SECTIONS, offsets):
+            if name in _TYPECODES:
+                size = struct.calcsize(_TYPECODES[name])
+                length = lengths.get(name, self.count)
+                setattr(self, name, view[offset:offset + length * size].cast(_TYPECODES[name]))
+        self.names = view[offsets[_SECTIONS.index("names")]:]
+        self.ids = view[offsets[_SECTIONS.index("ids")]:]
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        for name in (*_TYPECODES, "names", "ids"):
+            getattr(self, name).release()
+        self.mm.close()
+
+    def _search(self, lat, lng, bound, visit):
+        """
+        Recorre el árbol desde la raíz visitando primero el lado de cada plano donde cae
+        el punto. visit(i, cuerda²) se llama para cada punto a menos de la cota y
+        devuelve la nueva cota (cuerda² máxima que aún interesa).
+        """
+        qx, qy, qz = query = _unit_vector(lat, lng)
+        xs, ys, zs, split, axis = self.x, self.y, self.z, self.split, self.axis
+        leaf_size = self.leaf_size
+        # (nodo, lo, hi, distancia² mínima al rango, separación por eje hasta el rango)
+        stack = [(1, 0, self.count, 0.0, (0.0, 0.0, 0.0))]
+        while stack:
+            node, lo, hi, min_d2, gaps = stack.pop()
+            if min_d2 > bound:
+                continue
+            if hi - lo <= leaf_size:
+                for i in range(lo, hi):
+                    dx = xs[i] - qx
+                    dy = ys[i] - qy
+                    dz = zs[i] - qz
+                    d2 = dx * dx + dy * dy + dz * dz
+                    if d2 <= bound:
+                        bound = visit(i, d2)
+                continue
+            mid = (lo + hi) // 2
+            node_axis = axis[node]
+            diff = query[node_axis] - split[node]
+            near, far = (2 * node, lo, mid), (2 * node + 1, mid, hi)
+            if diff >= 0:
+                near, far = far, near
+            # Cota del lado lejano: se sustituye la separación previa en este eje por la del plano
+            gap = gaps[node_axis]
+            if diff * diff > gap * gap:
+                far_gaps = list(gaps)
+                far_gaps[node_axis] = diff
+                far_d2 = min_d2 - gap * gap + diff * diff
+                far_gaps = tuple(far_gaps)
+            else:
+                far_d2, far_gaps = min_d2, gaps
+            # El lado lejano se apila primero para visitar antes el cercano
+            stack.append((*far, far_d2, far_gaps))
+            stack.append((*near, min_d2, gaps))
+
+    def _distances(self, lat, lng, found):
+        # Distancia haversine real desde las coordenadas guardadas de cada punto
+        phi1 = math.radians(lat)
+        distances = []
+        for _, i in found:
+            phi2 = math.radians(self.lat[i])
+            a = (math.sin((phi2 - phi1) / 2) ** 2 +
+                 math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(self.lng[i] - lng) / 2) ** 2)
+            distances.append((i, 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))))
+        return distances
+
+    def nearest(self, lat, lng, k, max_km=50.0):
+        """
+        Los k POIs más cercanos a (lat, lng) dentro de max_km: [(índice, distancia_km)].
+        """
+        heap = []  # (-cuerda², índice), con los k mejores
+        max_d2 = _chord2(max_km)
+
+        def visit(i, d2):
+            if len(heap) < k:
+                heapq.heappush(heap, (-d2, i))
+            else:
+                heapq.heapreplace(heap, (-d2, i))
+            return -heap[0][0] if len(heap) == k else max_d2
+
+        if k > 0:
+            self._search(lat, lng, max_d2, visit)
+        return self._distances(lat, lng, sorted((-d2, i) for d2, i in heap))
+
+    def within(self, lat, lng, radius_km):
+        """
+        Todos los POIs a radius_km o menos de (lat, lng), del más cercano al más lejano.
+        """
+        found = []
+        max_d2 = _chord2(radius_km)
+
+        def visit(i, d2):
+            found.append((d2, i))
+            return max_d2
+
+        self._search(lat, lng, max_d2, visit)
+        found.sort()
+        return self._distances(lat, lng, found)
+
+    def _string(self, blob, offsets, i):
+        return bytes(blob[offsets[i]:offsets[i + 1]]).decode("utf-8")
+
+    def restaurant(self, i, distance) -> Restaurant:
+        rating = self.rating[i]
+        return Restaurant(
+            id=self._string(self.ids, self.id_offsets, i),
+            name=self._string(self.names, self.name_offsets, i),
+            rating="N/A" if rating == 0 else f"{rating / 10:.1f}",
+            distance=f"{distance:.2f}",
+            photo_url="https://via.placeholder.com/400"
+        )
+
+    def nearest_restaurants(self, lat, lng, k, max_km=50.0):
+        return [self.restaurant(i, d) for i, d in self.nearest(lat, lng, k, max_km)]
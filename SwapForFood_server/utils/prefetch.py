@@ -0,0 +1,69 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import aclosing
+from utils.metrics import PREFETCHES, PREFETCH_SAVED
+from utils.restaurant_cache import stream_restaurants_cached
+from utils.restaurant_fetcher import _parse_location, haversine_distance
+
+logger = logging.getLogger(__name__)
+
+# Distancia máxima entre la ubicación precargada y la de inicio de partida para reutilizarla
+PREFETCH_MAX_DISTANCE_KM = float(os.getenv("PREFETCH_MAX_DISTANCE_KM", "0.5"))
+
+
+class RestaurantPrefetch:
+    """
+    Búsqueda especulativa de restaurantes lanzada mientras la sala se llena.
+    Recorre la búsqueda exactamente como el inicio de la partida (stream_restaurants_cached,
+    que deja de paginar en cuanto el top-k ya no puede cambiar), así solo calienta en la
+    caché de Nearby Search las páginas que la partida va a leer. Al empezar, la partida
+    encuentra la celda en caché o se une a la petición en curso; si la precarga falló,
+    sigue el camino normal, con sus alternativas (resultados guardados o POIs offline).
+    """
+    __slots__ = ("lat", "lng", "task", "started_at", "finished_at")
+
+    def __init__(self, location: str, stream=None):
+        self.lat, self.lng = _parse_location(location)
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.task = asyncio.create_task(self._run(location, stream or stream_restaurants_cached))
+
+    async def _run(self, location, stream):
+        try:
+            async with aclosing(stream(location)) as batches:
+                async for _ in batches:
+                    pass
+        finally:
+            self.finished_at = time.monotonic()
+
+    def cancel(self):
+        if not self.task.done():
+            self.task.cancel()
+        elif not self.task.cancelled():
+            self.task.exception()  # Evitar el aviso "exception was never retrieved"
+
+    def take(self, location: str) -> bool:
+        """
+        Cierra la precarga al empezar la partida. True si sirve para location (terminada
+        o todavía en curso: la partida se une a su petición a Places); False si la
+        ubicación se ha movido más de PREFETCH_MAX_DISTANCE_KM o la búsqueda falló.
+        """
+        lat, lng = _parse_location(location)
+        if haversine_distance(self.lat, self.lng, lat, lng) > PREFETCH_MAX_DISTANCE_KM:
+            self.cancel()
+            PREFETCHES.inc(result="moved")
+            return False
+
+        if self.task.done() and not self.task.cancelled() and self.task.exception() is not None:
+            logger.warning("La precarga de restaurantes falló: %s", self.task.exception())
+            PREFETCHES.inc(result="failed")
+            return False
+
+        # Lo que ya llevaba hecho la búsqueda es el tiempo que se ahorra la partida. Si sigue
+        # en curso se cancela: la petición a Places es de la caché y la partida la sigue
+        PREFETCH_SAVED.observe((self.finished_at or time.monotonic()) - self.started_at)
+        PREFETCHES.inc(result="hit" if self.task.done() else "pending")
+        self.cancel()
+        return True
@@ -0,0 +1,100 @@
+import os
+import time
+from utils.metrics import THROTTLED
+
+
+def _parse_limit(value: str):
+    """
+    "rate/burst" -> (tokens por segundo, capacidad). "0" o vacío desactiva el límite.
+    """
+    if not value or value == "0":
+        return None
+    rate, _, burst = value.partition("/")
+    return float(rate), float(burst or rate)
+
+
+# Clase de límite de cada comando (nombre del protocolo v2). Los que no aparecen solo
+# están sujetos al límite de frames por conexión
+COMMAND_CLASSES = {
+    "create_room": "join",
+    "join_room": "join",
+    "resume": "join",
+    "chat": "chat",
+    "vote": "vote",
+    "start_game": "start",
+    "prefetch": "start",
+}
+
+# Los valores por defecto solo se aplican con RATE_LIMIT_ENABLED=1, para no cortar a los
+# clientes legados que no esperan el error; cada límite puede activarse también por separado
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "0") == "1"
+
+
+def _limits(prefix, defaults):
+    return {
+        cls: _parse_limit(os.getenv(f"{prefix}{cls.upper()}", default if RATE_LIMIT_ENABLED else "0"))
+        for cls, default in defaults
+    }
+
+
+# Límites por conexión: "frame" se comprueba antes de decodificar el mensaje
+SOCKET_LIMITS = _limits("RATE_LIMIT_", (("frame", "20/40"), ("chat", "1/5"), ("vote", "10/20"),
+                                        ("join", "0.5/3"), ("start", "0.2/2")))
+# Límites compartidos por todos los usuarios de una sala
+ROOM_LIMITS = _limits("RATE_LIMIT_ROOM_", (("chat", "5/20"), ("vote", "100/200"), ("join", "2/10"), ("start", "0.2/2")))
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def allow(self, now) -> bool:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class RateLimiter:
+    """
+    Límites token bucket por conexión y por sala para cada clase de comando.
+    Los buckets viven en el propio estado de la conexión o de la sala (un dict
+    {clase: TokenBucket}), así desaparecen con ellas sin limpieza aparte.
+    El reloj es inyectable para poder probar los límites sin esperas reales.
+    """
+
+    def __init__(self, socket_limits=None, room_limits=None, clock=time.monotonic):
+        self.socket_limits = SOCKET_LIMITS if socket_limits is None else socket_limits
+        self.room_limits = ROOM_LIMITS if room_limits is None else room_limits
+        self.clock = clock
+
+    def _take(self, buckets, limits, cls, scope) -> bool:
+        limit = limits.get(cls)
+        if limit is None:
+            return True
+        now = self.clock()
+        bucket = buckets.get(cls)
+        if bucket is None:
+            bucket = buckets[cls] = TokenBucket(limit[0], limit[1], now)
+        if bucket.allow(now):
+            return True
+        THROTTLED.inc(scope=scope, cls=cls)
+        return False
+
+    def allow_frame(self, socket_buckets: dict) -> bool:
+        return self._take(socket_buckets, self.socket_limits, "frame", "socket")
+
+    def allow_command(self, name: str, socket_buckets: dict, room_buckets: dict = None) -> bool:
+        cls = COMMAND_CLASSES.get(name)
+        if cls is None:
+            return True
+        if not self._take(socket_buckets, self.socket_limits, cls, "socket"):
+            return False
+        return room_buckets is None or self._take(room_buckets, self.room_limits, cls, "room")
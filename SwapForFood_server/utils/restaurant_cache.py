@@ -0,0 +1,415 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from contextlib import aclosing
+from utils.metrics import registry, PLACES_FALLBACKS
+from utils.restaurant_fetcher import (
+    API_KEY, PLACE_TYPE, MAX_RESULTS, NEARBY_MAX_PAGES, fetch_restaurants_async, nearby_pages_async,
+    get_poi_index, _build_restaurants, _offline_restaurants, _parse_location, _restaurant_from_result
+)
+from utils.candidates import stream_candidates
+from utils.circuit_breaker import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+# Configuración de la caché de Nearby Search
+CACHE_GEOHASH_PRECISION = int(os.getenv("RESTAURANT_CACHE_PRECISION", "6"))  # ~1.2km x 0.6km
+CACHE_TTL = float(os.getenv("RESTAURANT_CACHE_TTL", "600"))  # segundos
+CACHE_MAX_ENTRIES = int(os.getenv("RESTAURANT_CACHE_MAX_ENTRIES", "5000"))
+# Segundos tras caducar durante los que una entrada aún se sirve mientras se refresca
+# en segundo plano, o si Places falla (también para las celdas vecinas)
+CACHE_STALE_TTL = float(os.getenv("RESTAURANT_CACHE_STALE_TTL", "3600"))
+# Segundos que una búsqueda espera a que alguna consulta pida la página siguiente antes de
+# guardar lo que tiene como entrada incompleta (el token de página de Places caduca en minutos)
+CACHE_PAGE_WAIT = float(os.getenv("RESTAURANT_CACHE_PAGE_WAIT", "10"))
+
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(lat, lng, precision=CACHE_GEOHASH_PRECISION):
+    """
+    Codifica una coordenada en geohash. Todas las ubicaciones que caen en la misma
+    celda comparten el mismo código y, por tanto, la misma entrada de caché.
+    """
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(geohash) < precision:
+        if even:
+            mid = (lng_range[0] + lng_range[1]) / 2
+            if lng >= mid:
+                bits = (bits << 1) | 1
+                lng_range[0] = mid
+            else:
+                bits = bits << 1
+                lng_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if lat >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits = bits << 1
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+
+        if bit_count == 5:
+            geohash.append(_GEOHASH_BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(geohash)
+
+
+def geohash_neighbors(lat, lng, precision=CACHE_GEOHASH_PRECISION):
+    """
+    Las 8 celdas geohash que rodean a la de (lat, lng), de la más próxima a la más lejana al punto.
+    """
+    cell_width = 360.0 / 2 ** ((5 * precision + 1) // 2)
+    cell_height = 180.0 / 2 ** (5 * precision // 2)
+    # Centro de la celda de (lat, lng): la distancia a las vecinas se mide desde el punto
+    center_lat = (lat + 90.0) // cell_height * cell_height - 90.0 + cell_height / 2
+    center_lng = (lng + 180.0) // cell_width * cell_width - 180.0 + cell_width / 2
+    neighbors = []
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            if not dx and not dy:
+                continue
+            n_lat = center_lat + dy * cell_height
+            if not -90.0 <= n_lat <= 90.0:
+                continue
+            n_lng = (center_lng + dx * cell_width + 180.0) % 360.0 - 180.0
+            offset = ((n_lat - lat) / cell_height) ** 2 + ((center_lng + dx * cell_width - lng) / cell_width) ** 2
+            neighbors.append((offset, geohash_encode(n_lat, n_lng, precision)))
+    neighbors.sort()
+    return [cell for _, cell in neighbors]
+
+
+class _Flight:
+    """
+    Petición a Places para una celda, compartida por todas las consultas que la esperan.
+    La hace su propia tarea: ninguna consulta es su dueña, así que cancelar una (o que
+    deje de leer porque ya tiene bastantes candidatos) no afecta a las demás. Cada página
+    siguiente solo se pide si alguna consulta la necesita.
+    """
+    __slots__ = ("pages", "wanted", "done", "error", "update", "demand", "task")
+
+    def __init__(self, wanted=1):
+        loop = asyncio.get_running_loop()
+        self.pages = []  # Páginas recibidas hasta ahora
+        self.wanted = wanted  # Páginas que alguna consulta ha pedido
+        self.done = False
+        self.error = None
+        self.update = loop.create_future()  # Se resuelve con cada cambio
+        self.demand = loop.create_future()  # Se resuelve cuando se piden más páginas
+        self.task = None
+
+    def _notify(self):
+        self.update.set_result(None)
+        self.update = asyncio.get_running_loop().create_future()
+
+    def add(self, page):
+        self.pages.append(page)
+        self._notify()
+
+    def finish(self, error=None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def want(self, count):
+        if count > self.wanted:
+            self.wanted = count
+            if not self.demand.done():
+                self.demand.set_result(None)
+
+    async def wait_demand(self, timeout) -> bool:
+        """
+        True si alguna consulta pide otra página antes de timeout segundos.
+        """
+        if self.wanted <= len(self.pages):
+            if self.demand.done():
+                self.demand = asyncio.get_running_loop().create_future()
+            try:
+                await asyncio.wait_for(asyncio.shield(self.demand), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.wanted > len(self.pages)
+
+    async def follow(self, start=0):
+        # Las páginas a medida que llegan; al final, el error de Places si lo hubo
+        index = start
+        while True:
+            while index < len(self.pages):
+                yield self.pages[index]
+                index += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            # Quien sigue leyendo tras la última página recibida pide la siguiente
+            self.want(index + 1)
+            # shield: cancelar a quien espera no debe resolver el futuro compartido
+            await asyncio.shield(self.update)
+
+
+class RestaurantCache:
+    """
+    Caché TTL + LRU de resultados de Nearby Search, indexada por celdas geohash.
+    Se guardan los resultados en bruto de la API (todas las páginas) para que cada
+    consulta calcule las distancias desde su propia ubicación. Las consultas concurrentes que fallan para
+    la misma celda comparten una única petición a la API (coalescing).
+    Las entradas caducadas se siguen sirviendo durante stale_ttl mientras se refrescan
+    en segundo plano (stale-while-revalidate), y si Places falla se recurre a lo último
+    conocido de la celda o de sus vecinas.
+    Si ninguna consulta necesita más páginas (ya tienen sus mejores candidatos), la
+    búsqueda se detiene y la entrada queda incompleta: quien luego necesite más vuelve
+    a pedir la celda a Places.
+    """
+
+    def __init__(self, precision=CACHE_GEOHASH_PRECISION, ttl=CACHE_TTL,
+                 max_entries=CACHE_MAX_ENTRIES, fetcher=None, clock=time.monotonic, stale_ttl=CACHE_STALE_TTL,
+                 page_wait=CACHE_PAGE_WAIT):
+        self.precision = precision
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.page_wait = page_wait
+        self.fetcher = fetcher or _nearby_pages  # (lat, lng) -> generador asíncrono de páginas
+        self.clock = clock
+        # {celda: (expira_en, [resultado en bruto], páginas, completa)}
+        self.entries = OrderedDict()
+        self.in_flight = {}  # {celda: _Flight} peticiones a Places en curso
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.stale_served = 0
+
+    def _lookup(self, cell):
+        # (resultados, caducada, páginas, completa) o None si no hay entrada o ya no se puede servir
+        entry = self.entries.get(cell)
+        if entry is None:
+            return None
+        expires_at, results, pages, complete = entry
+        now = self.clock()
+        if expires_at + self.stale_ttl <= now:
+            del self.entries[cell]
+            return None
+        self.entries.move_to_end(cell)
+        return results, expires_at <= now, pages, complete
+
+    def get(self, cell):
+        found = self._lookup(cell)
+        if found is None or found[1]:
+            return None
+        return found[0]
+
+    def get_stale(self, lat, lng):
+        """
+        Lo último conocido para (lat, lng), aunque esté caducado: la celda del punto y
+        sus vecinas, sin repetir sitios. None si no hay nada.
+        """
+        results = []
+        seen_ids = set()
+        cell = geohash_encode(lat, lng, self.precision)
+        for candidate in (cell, *geohash_neighbors(lat, lng, self.precision)):
+            found = self._lookup(candidate)
+            if found is None:
+                continue
+            for r in found[0]:
+                if r.get("place_id") not in seen_ids:
+                    seen_ids.add(r.get("place_id"))
+                    results.append(r)
+        return results or None
+
+    def put(self, cell, results, pages=1, complete=True):
+        self.entries[cell] = (self.clock() + self.ttl, results, pages, complete)
+        self.entries.move_to_end(cell)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    async def pages(self, lat, lng):
+        """
+        Generador asíncrono con las páginas de resultados en bruto para la celda de
+        (lat, lng). Con la celda en caché se entrega todo en una sola página; si la
+        entrada está incompleta y se sigue leyendo, el resto se pide a Places.
+        """
+        cell = geohash_encode(lat, lng, self.precision)
+
+        flight = None
+        start = 0
+        found = self._lookup(cell)
+        if found is not None:
+            results, stale, cached_pages, complete = found
+            flight = self.in_flight.get(cell)
+            if stale:
+                # Servir lo último conocido y refrescar en segundo plano (si no se está haciendo ya)
+                self.stale_served += 1
+                PLACES_FALLBACKS.inc(source="stale")
+                if flight is None:
+                    flight = self._start_flight(cell, lat, lng, wanted=cached_pages, background=True)
+            else:
+                self.hits += 1
+            yield results
+            if complete:
+                return
+            # Entrada incompleta: quien sigue leyendo necesita las páginas que faltan
+            start = cached_pages
+
+        yielded = start > 0
+        try:
+            # Si ya hay una petición en curso para esta celda, seguir sus páginas
+            if flight is None:
+                flight = self.in_flight.get(cell)
+                if flight is not None:
+                    self.coalesced += 1
+                else:
+                    self.misses += 1
+                    flight = self._start_flight(cell, lat, lng, wanted=start + 1)
+            async with aclosing(flight.follow(start)) as pages:
+                async for page in pages:
+                    yielded = True
+                    yield page
+        except Exception as e:
+            # Places falla antes de dar nada: usar lo último conocido de las celdas vecinas
+            fallback = None if yielded else self.get_stale(lat, lng)
+            if fallback is None:
+                raise
+            # Con el circuito abierto esto pasa en cada búsqueda: ya se avisó al abrirse
+            logger.log(logging.DEBUG if isinstance(e, CircuitOpenError) else logging.WARNING,
+                       "Nearby Search falló para la celda %s, se usan resultados guardados: %r", cell, e)
+            self.stale_served += 1
+            PLACES_FALLBACKS.inc(source="neighbor")
+            yield fallback
+
+    def _start_flight(self, cell, lat, lng, wanted=1, background=False):
+        flight = self.in_flight[cell] = _Flight(wanted)
+        flight.task = asyncio.create_task(self._fill(cell, lat, lng, flight, background))
+        return flight
+
+    async def _fill(self, cell, lat, lng, flight, background):
+        # Pide páginas mientras alguna consulta las necesite y solo al terminar guarda la
+        # celda, marcada como incompleta si se dejó de paginar antes de la última página
+        complete = False
+        try:
+            async with aclosing(self.fetcher(lat, lng)) as pages:
+                while True:
+                    try:
+                        page = await anext(pages)
+                    except StopAsyncIteration:
+                        complete = True
+                        break
+                    flight.add(page)
+                    if not await flight.wait_demand(self.page_wait):
+                        break
+        except asyncio.CancelledError:
+            flight.finish(RuntimeError("Búsqueda en Places cancelada"))
+            raise
+        except Exception as e:
+            flight.finish(e)
+            # Un refresco en segundo plano no tiene a nadie que informe del fallo
+            if background and not isinstance(e, CircuitOpenError):
+                logger.warning("No se pudo refrescar la celda %s: %r", cell, e)
+        else:
+            self.put(cell, [r for page in flight.pages for r in page], len(flight.pages), complete)
+            flight.finish()
+        finally:
+            self.in_flight.pop(cell, None)
+
+    async def fetch(self, lat, lng):
+        """
+        Devuelve todos los resultados en bruto de Nearby Search para la celda de (lat, lng).
+        """
+        results = []
+        async with aclosing(self.pages(lat, lng)) as pages:
+            async for page in pages:
+                results.extend(page)
+        return results
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "stale_served": self.stale_served,
+            "entries": len(self.entries),
+            "in_flight": len(self.in_flight),
+        }
+
+
+def _nearby_pages(lat, lng):
+    return nearby_pages_async(API_KEY, lat, lng, PLACE_TYPE)
+
+
+restaurant_cache = RestaurantCache()
+
+for _stat in ("hits", "misses", "coalesced", "evictions"):
+    registry.gauge(
+        f"swapforfood_restaurant_cache_{_stat}",
+        f"Caché de Nearby Search: {_stat}",
+        func=lambda stat=_stat: getattr(restaurant_cache, stat)
+    )
+registry.gauge("swapforfood_restaurant_cache_entries", "Entradas en la caché de Nearby Search",
+               func=lambda: len(restaurant_cache.entries))
+
+
+async def fetch_restaurants_cached(location, offline=False):
+    """
+    Punto de entrada con caché para obtener restaurantes. Los datos offline no se cachean.
+    :param location: String "lat,lng"
+    :param offline: Bool que indica si usar datos offline o la API real.
+    :return: Lista de objetos Restaurant
+    """
+    if offline:
+        return await fetch_restaurants_async(location, offline=True)
+
+    lat, lng = _parse_location(location)
+    try:
+        resultados = await restaurant_cache.fetch(lat, lng)
+    except Exception as e:
+        if get_poi_index() is None:
+            raise
+        return _offline_fallback(location, e)
+    return _build_restaurants(resultados, lat, lng)
+
+
+def _offline_fallback(location, error):
+    # Sin Places ni resultados guardados: el índice de POIs offline, si está configurado
+    logger.warning("Nearby Search no disponible, se usan los POIs offline: %r", error)
+    PLACES_FALLBACKS.inc(source="offline")
+    return _offline_restaurants(location)
+
+
+async def stream_restaurants_cached(location, offline=False, top_k=MAX_RESULTS):
+    """
+    Igual que fetch_restaurants_cached pero entrega los restaurantes por lotes a medida
+    que llegan las páginas de Nearby Search, ya ordenados por puntuación.
+    :param location: String "lat,lng"
+    :param offline: Bool que indica si usar datos offline o la API real.
+    :return: Generador asíncrono de listas de objetos Restaurant
+    """
+    if offline:
+        yield await fetch_restaurants_async(location, offline=True)
+        return
+
+    lat, lng = _parse_location(location)
+    yielded = False
+    try:
+        async with aclosing(restaurant_cache.pages(lat, lng)) as pages:
+            async for batch in stream_candidates(pages, lat, lng, top_k, NEARBY_MAX_PAGES):
+                yielded = True
+                yield [_restaurant_from_result(r, distancia) for r, distancia in batch]
+    except Exception as e:
+        if yielded or get_poi_index() is None:
+            raise
+        yield _offline_fallback(location, e)
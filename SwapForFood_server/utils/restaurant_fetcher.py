@@ -1,12 +1,65 @@
 import os
+import asyncio
 import requests
+import httpx
 import math
+import time
 from models.restaurant import Restaurant
+from utils.candidates import rank_candidates
+from utils.poi_index import PoiIndex
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError, STATE_VALUES
+from utils.metrics import registry, PLACES_LOOKUPS, PLACES_LOOKUP_DURATION
 
 # Cargar la API Key desde variable de entorno
 API_KEY = "<AQUI LA KEY DE GOOGLE>"
 PLACE_TYPE = "restaurant"
-MAX_RESULTS = 2
+MAX_RESULTS = int(os.getenv("MAX_RESULTS", "10"))  # Restaurantes por partida
+
+# Modo offline para todo el servidor (pruebas de carga sin consumir cuota de Places)
+OFFLINE_MODE = os.getenv("SWAPFORFOOD_OFFLINE", "0") == "1"
+
+# Fichero de POIs para el modo offline (ver utils/poi_index.py y benchmarks/gen_poi_dataset.py).
+# Sin fichero, el modo offline devuelve los restaurantes de prueba fijos
+OFFLINE_POI_FILE = os.getenv("OFFLINE_POI_FILE", "")
+OFFLINE_MAX_DISTANCE_KM = float(os.getenv("OFFLINE_MAX_DISTANCE_KM", "50"))
+
+# URL base de la API de Places (configurable para poder apuntar a un servidor de pruebas)
+PLACES_BASE_URL = os.getenv("PLACES_BASE_URL", "https://maps.googleapis.com/maps/api/place")
+NEARBY_SEARCH_URL = f"{PLACES_BASE_URL}/nearbysearch/json"
+
+# Paginación de Nearby Search: como mucho 3 páginas de 20 resultados. El next_page_token
+# tarda unos segundos en ser válido; mientras tanto Places responde INVALID_REQUEST
+NEARBY_MAX_PAGES = int(os.getenv("PLACES_MAX_PAGES", "3"))
+NEXT_PAGE_DELAY = float(os.getenv("PLACES_NEXT_PAGE_DELAY", "2.0"))  # segundos
+NEXT_PAGE_RETRIES = 3
+
+# URL pública del servidor para servir las fotos a través de /photos (sin exponer la API key).
+# Si no se configura, los clientes reciben la URL directa de Places como hasta ahora
+PHOTO_PROXY_BASE_URL = os.getenv("PHOTO_PROXY_BASE_URL", "").rstrip("/")
+
+# Configuración del cliente HTTP asíncrono
+HTTP_TIMEOUT = float(os.getenv("PLACES_HTTP_TIMEOUT", "5.0"))  # segundos
+HTTP_MAX_CONNECTIONS = int(os.getenv("PLACES_HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("PLACES_HTTP_MAX_KEEPALIVE", "10"))
+MAX_CONCURRENT_LOOKUPS = int(os.getenv("PLACES_MAX_CONCURRENT_LOOKUPS", "8"))
+
+# Protección frente a una API de Places lenta o caída: presupuesto de latencia por consulta
+# y circuit breaker que deja de llamarla tras varios fallos seguidos
+PLACES_CALL_BUDGET = float(os.getenv("PLACES_CALL_BUDGET", "3.0"))  # segundos
+PLACES_BREAKER_FAILURES = int(os.getenv("PLACES_BREAKER_FAILURES", "5"))
+PLACES_BREAKER_RESET = float(os.getenv("PLACES_BREAKER_RESET", "30"))  # segundos abierto antes de probar
+# Estados de Nearby Search que indican un problema de la API (no de la consulta)
+UPSTREAM_ERROR_STATUSES = ("OVER_QUERY_LIMIT", "REQUEST_DENIED", "UNKNOWN_ERROR")
+
+places_breaker = CircuitBreaker("places", PLACES_BREAKER_FAILURES, PLACES_BREAKER_RESET)
+registry.gauge("swapforfood_places_breaker_state", "Circuit breaker de Places (0 cerrado, 1 semiabierto, 2 abierto)",
+               func=lambda: STATE_VALUES[places_breaker.state])
+registry.gauge("swapforfood_places_breaker_opens", "Veces que se ha abierto el circuit breaker de Places",
+               func=lambda: places_breaker.opens)
+
+_async_client = None
+_lookup_semaphore = None
+_poi_index = None
 
 def haversine_distance(lat1, lon1, lat2, lon2):
     R = 6371  # Radio de la Tierra en km
@@ -24,117 +77,276 @@ def haversine_distance(lat1, lon1, lat2, lon2):
     return distance
 
 def get_place_photo_url(photo_reference, max_width=400):
-    base_url = "https://maps.googleapis.com/maps/api/place/photo"
+    base_url = f"{PLACES_BASE_URL}/photo"
     photo_url = (f"{base_url}?maxwidth={max_width}"
                  f"&photoreference={photo_reference}"
                  f"&key={API_KEY}")
     return photo_url
 
-def nearby_search(api_key, latitude, longitude, place_type, rankby="distance"):
-    url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
-    params = {
+def get_client_photo_url(photo_reference, max_width=400):
+    """
+    URL de la foto que se envía a los clientes: el proxy con caché si está configurado.
+    """
+    if PHOTO_PROXY_BASE_URL:
+        return f"{PHOTO_PROXY_BASE_URL}/photos/{photo_reference}?w={max_width}"
+    return get_place_photo_url(photo_reference, max_width)
+
+def _nearby_params(api_key, latitude, longitude, place_type, rankby):
+    return {
         "location": f"{latitude},{longitude}",
         "type": place_type,
         "rankby": rankby,
         "key": api_key
     }
 
-    response = requests.get(url, params=params)
-    if response.status_code != 200:
-        raise Exception(f"Error en la solicitud Nearby Search: {response.status_code}")
+def _parse_nearby_response(status_code, data):
+    return _parse_nearby_page(status_code, data)[0]
 
-    data = response.json()
+def _parse_nearby_page(status_code, data):
+    """
+    Devuelve (resultados, next_page_token) de una página de Nearby Search.
+    """
+    if status_code != 200:
+        raise Exception(f"Error en la solicitud Nearby Search: {status_code}")
 
     if data.get("status") not in ["OK", "ZERO_RESULTS"]:
         raise Exception(f"Error en la respuesta Nearby Search: {data.get('status')}")
 
-    return data.get("results", [])
+    return data.get("results", []), data.get("next_page_token")
+
+_TIMEOUT_ERRORS = (TimeoutError, asyncio.TimeoutError, httpx.TimeoutException, requests.Timeout)
+
+class _observe_lookup:
+    # Mide la latencia de cada consulta a Places y cuenta los resultados por estado
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc, tb):
+        PLACES_LOOKUP_DURATION.observe(time.perf_counter() - self.start)
+        if exc_type is None:
+            PLACES_LOOKUPS.inc(status="ok")
+        else:
+            PLACES_LOOKUPS.inc(status="timeout" if issubclass(exc_type, _TIMEOUT_ERRORS) else "error")
+
+def _check_breaker():
+    if not places_breaker.allow():
+        PLACES_LOOKUPS.inc(status="rejected")
+        raise CircuitOpenError("Places no disponible: circuito abierto")
+
+def _record_response(status_code, data):
+    if status_code != 200 or data.get("status") in UPSTREAM_ERROR_STATUSES:
+        places_breaker.record_failure()
+    else:
+        places_breaker.record_success()
+
+def nearby_search(api_key, latitude, longitude, place_type, rankby="distance"):
+    params = _nearby_params(api_key, latitude, longitude, place_type, rankby)
+
+    _check_breaker()
+    try:
+        with _observe_lookup():
+            response = requests.get(NEARBY_SEARCH_URL, params=params, timeout=min(HTTP_TIMEOUT, PLACES_CALL_BUDGET))
+            data = response.json() if response.status_code == 200 else {}
+    except Exception:
+        places_breaker.record_failure()
+        raise
+    _record_response(response.status_code, data)
+    return _parse_nearby_response(response.status_code, data)
+
+def get_async_client():
+    """
+    Devuelve el cliente HTTP asíncrono compartido (pool de conexiones con keep-alive).
+    Se crea de forma perezosa para que quede ligado al event loop en ejecución.
+    """
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE
+            )
+        )
+    return _async_client
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+def _get_lookup_semaphore():
+    global _lookup_semaphore
+    if _lookup_semaphore is None:
+        _lookup_semaphore = asyncio.Semaphore(MAX_CONCURRENT_LOOKUPS)
+    return _lookup_semaphore
+
+async def _places_get(params):
+    """
+    Una consulta a Nearby Search a través del circuit breaker y con PLACES_CALL_BUDGET
+    segundos como máximo. Devuelve (status_code, data).
+    """
+    _check_breaker()
+    # Limitar el número de consultas simultáneas contra la API de Places. La espera
+    # por el semáforo no cuenta en el presupuesto: es congestión local, no de Places
+    async with _get_lookup_semaphore():
+        try:
+            with _observe_lookup():
+                response = await asyncio.wait_for(
+                    get_async_client().get(NEARBY_SEARCH_URL, params=params), PLACES_CALL_BUDGET
+                )
+                data = response.json() if response.status_code == 200 else {}
+        except Exception:
+            places_breaker.record_failure()
+            raise
+    _record_response(response.status_code, data)
+    return response.status_code, data
+
+async def nearby_search_async(api_key, latitude, longitude, place_type, rankby="distance"):
+    params = _nearby_params(api_key, latitude, longitude, place_type, rankby)
+    status_code, data = await _places_get(params)
+    return _parse_nearby_response(status_code, data)
+
+async def nearby_pages_async(api_key, latitude, longitude, place_type, rankby="distance",
+                             max_pages=NEARBY_MAX_PAGES):
+    """
+    Generador asíncrono con las páginas de resultados de Nearby Search. Cada página
+    se pide solo cuando se consume la anterior.
+    """
+    params = _nearby_params(api_key, latitude, longitude, place_type, rankby)
+
+    for page in range(max_pages):
+        for attempt in range(NEXT_PAGE_RETRIES):
+            status_code, data = await _places_get(params)
+            # El token de la página siguiente todavía no está activo: esperar y reintentar
+            if page and data.get("status") == "INVALID_REQUEST" and attempt + 1 < NEXT_PAGE_RETRIES:
+                await asyncio.sleep(NEXT_PAGE_DELAY)
+                continue
+            break
+
+        results, next_page_token = _parse_nearby_page(status_code, data)
+        yield results
+        if not next_page_token:
+            return
+        params = {"pagetoken": next_page_token, "key": api_key}
+        await asyncio.sleep(NEXT_PAGE_DELAY)
+
+def _parse_location(location):
+    if not isinstance(location, str):
+        raise ValueError(f"Ubicación no válida: {location!r}")
+    lat_str, lng_str = location.split(",")
+    return float(lat_str.strip()), float(lng_str.strip())
+
+def get_poi_index():
+    """
+    Índice de POIs offline compartido, abierto la primera vez que se usa. None si no hay fichero.
+    """
+    global _poi_index
+    if _poi_index is None and OFFLINE_POI_FILE:
+        _poi_index = PoiIndex(OFFLINE_POI_FILE)
+    return _poi_index
+
+def _offline_restaurants(location=None):
+    # Con un fichero de POIs, los restaurantes más cercanos a la ubicación
+    poi_index = get_poi_index()
+    if poi_index is not None and location is not None:
+        lat, lng = _parse_location(location)
+        return poi_index.nearest_restaurants(lat, lng, MAX_RESULTS, OFFLINE_MAX_DISTANCE_KM)
+
+    # Datos de prueba offline
+    return [
+        Restaurant(
+            id="1",
+            name="Restaurante Prueba 1113",
+            rating="4.0",
+            distance="0.50",
+            photo_url="https://via.placeholder.com/400"
+        ),
+        Restaurant(
+            id="27",
+            name="Restaurante Prueba 2",
+            rating="3.2",
+            distance="1.20",
+            photo_url="https://via.placeholder.com/400"
+        ),
+        Restaurant(
+            id="3",
+            name="Restaurante Prueba 3",
+            rating="4.8",
+            distance="2.10",
+            photo_url="https://via.placeholder.com/400"
+        ),
+        Restaurant(
+            id="4",
+            name="Restaurante Prueba 4444",
+            rating="2.5",
+            distance="0.75",
+            photo_url="https://via.placeholder.com/400"
+        ),
+    ]
+
+def _restaurant_from_result(r, distancia):
+    nombre = r.get("name", "Sin nombre disponible")
+    place_id = r.get("place_id", "")
+    rating = r.get("rating")
+    if rating is None:
+        rating_str = "N/A"
+    else:
+        rating_str = f"{rating}"
+
+    photos = r.get("photos")
+    if photos and photos[0].get("photo_reference"):
+        photo_url = get_client_photo_url(photos[0].get("photo_reference"))
+    else:
+        photo_url = ""
+
+    # Los resultados sin ubicación tienen distancia NaN
+    distance_str = "" if math.isnan(distancia) else f"{distancia:.2f}"
+
+    return Restaurant(
+        id=place_id,
+        name=nombre,
+        rating=rating_str,
+        distance=distance_str,
+        photo_url=photo_url
+    )
+
+def _build_restaurants(resultados, lat, lng, limit=None):
+    if not resultados:
+        return []
+
+    # Tomar los MAX_RESULTS mejores según la puntuación configurada (ver utils/candidates.py)
+    ranked = rank_candidates(resultados, lat, lng, MAX_RESULTS if limit is None else limit)
+    return [_restaurant_from_result(r, distancia) for r, distancia in ranked]
 
 def fetch_restaurants(location, offline=False):
     """
     Obtiene restaurantes cercanos a una ubicación. Si offline=True, devuelve datos de prueba.
     Si offline=False, utiliza la API de Google Places.
+    Versión síncrona (bloqueante), pensada para scripts. El servidor usa fetch_restaurants_async.
     :param location: String "lat,lng"
     :param offline: Bool que indica si usar datos offline o la API real.
     :return: Lista de objetos Restaurant
     """
     if offline:
-        # Datos de prueba offline
-        return [
-            Restaurant(
-                id="1",
-                name="Restaurante Prueba 1113",
-                rating="4.0",
-                distance="0.50",
-                photo_url="https://via.placeholder.com/400"
-            ),
-            Restaurant(
-                id="27",
-                name="Restaurante Prueba 2",
-                rating="3.2",
-                distance="1.20",
-                photo_url="https://via.placeholder.com/400"
-            ),
-            Restaurant(
-                id="3",
-                name="Restaurante Prueba 3",
-                rating="4.8",
-                distance="2.10",
-                photo_url="https://via.placeholder.com/400"
-            ),
-            Restaurant(
-                id="4",
-                name="Restaurante Prueba 4444",
-                rating="2.5",
-                distance="0.75",
-                photo_url="https://via.placeholder.com/400"
-            ),
-        ]
-    else:
-        # Modo online utilizando la API de Google Places
-        lat_str, lng_str = location.split(",")
-        lat = float(lat_str.strip())
-        lng = float(lng_str.strip())
-
-        resultados = nearby_search(API_KEY, lat, lng, PLACE_TYPE)
-        if not resultados:
-            return []
-
-        # Tomar los primeros MAX_RESULTS
-        restaurantes = resultados[:MAX_RESULTS]
-
-        lista_restaurantes = []
-        for r in restaurantes:
-            nombre = r.get("name", "Sin nombre disponible")
-            place_id = r.get("place_id", "")
-            rating = r.get("rating")
-            if rating is None:
-                rating_str = "N/A"
-            else:
-                rating_str = f"{rating}"
-
-            photos = r.get("photos")
-            if photos and photos[0].get("photo_reference"):
-                photo_url = get_place_photo_url(photos[0].get("photo_reference"))
-            else:
-                photo_url = ""
-
-            loc = r.get("geometry", {}).get("location", {})
-            lat_rest = loc.get("lat")
-            lng_rest = loc.get("lng")
-            distance_str = ""
-            if lat_rest is not None and lng_rest is not None:
-                distancia = haversine_distance(lat, lng, lat_rest, lng_rest)
-                distance_str = f"{distancia:.2f}"
-
-            lista_restaurantes.append(
-                Restaurant(
-                    id=place_id,
-                    name=nombre,
-                    rating=rating_str,
-                    distance=distance_str,
-                    photo_url=photo_url
-                )
-            )
+        return _offline_restaurants(location)
+
+    # Modo online utilizando la API de Google Places
+    lat, lng = _parse_location(location)
+    resultados = nearby_search(API_KEY, lat, lng, PLACE_TYPE)
+    return _build_restaurants(resultados, lat, lng)
+
+async def fetch_restaurants_async(location, offline=False):
+    """
+    Igual que fetch_restaurants pero sin bloquear el event loop: usa el cliente HTTP
+    asíncrono compartido y limita el número de consultas simultáneas.
+    :param location: String "lat,lng"
+    :param offline: Bool que indica si usar datos offline o la API real.
+    :return: Lista de objetos Restaurant
+    """
+    if offline:
+        return _offline_restaurants(location)
 
-        return lista_restaurantes
\ No newline at end of file
+    lat, lng = _parse_location(location)
+    resultados = await nearby_search_async(API_KEY, lat, lng, PLACE_TYPE)
+    return _build_restaurants(resultados, lat, lng)
@@ -0,0 +1,105 @@
+import os
+import random
+import time
+from array import array
+from collections import deque
+
+ROOM_CODE_SPACE = 100000  # Códigos de 5 dígitos
+ROOM_CODE_COOLDOWN = float(os.getenv("ROOM_CODE_COOLDOWN", "30"))  # segundos antes de reutilizar un código
+
+# Estados de un código en RoomCodeAllocator.position (los valores >= 0 son posiciones en la lista libre)
+_IN_USE = -1
+_COOLING = -2
+
+
+class RoomCodesExhausted(Exception):
+    pass
+
+
+class RoomCodeAllocator:
+    """
+    Reparte códigos de sala desde una lista libre barajada. Asignar, liberar y reservar
+    un código concreto cuestan O(1) aunque el espacio de códigos esté casi lleno.
+    Los códigos liberados pueden pasar un tiempo de espera antes de volver a la lista.
+    """
+
+    def __init__(self, size=ROOM_CODE_SPACE, cooldown=ROOM_CODE_COOLDOWN, clock=time.monotonic, rng=None):
+        self.size = size
+        self.width = len(str(size - 1))
+        self.cooldown = cooldown
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self.free = array("i", range(size))
+        self.rng.shuffle(self.free)
+        # Posición de cada código en la lista libre, o _IN_USE / _COOLING
+        self.position = array("i", [0]) * size
+        for index, code in enumerate(self.free):
+            self.position[code] = index
+        self.cooling = deque()  # [(disponible_en, código)], en orden de liberación
+        # Fin de la espera vigente de cada código. Un código reservado durante la espera y
+        # liberado otra vez queda dos veces en la cola: solo cuenta la entrada que coincide
+        self.cooling_until = array("d", [0.0]) * size
+
+    def _recycle(self):
+        now = self.clock()
+        while self.cooling and self.cooling[0][0] <= now:
+            until, code = self.cooling.popleft()
+            if self.position[code] == _COOLING and self.cooling_until[code] == until:
+                self._push_free(code)
+
+    def _push_free(self, code):
+        # Insertar en una posición aleatoria para que la lista siga barajada
+        self.free.append(code)
+        last = len(self.free) - 1
+        index = self.rng.randint(0, last)
+        other = self.free[index]
+        self.free[index], self.free[last] = code, other
+        self.position[code] = index
+        self.position[other] = last
+
+    def _remove_free(self, code):
+        index = self.position[code]
+        last = self.free.pop()
+        if last != code:
+            self.free[index] = last
+            self.position[last] = index
+        self.position[code] = _IN_USE
+
+    def allocate(self) -> str:
+        self._recycle()
+        if not self.free:
+            raise RoomCodesExhausted("No quedan códigos de sala disponibles")
+        code = self.free.pop()
+        self.position[code] = _IN_USE
+        return f"{code:0{self.width}}"
+
+    def reserve(self, code: str) -> bool:
+        """
+        Marca como usado un código concreto (por ejemplo, al restaurar salas).
+        """
+        number = int(code)
+        if self.position[number] == _IN_USE:
+            return False
+        if self.position[number] == _COOLING:
+            # Sacarlo de la espera: se descarta al recorrer la cola
+            self.position[number] = _IN_USE
+            return True
+        self._remove_free(number)
+        return True
+
+    def release(self, code: str, cooldown: float = None):
+        number = int(code)
+        if not 0 <= number < self.size or self.position[number] != _IN_USE:
+            return  # Código fuera de rango, ya libre o ya en espera
+        wait = self.cooldown if cooldown is None else cooldown
+        if wait > 0:
+            until = self.clock() + wait
+            self.position[number] = _COOLING
+            self.cooling_until[number] = until
+            self.cooling.append((until, number))
+        else:
+            self._push_free(number)
+
+    def available(self) -> int:
+        self._recycle()
+        return len(self.free)
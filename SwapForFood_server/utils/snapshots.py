@@ -0,0 +1,253 @@
+import os
+import gc
+import glob
+import json
+import struct
+import time
+import asyncio
+import logging
+from contextlib import contextmanager
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# Fichero de snapshots del estado de las salas. Vacío: el estado solo vive en memoria
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "")
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "60"))  # segundos entre snapshots
+# Los deltas se acumulan en memoria y se escriben por lotes desde un hilo: cada
+# JOURNAL_FLUSH_INTERVAL segundos o en cuanto hay JOURNAL_FLUSH_BYTES pendientes
+JOURNAL_FLUSH_INTERVAL = float(os.getenv("JOURNAL_FLUSH_INTERVAL", "0.05"))
+JOURNAL_FLUSH_BYTES = int(os.getenv("JOURNAL_FLUSH_BYTES", str(256 * 1024)))
+
+# Cabecera de snapshots y logs: magic + formato de los registros (M = MessagePack, J = JSON)
+MAGIC = b"SFFSNAP1"
+_FORMAT = b"M" if msgpack else b"J"
+_LENGTH = struct.Struct("<I")
+
+
+def _encode(obj) -> bytes:
+    if msgpack is not None:
+        return msgpack.packb(obj, use_bin_type=True)
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+def _decoder(header: bytes, path: str):
+    if header[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} no es un fichero de estado de salas")
+    fmt = header[len(MAGIC):]
+    if fmt == b"M":
+        if msgpack is None:
+            raise ValueError(f"{path} está en MessagePack y msgpack no está instalado")
+        return lambda data: msgpack.unpackb(data, raw=False, strict_map_key=False)
+    return json.loads
+
+
+@contextmanager
+def paused_gc():
+    """
+    Desactiva el recolector cíclico mientras se crean o copian muchos objetos de golpe:
+    con cientos de miles de salas, sus pasadas sobre todo el heap dominan el tiempo.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class StateJournal:
+    """
+    Persistencia local del estado de las salas: un snapshot completo cada cierto tiempo
+    y, entre snapshots, un log de solo añadir con cada cambio (delta). Cada delta lleva un
+    número de secuencia; el snapshot guarda el último que incluye, así al restaurar se
+    aplican solo los deltas posteriores aunque el proceso cayera a mitad de un snapshot.
+    Tras cortar el log para un snapshot los cambios siguientes van a un log nuevo, y los
+    anteriores se borran cuando el snapshot ya está escrito.
+
+    record() no toca el disco: los deltas se guardan en memoria y una tarea en segundo
+    plano los escribe por lotes desde un hilo, como el registro de analítica. Si el
+    proceso cae, se pierden como mucho los cambios de los últimos JOURNAL_FLUSH_INTERVAL.
+    """
+
+    def __init__(self, path, flush_interval=JOURNAL_FLUSH_INTERVAL, flush_bytes=JOURNAL_FLUSH_BYTES):
+        self.path = path
+        self.seq = 0  # Último número de secuencia asignado
+        self.records = 0  # Deltas registrados desde el último snapshot
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        # [(secuencia inicial del log, registros o None para cerrarlo)] pendientes, en orden
+        self.pending = []
+        self.pending_bytes = 0
+        self.segment = None  # Secuencia inicial del log al que van los deltas nuevos
+        # Log abierto y su secuencia inicial: solo los usa el hilo de escritura
+        self.log = None
+        self.log_start = None
+        self.flush_lock = asyncio.Lock()
+        self.task = None
+        self.stopping = False
+        self.wakeup = None
+
+    def _log_paths(self):
+        # [(secuencia inicial, ruta)] de los logs existentes, en orden
+        logs = []
+        for path in glob.glob(glob.escape(self.path) + ".*.log"):
+            start = path[len(self.path) + 1:-len(".log")]
+            if start.isdigit():
+                logs.append((int(start), path))
+        logs.sort()
+        return logs
+
+    def record(self, *delta):
+        """
+        Añade un cambio al log: (tipo, código de sala, argumentos...). No bloquea.
+        """
+        self.seq += 1
+        if self.segment is None:
+            self.segment = self.seq
+        if not self.pending or self.pending[-1][0] != self.segment or self.pending[-1][1] is None:
+            self.pending.append((self.segment, bytearray()))
+        payload = _encode([self.seq, time.time(), *delta])
+        self.pending[-1][1].extend(_LENGTH.pack(len(payload)) + payload)
+        self.pending_bytes += _LENGTH.size + len(payload)
+        self.records += 1
+        if self.pending_bytes >= self.flush_bytes and self.wakeup is not None:
+            self.wakeup.set()
+
+    def cut(self) -> int:
+        """
+        Cierra el log actual antes de un snapshot. Devuelve la secuencia que cubrirá el snapshot.
+        Los deltas pendientes se siguen escribiendo en el log cerrado (ver flush()).
+        """
+        if self.segment is not None:
+            self.pending.append((self.segment, None))
+            self.segment = None
+        self.records = 0
+        return self.seq
+
+    async def start(self):
+        if self.task is not None:
+            return
+        self.stopping = False
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            if not self.stopping:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self.wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Error escribiendo el log de cambios de salas")
+            if self.stopping:
+                return
+
+    async def flush(self, in_thread=True):
+        """
+        Escribe los deltas pendientes. Tras cut(), garantiza que el log cortado está
+        completo y cerrado antes de escribir el snapshot que lo sustituye.
+        """
+        async with self.flush_lock:
+            while self.pending:
+                batch, self.pending = self.pending, []
+                self.pending_bytes = 0
+                if in_thread:
+                    await asyncio.to_thread(self._write, batch)
+                else:
+                    self._write(batch)
+
+    def _write(self, batch):
+        # Hilo de escritura: un write por lote de registros, sin fsync
+        for start, data in batch:
+            if data is None:
+                if self.log_start == start:
+                    self._close_log()
+                continue
+            if self.log_start != start:
+                self._close_log()
+                self.log = open(f"{self.path}.{start:012d}.log", "ab", buffering=0)
+                self.log_start = start
+                if self.log.tell() == 0:
+                    self.log.write(MAGIC + _FORMAT)
+            self.log.write(data)
+
+    def _close_log(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+            self.log_start = None
+
+    def write_snapshot(self, seq, rooms):
+        """
+        Escribe el snapshot de forma atómica y borra los logs que ya incluye.
+        Puede ejecutarse en un hilo: rooms no se modifica después de construirse.
+        """
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC + _FORMAT)
+            f.write(_encode([seq, time.time(), rooms]))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        for start, path in self._log_paths():
+            if start <= seq:
+                os.remove(path)
+
+    def load(self):
+        """
+        Lee el último snapshot y los deltas posteriores. Devuelve (salas del snapshot,
+        hora del snapshot o None, [(hora, delta)]).
+        """
+        rooms, seq, saved_at = [], 0, None
+        header_size = len(MAGIC) + 1
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                data = f.read()
+            seq, saved_at, rooms = _decoder(data[:header_size], self.path)(data[header_size:])
+
+        deltas = []
+        last_seq = seq
+        for _, path in self._log_paths():
+            with open(path, "rb") as f:
+                data = f.read()
+            if len(data) < header_size:
+                continue
+            decode = _decoder(data[:header_size], path)
+            position = header_size
+            while position + _LENGTH.size <= len(data):
+                (length,) = _LENGTH.unpack_from(data, position)
+                position += _LENGTH.size
+                if position + length > len(data):
+                    logger.warning("Último registro incompleto en %s: se descarta", path)
+                    break
+                record = decode(data[position:position + length])
+                position += length
+                if record[0] > seq:
+                    deltas.append(record)
+                    last_seq = max(last_seq, record[0])
+
+        self.seq = last_seq
+        return rooms, saved_at, [(record[1], record[2:]) for record in deltas]
+
+    async def close(self):
+        """
+        Escribe lo pendiente y cierra el log.
+        """
+        if self.task is not None:
+            # No se cancela: un lote a medio escribir en el hilo seguiría adelante
+            self.stopping = True
+            self.wakeup.set()
+            await self.task
+            self.task = None
+        await self.flush()
+        self._close_log()
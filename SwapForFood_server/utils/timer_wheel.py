@@ -0,0 +1,153 @@
+import asyncio
+import inspect
+import logging
+import math
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Resolución y tamaño de la rueda de temporizadores
+TIMER_TICK = float(os.getenv("TIMER_TICK", "0.1"))  # segundos
+TIMER_SLOTS = int(os.getenv("TIMER_SLOTS", "1024"))
+
+
+class TimerHandle:
+    __slots__ = ("tick", "callback", "args", "interval", "slot", "cancelled")
+
+    def __init__(self, tick, callback, args, interval):
+        self.tick = tick
+        self.callback = callback
+        self.args = args
+        self.interval = interval  # None para temporizadores de un solo disparo
+        self.slot = None
+        self.cancelled = False
+
+    def cancel(self):
+        if self.cancelled:
+            return
+        self.cancelled = True
+        if self.slot is not None:
+            self.slot.discard(self)
+            self.slot = None
+
+
+class TimerWheel:
+    """
+    Rueda de temporizadores (hashed timing wheel) compartida por todo el servidor.
+    Sustituye a una tarea asyncio dormida por cada partida: programar y cancelar
+    cuestan O(1) y los temporizadores que vencen en el mismo tick se disparan juntos.
+    Los callbacks que son corrutinas se lanzan como tareas propias, así uno lento no
+    retrasa a los demás ni al siguiente tick.
+    El reloj es inyectable para poder probar los tiempos sin esperas reales.
+    """
+
+    def __init__(self, tick=TIMER_TICK, slots=TIMER_SLOTS, clock=time.monotonic):
+        self.tick = tick
+        self.clock = clock
+        self.slots = [set() for _ in range(slots)]
+        self.current_tick = self._tick_for(clock())
+        self.task = None
+        self.callback_tasks = set()  # Referencias a los callbacks en curso (asyncio solo guarda referencias débiles)
+
+    def _tick_for(self, when):
+        return math.floor(when / self.tick)
+
+    def _insert(self, handle):
+        slot = self.slots[handle.tick % len(self.slots)]
+        slot.add(handle)
+        handle.slot = slot
+
+    def schedule(self, delay, callback, *args) -> TimerHandle:
+        """
+        Programa callback(*args) dentro de delay segundos. callback puede ser una corrutina.
+        """
+        tick = max(math.ceil((self.clock() + delay) / self.tick), self.current_tick + 1)
+        handle = TimerHandle(tick, callback, args, None)
+        self._insert(handle)
+        return handle
+
+    def schedule_periodic(self, interval, callback, *args) -> TimerHandle:
+        handle = self.schedule(interval, callback, *args)
+        handle.interval = interval
+        return handle
+
+    async def advance(self, now=None):
+        """
+        Dispara todos los temporizadores vencidos hasta now. Devuelve cuántos se dispararon.
+        """
+        target = self._tick_for(self.clock() if now is None else now)
+        if target <= self.current_tick:
+            return 0
+
+        due = []
+        if target - self.current_tick >= len(self.slots):
+            # Salto mayor que una vuelta completa: revisar todas las ranuras una vez
+            for slot in self.slots:
+                due.extend(h for h in slot if h.tick <= target)
+        else:
+            for tick in range(self.current_tick + 1, target + 1):
+                slot = self.slots[tick % len(self.slots)]
+                if slot:
+                    due.extend(h for h in slot if h.tick <= tick)
+        self.current_tick = target
+
+        due.sort(key=lambda h: h.tick)
+        fired = 0
+        for handle in due:
+            if handle.cancelled:
+                continue
+            handle.slot.discard(handle)
+            handle.slot = None
+            if handle.interval is not None:
+                handle.tick = max(math.ceil(handle.tick + handle.interval / self.tick), target + 1)
+                self._insert(handle)
+            else:
+                handle.cancelled = True
+            fired += 1
+            try:
+                result = handle.callback(*handle.args)
+            except Exception:
+                # Un temporizador que falla no debe detener a los demás
+                logger.exception("Error en el temporizador %r", handle.callback)
+                continue
+            if inspect.isawaitable(result):
+                task = asyncio.ensure_future(result)
+                self.callback_tasks.add(task)
+                task.add_done_callback(self._callback_done)
+        return fired
+
+    def _callback_done(self, task):
+        self.callback_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Error en un temporizador", exc_info=task.exception())
+
+    async def drain(self):
+        """
+        Espera a que terminen los callbacks lanzados hasta ahora.
+        """
+        while self.callback_tasks:
+            await asyncio.gather(*self.callback_tasks, return_exceptions=True)
+
+    def pending(self):
+        return sum(len(slot) for slot in self.slots)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            await self.advance()
+
+    def start(self):
+        if self.task is None:
+            self.current_tick = self._tick_for(self.clock())
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        # Los callbacks ya disparados (fin de partidas, desconexiones) terminan su trabajo
+        await self.drain()
+
+
+timer_wheel = TimerWheel()